@@ -18,7 +18,8 @@ const historySchema = new mongoose.Schema({
     passengerId: String,
     norm_row: Number,
     norm_col: Number,
-    feedback_score: Number
+    feedback_score: Number,
+    createdAt: { type: Date, default: Date.now }
 });
 const History = mongoose.model('History', historySchema);
 
@@ -72,9 +73,11 @@ app.get('/bookings', async (req, res) => {
 // AI calls this to learn about a passenger
 app.get('/histories/:passengerId', async (req, res) => {
     try {
-        const history = await History.find({ passengerId: req.params.passengerId });
-        // Return only the fields the AI needs
+        const history = await History.find({ passengerId: req.params.passengerId }).sort({ createdAt: 1 });
+        // Return only the fields the AI needs (id + createdAt let it skip records it has seen)
         const cleanHistory = history.map(h => ({
+            id: String(h._id),
+            createdAt: h.createdAt ? h.createdAt.toISOString() : undefined,
             norm_row: h.norm_row,
             norm_col: h.norm_col,
             feedback_score: h.feedback_score
@@ -0,0 +1,223 @@
+# ==============================================================================
+# FILE: allocation_outbox.py
+# PURPOSE: Durable outbox for allocation snapshots + background forwarder
+# ==============================================================================
+
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+from .ml_feedback_integration import post_allocation
+from .metrics import OUTBOX_POST_SECONDS
+
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+OUTBOX_DB = os.getenv("OUTBOX_DB", os.path.join(MODELS_DIR, "outbox.sqlite"))
+
+# Rows claimed per drain pass, idle poll interval (s), retry backoff bounds (s),
+# attempts before a snapshot is parked as dead (0 = retry forever).
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_BASE_BACKOFF = float(os.getenv("OUTBOX_BASE_BACKOFF", "1.0"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "20"))
+
+def retry_delay(attempts, base=OUTBOX_BASE_BACKOFF, cap=OUTBOX_MAX_BACKOFF):
+    """
+    Exponential backoff with full jitter after the given number of failed attempts.
+    """
+    return random.uniform(0, min(cap, base * (2 ** max(0, attempts - 1))))
+
+def _is_permanent(error):
+    """
+    4xx other than 408/429 means the backend rejected the payload itself;
+    retrying the same body will not help.
+    """
+    import requests
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        code = error.response.status_code
+        return 400 <= code < 500 and code not in (408, 429)
+    return False
+
+# -------------------- Outbox --------------------
+
+class AllocationOutbox:
+    """
+    SQLite queue of allocation snapshots. enqueue() is a single insert, so
+    /allocate can answer as soon as the snapshot is on disk; a daemon thread
+    drains due rows to POST /allocations with per-row exponential backoff.
+    Delivery is at-least-once (a timed-out POST that the backend did store
+    is sent again). A trip has at most one pending snapshot, its latest: an
+    older undelivered one is dropped when a newer one is queued, so a retried
+    row never overwrites a later allocation on the backend.
+    """
+    def __init__(self, path=OUTBOX_DB, sender=post_allocation, batch_size=OUTBOX_BATCH_SIZE,
+                 poll_interval=OUTBOX_POLL_INTERVAL, max_attempts=OUTBOX_MAX_ATTEMPTS):
+        self.path = path
+        self.sender = sender
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.sent = 0
+        self.failures = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS allocation_outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, trip_id TEXT, payload TEXT NOT NULL,"
+            " enqueued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL, last_error TEXT, dead INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS allocation_outbox_due ON allocation_outbox (dead, next_attempt_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS allocation_outbox_trip ON allocation_outbox (trip_id)")
+        # queues written before coalescing may hold several pending rows per trip
+        self._conn.execute(
+            "DELETE FROM allocation_outbox WHERE dead = 0 AND trip_id IS NOT NULL AND id < ("
+            " SELECT MAX(id) FROM allocation_outbox AS newer"
+            " WHERE newer.trip_id = allocation_outbox.trip_id AND newer.dead = 0)")
+        self._conn.commit()
+
+    def enqueue(self, trip_id, vehicle, assignments_payload, version=None):
+        """
+        Persist one snapshot (same payload as post_allocation, plus
+        "version": the trip's allocation store version, increasing per trip,
+        so the backend can ignore a write older than what it has), replacing
+        the trip's undelivered one, and wake the forwarder. Returns the outbox
+        row id.
+        """
+        payload = {"tripId": trip_id, "vehicle": vehicle, "assignments": assignments_payload, "version": version}
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO allocation_outbox (trip_id, payload, enqueued_at, next_attempt_at) VALUES (?, ?, ?, ?)",
+                (trip_id, json.dumps(payload), now, now))
+            if trip_id is not None:
+                superseded = self._conn.execute(
+                    "DELETE FROM allocation_outbox WHERE trip_id = ? AND dead = 0 AND id < ?", (trip_id, cur.lastrowid))
+                self.coalesced += superseded.rowcount
+            self._conn.commit()
+        self._wake.set()
+        return cur.lastrowid
+
+    def _claim_due(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, payload, attempts FROM allocation_outbox "
+                "WHERE dead = 0 AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), self.batch_size)).fetchall()
+
+    def drain_once(self):
+        """
+        Send one batch of due snapshots. Returns the number delivered.
+        """
+        delivered, retry, dead = [], [], []
+        for row_id, payload, attempts in self._claim_due():
+            if self._stop.is_set():
+                break
+            started = time.perf_counter()
+            try:
+                self.sender(json.loads(payload))
+                OUTBOX_POST_SECONDS.observe(time.perf_counter() - started, result="ok")
+                delivered.append((row_id,))
+            except Exception as e:
+                OUTBOX_POST_SECONDS.observe(time.perf_counter() - started, result="error")
+                attempts += 1
+                self.failures += 1
+                error = str(e)[:500]
+                if _is_permanent(e) or (self.max_attempts and attempts >= self.max_attempts):
+                    print(f"[WARN] Allocation {row_id} parked after {attempts} attempts: {error}")
+                    dead.append((attempts, error, row_id))
+                else:
+                    retry.append((attempts, time.time() + retry_delay(attempts), error, row_id))
+        with self._lock:
+            if delivered:
+                self._conn.executemany("DELETE FROM allocation_outbox WHERE id = ?", delivered)
+            if retry:
+                self._conn.executemany(
+                    "UPDATE allocation_outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?", retry)
+            if dead:
+                self._conn.executemany(
+                    "UPDATE allocation_outbox SET attempts = ?, last_error = ?, dead = 1 WHERE id = ?", dead)
+            self._conn.commit()
+        self.sent += len(delivered)
+        return len(delivered)
+
+    def _next_due_in(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM allocation_outbox WHERE dead = 0").fetchone()
+        if row[0] is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(0.0, row[0] - time.time()))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.drain_once() == self.batch_size:
+                    continue  # backlog: go again right away
+            except Exception as e:
+                print(f"[WARN] Allocation outbox drain failed: {e}")
+            self._wake.wait(self._next_due_in())
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="allocation-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """
+        Stop the forwarder; undelivered rows stay on disk for the next start.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        """
+        { depth, lag_seconds, dead, sent, failures, coalesced }: lag is the
+        age of the oldest undelivered snapshot, coalesced counts snapshots
+        replaced by a newer one for the same trip before delivery.
+        """
+        with self._lock:
+            depth, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(enqueued_at) FROM allocation_outbox WHERE dead = 0").fetchone()
+            dead = self._conn.execute("SELECT COUNT(*) FROM allocation_outbox WHERE dead = 1").fetchone()[0]
+        return {
+            "depth": depth,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+            "dead": dead,
+            "sent": self.sent,
+            "failures": self.failures,
+            "coalesced": self.coalesced,
+        }
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._conn.close()
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+def get_allocation_outbox():
+    """
+    Process-wide outbox, opened lazily on first use.
+    """
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = AllocationOutbox()
+        return _outbox
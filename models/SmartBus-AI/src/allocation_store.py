@@ -0,0 +1,87 @@
+# ==============================================================================
+# FILE: allocation_store.py
+# PURPOSE: Local store of the latest allocation per trip (input to /reallocate)
+# ==============================================================================
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+ALLOCATION_STORE_DB = os.getenv("ALLOCATION_STORE_DB", os.path.join(MODELS_DIR, "allocations.sqlite"))
+# Trips not re-allocated for this many days are pruned on save (0 = keep forever)
+ALLOCATION_STORE_TTL_DAYS = float(os.getenv("ALLOCATION_STORE_TTL_DAYS", "30"))
+
+class StaleAllocation(Exception):
+    pass
+
+class AllocationStore:
+    """
+    SQLite table trip_id -> { vehicle, passengers, assignments } plus a version
+    counter, so two concurrent re-allocations of one trip cannot both win.
+    """
+    def __init__(self, path=ALLOCATION_STORE_DB, ttl_days=ALLOCATION_STORE_TTL_DAYS):
+        self.path = path
+        self.ttl_days = ttl_days
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trip_allocations ("
+            " trip_id TEXT PRIMARY KEY, version INTEGER NOT NULL, record TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS trip_allocations_updated ON trip_allocations (updated_at)")
+        self._conn.commit()
+
+    def load(self, trip_id):
+        """
+        (record, version) of the trip's latest allocation, or (None, None).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record, version FROM trip_allocations WHERE trip_id = ?", (trip_id,)).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def save(self, trip_id, record, expected_version=None):
+        """
+        Store record as the trip's latest allocation and return its version.
+        With expected_version, raise StaleAllocation if the trip changed since.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM trip_allocations WHERE trip_id = ?", (trip_id,)).fetchone()
+            current = row[0] if row else 0
+            if expected_version is not None and current != expected_version:
+                raise StaleAllocation(f"trip {trip_id} is at version {current}, expected {expected_version}")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO trip_allocations (trip_id, version, record, updated_at) VALUES (?, ?, ?, ?)",
+                (trip_id, current + 1, json.dumps(record), now))
+            if self.ttl_days:
+                self._conn.execute("DELETE FROM trip_allocations WHERE updated_at < ?", (now - self.ttl_days * 86400,))
+            self._conn.commit()
+        return current + 1
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_allocation_store():
+    """
+    Process-wide store, opened lazily on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AllocationStore()
+        return _store
@@ -0,0 +1,132 @@
+# ==============================================================================
+# FILE: allocator.py
+# PURPOSE: Engine selection — exact MILP, heuristic, or heuristic-warm-started MILP
+# ==============================================================================
+
+import time
+from .scoring import score_problem
+from .integrated_seat_ml_model import optimize_seating_with_ml, build_assignment_details
+from .heuristic_allocator import heuristic_seating
+from .decomposition import optimize_seating_decomposed
+from .reallocation import warm_start_seating
+
+ALLOCATION_MODES = ("exact", "heuristic", "auto", "decomposed")
+MIN_MILP_SECONDS = 1.0
+
+def decomposed_summary(decomposed_info):
+    """
+    The info fields allocate_seating reports for a decomposed seating.
+    """
+    return {"engine": "decomposed", "status": "Feasible", "objective": decomposed_info["objective"],
+            "blocks": decomposed_info["blocks"], "gap": decomposed_info["gap"]}
+
+def allocate_seating(passengers, bus, seat_type_model=None, penalty_model=None, personal_models=None, disability_encoder=None,
+                     mode="exact", time_limit=None, cohesion="pairwise", scores=None, lookup_tables=None,
+                     warm_start=None):
+    """
+    Returns (assignment_details, info). assignment_details has the same shape as
+    optimize_seating_with_ml ({} when nothing feasible was found); info reports
+    { "engine", "status", "objective", "wall_time_ms", "timings", "variables", "constraints" }
+    where timings holds seconds per stage (scoring, model_build, cbc_solve, heuristic;
+    cbc_solve keeps its name for whichever MILP backend ran) and variables/constraints
+    describe the last MILP built (None if none was).
+    scores: precomputed ProblemScores (e.g. from a batch-wide score_problems call).
+    lookup_tables: SeatPreferenceTables used for scoring where tabulated.
+      - exact: MILP within time_limit; heuristic if the solver has no incumbent.
+      - heuristic: greedy + local search; MILP if the greedy pass gets stuck.
+      - auto: heuristic result fed to the MILP as a warm start, remaining budget for the MILP.
+      - decomposed: zone/row-band blocks solved in turn (see decomposition.py;
+        the API runs them as parallel pool jobs, SolverPool.solve_decomposed);
+        monolithic MILP if no block split works. info adds "blocks" and "gap"
+        (None when the LP bound was off or not solved in time).
+    warm_start: { passenger_id: seat_id } from a similar earlier problem (may be
+      partial or partly infeasible); completed by warm_start_seating, it is the
+      MILP start (exact/auto) or replaces the greedy construction (heuristic).
+      Ignored by decomposed.
+    """
+    if mode not in ALLOCATION_MODES:
+        raise ValueError(f"Unknown allocation mode: {mode}")
+    started = time.monotonic()
+    deadline = started + time_limit if time_limit else None
+    timings = {"scoring": 0.0, "model_build": 0.0, "cbc_solve": 0.0, "heuristic": 0.0, "decomposition": 0.0}
+    model_size = {"variables": None, "constraints": None}
+    if scores is None:
+        scores = score_problem(passengers, bus, seat_type_model, penalty_model, personal_models, disability_encoder,
+                               lookup_tables)
+        timings["scoring"] = time.monotonic() - started
+
+    def remaining():
+        return max(0.0, deadline - time.monotonic()) if deadline is not None else None
+
+    def run_milp(warm_start=None):
+        milp_info = {}
+        # the MILP gets at least MIN_MILP_SECONDS so it can report an incumbent at all
+        milp_limit = max(MIN_MILP_SECONDS, remaining()) if deadline is not None else None
+        details = optimize_seating_with_ml(passengers, bus, cohesion=cohesion, scores=scores, time_limit=milp_limit,
+                                           warm_start=warm_start, solve_info=milp_info)
+        timings["model_build"] += milp_info.get("build_seconds", 0.0)
+        timings["cbc_solve"] += milp_info.get("solve_seconds", 0.0)
+        model_size["variables"] = milp_info.get("variables")
+        model_size["constraints"] = milp_info.get("constraints")
+        return details, milp_info
+
+    def run_heuristic():
+        heuristic_started = time.monotonic()
+        result = heuristic_seating(passengers, bus, scores, cohesion=cohesion, deadline=deadline)
+        timings["heuristic"] += time.monotonic() - heuristic_started
+        return result
+
+    def run_decomposed():
+        decomposed_info = {}
+        decomposed_started = time.monotonic()
+        chosen = optimize_seating_decomposed(passengers, bus, scores, cohesion=cohesion, time_limit=remaining(),
+                                             solve_info=decomposed_info)
+        timings["decomposition"] += time.monotonic() - decomposed_started
+        timings["model_build"] += decomposed_info.get("build_seconds", 0.0)
+        timings["cbc_solve"] += decomposed_info.get("solve_seconds", 0.0)
+        if chosen is not None:
+            model_size["variables"] = decomposed_info["variables"]
+            model_size["constraints"] = decomposed_info["constraints"]
+        return chosen, decomposed_info
+
+    seeded = (None, None)
+    if warm_start and mode != "decomposed":
+        seeded_started = time.monotonic()
+        seeded = warm_start_seating(passengers, bus, scores, warm_start, cohesion=cohesion, deadline=deadline)
+        timings["heuristic"] += time.monotonic() - seeded_started
+
+    details, info = {}, {"engine": None, "status": "Infeasible", "objective": None}
+    if mode == "decomposed":
+        chosen, decomposed_info = run_decomposed()
+        if chosen is not None:
+            details = build_assignment_details(passengers, bus, chosen)
+            info = decomposed_summary(decomposed_info)
+        else:
+            details, milp_info = run_milp()
+            if details:
+                info = {"engine": "milp", "status": milp_info["status"], "objective": milp_info["objective"]}
+    elif mode == "exact":
+        details, milp_info = run_milp(warm_start=seeded[0])
+        if details:
+            info = {"engine": "milp", "status": milp_info["status"], "objective": milp_info["objective"]}
+        else:
+            chosen, objective = run_heuristic()
+            if chosen is not None:
+                details = build_assignment_details(passengers, bus, chosen)
+                info = {"engine": "heuristic", "status": "Feasible", "objective": objective}
+    else:
+        chosen, objective = seeded if seeded[0] is not None else run_heuristic()
+        if chosen is not None:
+            details = build_assignment_details(passengers, bus, chosen)
+            info = {"engine": "heuristic", "status": "Feasible", "objective": objective}
+        budget_left = remaining()
+        if chosen is None or (mode == "auto" and (budget_left is None or budget_left > 0)):
+            milp_details, milp_info = run_milp(warm_start=chosen)
+            if milp_details and (objective is None or milp_info["objective"] >= objective):
+                details = milp_details
+                info = {"engine": "milp", "status": milp_info["status"], "objective": milp_info["objective"]}
+
+    info["wall_time_ms"] = round((time.monotonic() - started) * 1000.0, 1)
+    info["timings"] = timings
+    info.update(model_size)
+    return details, info
@@ -4,30 +4,108 @@
 #          and forwards allocation snapshot to your backend. No feedback handling here.
 # ==============================================================================
 
-import os, joblib, uuid
-from typing import Dict, Any, List, Optional
-from fastapi import FastAPI, HTTPException
+import os, json, time, uuid, asyncio, contextlib
+from typing import Dict, Any, List, Optional, Literal
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from .integrated_seat_ml_model import Passenger, BusLayout, optimize_seating_with_ml
-from .explain_utils import explain_assignment
-from .ml_feedback_integration import (
-    fetch_passenger_history,
-    send_allocation_to_backend,
-    train_personalization_model,
-)
+from .integrated_seat_ml_model import Passenger, get_bus_layout, _cached_layout, build_assignment_details
+from .solver_pool import (SolverPool, PoolSaturated, ALLOCATOR_RETRY_AFTER, install_models, reallocate_job, score_job,
+                          solver_config)
+from .model_registry import ModelRegistry
+from .warmup import Warmup
+from .result_cache import get_result_cache, problem_fingerprint
+from .explain_utils import REASON_TEXTS, reason_codes, render_explanation
+from .ml_feedback_integration import fetch_passenger_histories, get_session, history_cache
+from .personalization_store import get_personalization_store
+from .allocation_outbox import get_allocation_outbox
+from .allocation_store import get_allocation_store, StaleAllocation
+from . import metrics
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json for responses
+    orjson = None
 
 MODELS_DIR = os.getenv("MODELS_DIR", "models")
+# Default CBC budget (seconds) when the request sets no timeLimit; 0 = unlimited
+SOLVER_TIME_LIMIT = float(os.getenv("SOLVER_TIME_LIMIT", "0")) or None
+# /allocate/batch: max trips per request, trips per shared ML scoring call
+BATCH_MAX_TRIPS = int(os.getenv("BATCH_MAX_TRIPS", "1000"))
+BATCH_SCORE_CHUNK = int(os.getenv("BATCH_SCORE_CHUNK", "32"))
+
+# Model building + CBC run in worker processes (each loads the models it is
+# asked for); with ALLOCATOR_WORKERS=0 they run on a thread here and share the
+# registry's models.
+solver_pool = SolverPool(models_dir=MODELS_DIR)
+
+# Global models (if available): the published version, hot-swapped when a new one
+# appears. With worker processes only they load the models: this process reads
+# the version and manifest, and a new version is swapped in once every worker
+# has pre-loaded it.
+if solver_pool.workers == 0:
+    model_registry = ModelRegistry(
+        MODELS_DIR, on_swap=lambda model_set: install_models(model_set.models, model_set.version))
+else:
+    model_registry = ModelRegistry(
+        MODELS_DIR, load_models=False, preload=lambda model_set: solver_pool.preload(model_set.ref))
+
+# Nothing slow happens at import: models, solver libraries, worker processes and
+# the backend HTTP session are set up by the warm-up (see STARTUP_MODE), or by
+# the first request that needs them
+warmup = Warmup([
+    ("models", model_registry.current),
+    ("solver", solver_pool.warm_up),
+    ("http", get_session),
+])
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # background work runs while the app serves: outbox forwarder, model watcher, warm-up
+    get_allocation_outbox().start()
+    model_registry.start()
+    warmup.start()
+    try:
+        yield
+    finally:
+        model_registry.stop()
+        solver_pool.shutdown()
+        get_allocation_outbox().stop()
+
+app = FastAPI(title="SmartBus-AI", version="1.3.0", lifespan=lifespan)
+
+# ---- Scrape-time metrics ----
 
-# Load global models if available
-seat_type_model = penalty_model = disability_encoder = None
-if os.path.exists(os.path.join(MODELS_DIR, "seat_type_model.pkl")):
-    seat_type_model = joblib.load(os.path.join(MODELS_DIR, "seat_type_model.pkl"))
-if os.path.exists(os.path.join(MODELS_DIR, "penalty_model.pkl")):
-    penalty_model = joblib.load(os.path.join(MODELS_DIR, "penalty_model.pkl"))
-if os.path.exists(os.path.join(MODELS_DIR, "disability_encoder.pkl")):
-    disability_encoder = joblib.load(os.path.join(MODELS_DIR, "disability_encoder.pkl"))
+def _cache_counts():
+    layout = _cached_layout.cache_info()
+    results = get_result_cache()
+    return [({"cache": "history", "result": "hit"}, history_cache.hits),
+            ({"cache": "history", "result": "miss"}, history_cache.misses),
+            ({"cache": "layout", "result": "hit"}, layout.hits),
+            ({"cache": "layout", "result": "miss"}, layout.misses),
+            ({"cache": "result", "result": "hit"}, results.hits),
+            ({"cache": "result", "result": "miss"}, results.misses)]
 
-app = FastAPI(title="SmartBus-AI", version="1.3.0")
+def _outbox_stat(key):
+    return lambda: get_allocation_outbox().stats()[key]
+
+for _metric in (
+    metrics.CallbackMetric("smartbus_cache_requests_total", "Cache lookups by cache and result (layout: API process only).",
+                           _cache_counts, kind="counter"),
+    metrics.CallbackMetric("smartbus_allocations_in_flight", "Admitted /allocate requests.",
+                           lambda: solver_pool.in_flight),
+    metrics.CallbackMetric("smartbus_allocation_capacity", "Admission limit for /allocate.",
+                           lambda: solver_pool.capacity),
+    metrics.CallbackMetric("smartbus_outbox_depth", "Undelivered allocation snapshots.", _outbox_stat("depth")),
+    metrics.CallbackMetric("smartbus_outbox_lag_seconds", "Age of the oldest undelivered snapshot.",
+                           _outbox_stat("lag_seconds")),
+    metrics.CallbackMetric("smartbus_outbox_dead", "Snapshots parked after permanent failure.", _outbox_stat("dead")),
+    metrics.CallbackMetric("smartbus_model_reloads_total", "Model versions swapped in without a restart.",
+                           lambda: model_registry.reloads, kind="counter"),
+    metrics.CallbackMetric("smartbus_model_load_seconds", "Load time of the active model version.",
+                           lambda: model_registry.peek().load_seconds if model_registry.peek() else 0.0),
+):
+    metrics.REGISTRY.register(_metric)
 
 class PassengerReq(BaseModel):
     id: str
@@ -49,87 +127,505 @@ class SeatRequest(BaseModel):
     vehicle: VehicleReq
     passengers: List[PassengerReq]
     tripId: Optional[str] = Field(default=None, description="Optional trip identifier")
+    mode: Literal["exact", "heuristic", "auto", "decomposed"] = Field(
+        default="exact", description="exact = MILP, heuristic = greedy + local search, auto = heuristic warm start for MILP, "
+                                     "decomposed = zone/row-band blocks solved in parallel")
+    timeLimit: Optional[float] = Field(default=None, gt=0, description="Solver time budget in seconds")
+    explain: Literal["text", "codes"] = Field(
+        default="text", description="text = explanation per assignment, codes = reason codes only (see /reason-codes)")
+
+class BatchRequest(BaseModel):
+    trips: List[SeatRequest]
+
+class ReallocateRequest(BaseModel):
+    tripId: str = Field(description="Trip allocated earlier by /allocate or /reallocate")
+    add: List[PassengerReq] = []
+    remove: List[str] = Field(default=[], description="Passenger ids to drop from the trip")
+    keep: Literal["fixed", "preferred"] = Field(
+        default="fixed", description="fixed = seated passengers keep their seats (blocking passengers, then anyone, "
+                                     "may move if the new ones do not fit), preferred = anyone may move, at a large "
+                                     "cost per move")
+    timeLimit: Optional[float] = Field(default=None, gt=0, description="Solver time budget in seconds")
+    explain: Literal["text", "codes"] = Field(
+        default="text", description="text = explanation per assignment, codes = reason codes only (see /reason-codes)")
+
+# Every vehicle gets 3 accessible rows and the aisle after the second column
+def _layout_kwargs(vehicle):
+    return {"rows": vehicle.rows, "cols": vehicle.columns, "accessibility_rows": 3, "aisle_after": 2}
+
+def _to_passenger(p):
+    return Passenger(id=p.id, age=p.age, gender=p.gender, disability=p.disability,
+                     group_id=p.groupId, source_stop=p.pickupStopId, dest_stop=p.dropStopId)
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "models": {
-        "seat_type": seat_type_model is not None,
-        "penalty": penalty_model is not None,
-        "encoder": disability_encoder is not None
-    }}
+    """
+    Liveness: answers as soon as the process serves HTTP, warm or not.
+    """
+    return {"status": "ok", "ready": warmup.ready, "models": model_registry.stats(), "allocator": solver_pool.stats(),
+            "outbox": get_allocation_outbox().stats(), "resultCache": get_result_cache().stats()}
+
+@app.get("/ready")
+def ready(response: Response):
+    """
+    Readiness: 503 until the warm-up has finished (or if a step failed).
+    """
+    if not warmup.ready:
+        response.status_code = 503
+    return {"status": "ready" if warmup.ready else "warming", "warmup": warmup.stats()}
+
+@app.get("/reason-codes")
+def reason_code_texts():
+    """
+    Text for each reason code returned with explain="codes"; {seat_type} and
+    {disability} are the assignment's seatType and the passenger's disability.
+    """
+    return REASON_TEXTS
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+async def _admitted(endpoint, response, handler):
+    """
+    Admission control, stage timing, sampled profiling and request metrics
+    around handler(timer, profile).
+    """
+    started = time.perf_counter()
+    code = 200
+    try:
+        try:
+            solver_pool.acquire()
+        except PoolSaturated as e:
+            raise HTTPException(status_code=429, detail=f"Allocator saturated: {e}",
+                                headers={"Retry-After": str(ALLOCATOR_RETRY_AFTER)})
+        try:
+            timer = metrics.RequestTimer()
+            profile = metrics.should_profile()
+            with metrics.profiled_request(endpoint.strip("/"), profile):
+                result = await handler(timer, profile)
+            timer.record()
+            if metrics.METRICS_TIMING_HEADERS:
+                response.headers["Server-Timing"] = timer.server_timing()
+            return result
+        finally:
+            solver_pool.release()
+    except HTTPException as e:
+        code = e.status_code
+        raise
+    except Exception:
+        code = 500
+        raise
+    finally:
+        metrics.REQUESTS.inc(endpoint=endpoint, code=code)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+def _dumps(content):
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, separators=(",", ":")).encode()
+
+def _json_response(content, response):
+    """
+    Serialize a response dict directly (orjson when installed), skipping
+    FastAPI's jsonable_encoder pass; keeps headers set on response.
+    """
+    if orjson is None:
+        return JSONResponse(content, headers=dict(response.headers))
+    return Response(_dumps(content), media_type="application/json", headers=dict(response.headers))
 
 @app.post("/allocate")
-def allocate_seats(req: SeatRequest):
+async def allocate_seats(req: SeatRequest, response: Response):
+    result = await _admitted("/allocate", response, lambda timer, profile: _allocate(req, timer, profile))
+    return _json_response(result, response)
+
+@app.post("/reallocate")
+async def reallocate_seats(req: ReallocateRequest, response: Response):
+    result = await _admitted("/reallocate", response, lambda timer, profile: _reallocate(req, timer, profile))
+    return _json_response(result, response)
+
+def _record_solver_stages(timer, solve_info):
+    for stage, seconds in solve_info["timings"].items():
+        if seconds:
+            timer.add(stage, seconds)
+    metrics.record_solve(solve_info)
+
+def _build_results(trip_id, passengers, bus, assignments, personal_models, explain="text"):
+    """
+    (response assignments, snapshot assignments). The snapshot (store and
+    backend) always carries tripId and explanation text; with explain="codes"
+    the response rows carry "reasons" codes instead and no tripId.
+    """
+    seated = [p for p in passengers if assignments.get(p.id)]
+    features = [assignments[p.id]["universal_features"] for p in seated]
+    seat_ids = [assignments[p.id]["seat_id"] for p in seated]
+    predicted_types = [assignments[p.id].get("predicted_seat_type") for p in seated]
+    codes = reason_codes(seated, seat_ids, bus, predicted_types, personalized=personal_models)
+    rows = [{
+        "passengerId": p.id,
+        "groupId": p.group_id,
+        "seatId": seat_id,
+        "groupDistance": u.get("group_distance"),
+        "seatType": u.get("seat_type"),
+        "normRow": u.get("norm_row"),
+        "normCol": u.get("norm_col"),
+    } for p, seat_id, u in zip(seated, seat_ids, features)]
+    snapshot = [{"tripId": trip_id, **row, "explanation": render_explanation(p, row["seatId"], reasons, row["seatType"])}
+                for p, row, reasons in zip(seated, rows, codes)]
+    if explain != "codes":
+        return snapshot, snapshot
+    for row, reasons in zip(rows, codes):
+        row["reasons"] = reasons
+    return rows, snapshot
+
+async def _store_and_forward(timer, trip_id, vehicle, passenger_reqs, results, expected_version=None):
+    """
+    Save the allocation for later /reallocate calls, then queue the snapshot
+    for the backend (forwarded in the background).
+    """
+    vehicle_payload = {"rows": vehicle.rows, "columns": vehicle.columns, "vehicleType": vehicle.vehicleType}
+    record = {"vehicle": vehicle_payload, "passengers": [p.model_dump() for p in passenger_reqs], "assignments": results}
+    version = None
+    try:
+        with timer.stage("store"):
+            version = await asyncio.to_thread(get_allocation_store().save, trip_id, record, expected_version)
+    except StaleAllocation as e:
+        raise HTTPException(status_code=409, detail=f"Trip changed during re-allocation, retry: {e}")
+    except Exception as e:
+        print(f"[WARN] Allocation store failed: {e}")
+    try:
+        with timer.stage("enqueue"):
+            await asyncio.to_thread(
+                get_allocation_outbox().enqueue,
+                trip_id=trip_id,
+                vehicle=vehicle_payload,
+                assignments_payload=results,
+                version=version
+            )
+    except Exception as e:
+        print(f"[WARN] Allocation enqueue failed: {e}")
+
+def _fingerprint(req: SeatRequest, passengers, personal_models, models):
+    return problem_fingerprint(passengers, _layout_kwargs(req.vehicle), personal_models, model_version=models[0],
+                               mode=req.mode, time_limit=req.timeLimit or SOLVER_TIME_LIMIT, config=solver_config())
+
+# Background history refreshes started on result cache hits (referenced until done)
+_refreshes = set()
+
+def _refresh_personalization_later(passenger_ids):
+    """
+    Fetch histories and fold them into the personalization store off the
+    request path; new feedback then changes the next request's fingerprint.
+    """
+    async def refresh():
+        try:
+            histories = await asyncio.to_thread(fetch_passenger_histories, passenger_ids)
+            await asyncio.to_thread(get_personalization_store().sync, histories)
+        except Exception as e:
+            print(f"[WARN] Personalization refresh failed: {e}")
+    task = asyncio.ensure_future(refresh())
+    _refreshes.add(task)
+    task.add_done_callback(_refreshes.discard)
+
+async def _allocate(req: SeatRequest, timer, profile=False):
     # Generate tripId if not provided
     trip_id = req.tripId or uuid.uuid4().hex
 
     # Build bus & passengers
-    bus = BusLayout(rows=req.vehicle.rows, cols=req.vehicle.columns, accessibility_rows=3, aisle_after=2)
-    passengers = [
-        Passenger(
-            id=p.id, age=p.age, gender=p.gender, disability=p.disability,
-            group_id=p.groupId, source_stop=p.pickupStopId, dest_stop=p.dropStopId
-        )
-        for p in req.passengers
-    ]
+    passengers = [_to_passenger(p) for p in req.passengers]
+    passenger_ids = [p.id for p in passengers]
+    models = model_registry.current().ref
+
+    # Same problem as a cached result (stored personalization)? Then skip
+    # history fetching and solving; histories are refreshed in the background.
+    with timer.stage("cache"):
+        stored_models = await asyncio.to_thread(get_personalization_store().models, passenger_ids)
+        cached = get_result_cache().peek(_fingerprint(req, passengers, stored_models, models)[0])
+    if cached is not None:
+        _refresh_personalization_later(passenger_ids)
+        return await _solve_trip(req, trip_id, passengers, stored_models, timer, profile=profile, models=models)
 
     # Personalization models per passenger (from backend histories)
-    personal_models = {}
-    for p in passengers:
-        history = fetch_passenger_history(p.id)
-        if history:
-            m = train_personalization_model(history)
-            if m:
-                personal_models[p.id] = m
-
-    # Run optimization
-    assignments = optimize_seating_with_ml(
-        passengers, bus,
-        seat_type_model=seat_type_model,
-        penalty_model=penalty_model,
-        personal_models=personal_models,
-        disability_encoder=disability_encoder
-    )
+    with timer.stage("histories"):
+        histories = await asyncio.to_thread(fetch_passenger_histories, passenger_ids)
+    with timer.stage("personalization"):
+        personal_models = await asyncio.to_thread(get_personalization_store().sync, histories)
+
+    return await _solve_trip(req, trip_id, passengers, personal_models, timer, profile=profile, models=models)
+
+async def _solve_trip(req: SeatRequest, trip_id, passengers, personal_models, timer, scores=None, profile=False,
+                      models=None):
+    """
+    Solve one trip in the pool, then build, store and forward the /allocate response.
+    scores: precomputed ProblemScores (batch allocation), else scored in the worker.
+    models: ModelSet.ref to solve with (default: the active version).
+    A trip whose fingerprint is in the result cache is not solved again; on a
+    miss, a cached near-identical trip on the same layout seeds a warm start.
+    """
+    bus = get_bus_layout(**_layout_kwargs(req.vehicle))
+    models = models or model_registry.current().ref
+    cache = get_result_cache()
+    with timer.stage("cache"):
+        key, layout_key = _fingerprint(req, passengers, personal_models, models)
+        cached = cache.get(key)
+        warm_start = None if cached is not None else cache.near(layout_key, [p.id for p in passengers])
+
+    if cached is not None:
+        assignments = build_assignment_details(passengers, bus, cached["seats"])
+        for pid, seat_type in cached.get("predicted", {}).items():
+            assignments[pid]["predicted_seat_type"] = seat_type
+        solve_info = {**cached["solver"], "wall_time_ms": 0.0, "cache": "hit"}
+    else:
+        # Run optimization (off the event loop)
+        with timer.stage("solver_call"):
+            # decomposed: each block is its own pool job
+            solve = solver_pool.solve_decomposed if req.mode == "decomposed" else solver_pool.solve
+            assignments, solve_info = await solve({
+                "passengers": passengers,
+                "layout": _layout_kwargs(req.vehicle),
+                "personal_models": personal_models,
+                "mode": req.mode,
+                "time_limit": req.timeLimit or SOLVER_TIME_LIMIT,
+                "profile_path": metrics.profile_path("solve", "prof") if profile else None,
+                "scores": scores,
+                "warm_start": warm_start,
+                "models": models,
+            })
+        _record_solver_stages(timer, solve_info)
+        solve_info["cache"] = "warm" if warm_start else "miss"
+        if assignments:
+            cache.put(key, layout_key, {pid: d["seat_id"] for pid, d in assignments.items()},
+                      {k: solve_info.get(k) for k in ("engine", "status", "objective", "gap")},
+                      {pid: d.get("predicted_seat_type") for pid, d in assignments.items()})
 
     if not assignments:
         raise HTTPException(status_code=409, detail="No feasible seating assignment found.")
 
     # Build response & snapshot
-    results = []
-    for p in passengers:
-        details = assignments.get(p.id)
-        if not details:
+    with timer.stage("explanation"):
+        results, snapshot = _build_results(trip_id, passengers, bus, assignments, personal_models, req.explain)
+    await _store_and_forward(timer, trip_id, req.vehicle, req.passengers, snapshot)
+
+    return {
+        "assignments": results,
+        "tripId": trip_id,
+        "solver": {
+            "engine": solve_info["engine"],
+            "status": solve_info["status"],
+            "objective": solve_info["objective"],
+            "wallTimeMs": solve_info["wall_time_ms"],
+            "gap": solve_info.get("gap"),
+            "cache": solve_info["cache"]
+        }
+    }
+
+# ---- Batch allocation ----
+
+async def allocate_many(trips: List[SeatRequest], timer=None):
+    """
+    Allocate many trips (e.g. a day's departures), yielding one dict per trip
+    in completion order: the /allocate response plus "index" (position in
+    trips) and "status" 200, or { index, tripId, status, detail } on failure.
+    Histories are fetched once for the distinct passengers of all trips, ML
+    scoring runs in shared batches of BATCH_SCORE_CHUNK trips, and at most
+    one trip per solver worker is solved at a time. Every trip in flight
+    beyond the first holds its own admission slot (the first uses the
+    batch's), waiting for the batch's running trips while the pool is
+    saturated, so single /allocate calls are not queued behind more work
+    than capacity counts. timer collects the shared stages; per-trip stages
+    are recorded per trip.
+    """
+    timer = timer or metrics.RequestTimer()
+    models = model_registry.current().ref  # the whole batch uses one model version
+    trip_ids = [t.tripId or uuid.uuid4().hex for t in trips]
+    passengers = [[_to_passenger(p) for p in t.passengers] for t in trips]
+
+    with timer.stage("histories"):
+        unique_ids = list(dict.fromkeys(p.id for trip in passengers for p in trip))
+        histories = await asyncio.to_thread(fetch_passenger_histories, unique_ids) if unique_ids else {}
+    with timer.stage("personalization"):
+        personal_models = await asyncio.to_thread(get_personalization_store().sync, histories)
+
+    def trip_models(k):
+        return {p.id: personal_models[p.id] for p in passengers[k] if p.id in personal_models}
+
+    def failure(k, status, detail):
+        return {"index": k, "tripId": trip_ids[k], "status": status, "detail": detail}
+
+    slots = asyncio.Semaphore(max(1, solver_pool.workers))
+    running = 0
+    changed = asyncio.Condition()
+
+    async def admit():
+        """
+        Wait for an admission slot; False when the trip runs on the batch's own.
+        """
+        nonlocal running
+        async with changed:
+            while True:
+                if running == 0:
+                    running += 1
+                    return False
+                try:
+                    solver_pool.acquire()
+                except PoolSaturated:
+                    await changed.wait()  # one of this batch's running trips frees room
+                    continue
+                running += 1
+                return True
+
+    async def leave(extra):
+        nonlocal running
+        async with changed:
+            running -= 1
+            if extra:
+                solver_pool.release()
+            changed.notify_all()
+
+    async def run(k, scores):
+        async with slots:
+            extra = await admit()
+            trip_timer = metrics.RequestTimer()
+            try:
+                result = await _solve_trip(trips[k], trip_ids[k], passengers[k], trip_models(k), trip_timer,
+                                           scores=scores, models=models)
+                return {"index": k, "status": 200, **result}
+            except HTTPException as e:
+                return failure(k, e.status_code, e.detail)
+            except Exception as e:
+                print(f"[WARN] Batch allocation of trip {trip_ids[k]} failed: {e}")
+                return failure(k, 500, str(e))
+            finally:
+                trip_timer.record()
+                await leave(extra)
+
+    pending = set()
+    for start in range(0, len(trips), BATCH_SCORE_CHUNK):
+        chunk = range(start, min(start + BATCH_SCORE_CHUNK, len(trips)))
+        try:
+            with timer.stage("scoring"):
+                chunk_scores = await solver_pool.solve({
+                    "problems": [{"passengers": passengers[k], "layout": _layout_kwargs(trips[k].vehicle)} for k in chunk],
+                    "personal_models": {pid: m for k in chunk for pid, m in trip_models(k).items()},
+                    "models": models,
+                }, fn=score_job)
+        except Exception as e:
+            print(f"[WARN] Batch scoring failed: {e}")
+            for k in chunk:
+                yield failure(k, 500, f"Scoring failed: {e}")
             continue
-        seat = bus.seat_map[details["seat_id"]]
-        u = details["universal_features"]
-        explanation = explain_assignment(
-            passenger=p,
-            seat=seat,
-            bus_layout=bus,
-            predicted_type=u.get("seat_type"),
-            is_personalized=p.id in personal_models
-        )
-        results.append({
-            "tripId": trip_id,
-            "passengerId": p.id,
-            "groupId": p.group_id,
-            "seatId": details["seat_id"],
-            "groupDistance": u.get("group_distance"),
-            "seatType": u.get("seat_type"),
-            "normRow": u.get("norm_row"),
-            "normCol": u.get("norm_col"),
-            "explanation": explanation
-        })
-
-    # Forward allocation snapshot to backend
+        pending |= {asyncio.ensure_future(run(k, scores)) for k, scores in zip(chunk, chunk_scores)}
+        finished = {task for task in pending if task.done()}
+        pending -= finished
+        for task in finished:
+            yield task.result()
+    for task in asyncio.as_completed(pending):
+        yield await task
+
+async def _batch_lines(trips):
+    started = time.perf_counter()
+    code = 200
+    timer = metrics.RequestTimer()
     try:
-        send_allocation_to_backend(
-            trip_id=trip_id,
-            vehicle={"rows": req.vehicle.rows, "columns": req.vehicle.columns, "vehicleType": req.vehicle.vehicleType},
-            assignments_payload=results
-        )
-    except Exception as e:
-        print(f"[WARN] Allocation forwarding failed: {e}")
+        async for result in allocate_many(trips, timer):
+            yield _dumps(result) + b"\n"
+        timer.record()
+    except Exception:
+        code = 500
+        raise
+    finally:
+        metrics.REQUESTS.inc(endpoint="/allocate/batch", code=code)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="/allocate/batch")
+
+class _AdmittedStream(StreamingResponse):
+    """
+    StreamingResponse that gives the request's admission slot back however
+    the response ends: a client that disconnects before the stream starts
+    never runs the body generator, and skips background tasks.
+    """
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            solver_pool.release()
+
+@app.post("/allocate/batch")
+async def allocate_batch(req: BatchRequest):
+    """
+    NDJSON stream, one line per trip as it completes (see allocate_many).
+    The batch takes one admission slot, plus one per further trip in flight.
+    """
+    if len(req.trips) > BATCH_MAX_TRIPS:
+        metrics.REQUESTS.inc(endpoint="/allocate/batch", code=413)
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_TRIPS} trips per batch.")
+    try:
+        solver_pool.acquire()
+    except PoolSaturated as e:
+        metrics.REQUESTS.inc(endpoint="/allocate/batch", code=429)
+        raise HTTPException(status_code=429, detail=f"Allocator saturated: {e}",
+                            headers={"Retry-After": str(ALLOCATOR_RETRY_AFTER)})
+    return _AdmittedStream(_batch_lines(req.trips), media_type="application/x-ndjson")
+
+async def _reallocate(req: ReallocateRequest, timer, profile=False):
+    with timer.stage("load"):
+        record, version = await asyncio.to_thread(get_allocation_store().load, req.tripId)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"No stored allocation for trip {req.tripId}.")
+
+    on_trip = {p["id"] for p in record["passengers"]}
+    removed = set(req.remove)
+    unknown = sorted(removed - on_trip)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Passengers not on trip: {', '.join(unknown)}")
+    added_ids = [p.id for p in req.add]
+    clashing = sorted({pid for pid in added_ids if pid in on_trip - removed or added_ids.count(pid) > 1})
+    if clashing:
+        raise HTTPException(status_code=422, detail=f"Passengers already on trip: {', '.join(clashing)}")
+
+    vehicle = VehicleReq(**record["vehicle"])
+    bus = get_bus_layout(**_layout_kwargs(vehicle))
+    passenger_reqs = [PassengerReq(**p) for p in record["passengers"] if p["id"] not in removed] + list(req.add)
+    passengers = [_to_passenger(p) for p in passenger_reqs]
+    previous = {a["passengerId"]: a["seatId"] for a in record["assignments"]}
+
+    # Only new passengers' histories are fetched; stored models cover the rest
+    with timer.stage("histories"):
+        histories = await asyncio.to_thread(fetch_passenger_histories, added_ids) if added_ids else {}
+    with timer.stage("personalization"):
+        personal_models = await asyncio.to_thread(
+            get_personalization_store().sync, {**{p.id: [] for p in passengers}, **histories})
+
+    with timer.stage("solver_call"):
+        assignments, solve_info = await solver_pool.solve({
+            "passengers": passengers,
+            "layout": _layout_kwargs(vehicle),
+            "previous": previous,
+            "personal_models": personal_models,
+            "keep": req.keep,
+            "time_limit": req.timeLimit or SOLVER_TIME_LIMIT,
+            "profile_path": metrics.profile_path("reallocate", "prof") if profile else None,
+            "models": model_registry.current().ref,
+        }, fn=reallocate_job)
+    _record_solver_stages(timer, solve_info)
+
+    if not assignments:
+        raise HTTPException(status_code=409, detail="No feasible seating assignment found.")
 
-    return {"assignments": results, "tripId": trip_id}
+    with timer.stage("explanation"):
+        results, snapshot = _build_results(req.tripId, passengers, bus, assignments, personal_models, req.explain)
+    await _store_and_forward(timer, req.tripId, vehicle, passenger_reqs, snapshot, expected_version=version)
 
+    return {
+        "assignments": results,
+        "tripId": req.tripId,
+        "moved": len(solve_info["moved"]),
+        "movedPassengerIds": solve_info["moved"],
+        "solver": {
+            "engine": solve_info["engine"],
+            "status": solve_info["status"],
+            "objective": solve_info["objective"],
+            "wallTimeMs": solve_info["wall_time_ms"],
+            "reoptimized": solve_info["reoptimized"],
+            "escalation": solve_info["escalation"]
+        }
+    }
@@ -0,0 +1,65 @@
+# ==============================================================================
+# FILE: batch_allocate.py
+# PURPOSE: CLI for fleet-level batch allocation (same pipeline as /allocate/batch)
+# ==============================================================================
+#
+#   python -m src.batch_allocate departures.json --out results.ndjson
+#
+# Input: a JSON list of /allocate bodies, { "trips": [...] }, or NDJSON (one
+# body per line); "-" reads stdin. Results are written as NDJSON in completion
+# order. Allocations are stored and queued for the backend like the service
+# does; snapshots not yet forwarded on exit stay in the outbox for the service.
+
+import sys
+import json
+import asyncio
+import argparse
+
+# .api is imported lazily: importing it loads the global models, which spawned
+# solver workers (re-importing this module) do not need.
+
+def read_trips(text):
+    from .api import SeatRequest
+    try:
+        bodies = json.loads(text)
+    except json.JSONDecodeError:
+        bodies = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(bodies, dict):
+        bodies = bodies["trips"] if "trips" in bodies else [bodies]
+    return [SeatRequest.model_validate(body) for body in bodies]
+
+async def run(trips, out):
+    from .api import allocate_many, solver_pool
+    from .allocation_outbox import get_allocation_outbox
+    outbox = get_allocation_outbox()
+    outbox.start()
+    failed = 0
+    try:
+        async for result in allocate_many(trips):
+            failed += result["status"] != 200
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        solver_pool.shutdown()
+        outbox.stop()
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Allocate seats for many trips at once.")
+    parser.add_argument("input", help="JSON/NDJSON file of /allocate request bodies, or - for stdin")
+    parser.add_argument("--out", default="-", help="NDJSON results file (default stdout)")
+    args = parser.parse_args(argv)
+
+    with (sys.stdin if args.input == "-" else open(args.input)) as f:
+        trips = read_trips(f.read())
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        failed = asyncio.run(run(trips, out))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"[INFO] {len(trips) - failed}/{len(trips)} trips allocated", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+# ==============================================================================
+# FILE: benchmark.py
+# PURPOSE: Synthetic scenarios + timing harness for the seat optimizer
+#          (python -m src.benchmark --help). No backend needed.
+# ==============================================================================
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import platform
+import itertools
+import tracemalloc
+import pulp
+from .integrated_seat_ml_model import Passenger, get_bus_layout, optimize_seating_with_ml, COHESION_FORMULATIONS
+from .decomposition import optimize_seating_decomposed
+from .scoring import score_problem
+from .personalization_store import PersonalModel
+from .solver_backends import MILP_BACKEND, MILP_BACKENDS, available_backends
+from .train_global_models import DISABILITIES, build_disability_encoder, fit_seat_type_model, fit_penalty_model
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+# ---- Scenario axes ----
+
+BUS_SIZES = ((8, 4), (10, 4), (12, 5), (15, 5))
+
+# Share of passengers travelling in parties of each size
+GROUP_MIXES = {
+    "solo": {1: 1.0},
+    "pairs": {1: 0.6, 2: 0.4},
+    "families": {1: 0.4, 2: 0.2, 3: 0.2, 4: 0.2},
+    "tour": {1: 0.3, 2: 0.2, 8: 0.5},
+}
+
+# Passenger attribute rates
+DEMOGRAPHICS = {
+    "standard": {"wheelchair": 0.03, "other_disability": 0.05, "elderly": 0.15, "female": 0.5},
+    "accessible": {"wheelchair": 0.10, "other_disability": 0.15, "elderly": 0.30, "female": 0.5},
+}
+
+STOP_COUNTS = (1, 6)
+
+# milp = optimize_seating_with_ml, decomposed = optimize_seating_decomposed
+ENGINES = ("milp", "decomposed")
+
+# Layout used by the API for every vehicle
+LAYOUT_KWARGS = {"accessibility_rows": 3, "aisle_after": 2}
+
+# ---- Scenario Generator ----
+
+def _sample_party_size(rng, mix):
+    sizes, weights = zip(*mix.items())
+    # weights are shares of passengers, so parties are drawn proportionally to share / size
+    return rng.choices(sizes, weights=[w / s for s, w in zip(sizes, weights)])[0]
+
+def _sample_passenger(rng, pid, group_id, demo, source, dest):
+    r = rng.random()
+    if r < demo["wheelchair"]:
+        disability = "Wheelchair"
+    elif r < demo["wheelchair"] + demo["other_disability"]:
+        disability = rng.choice([d for d in DISABILITIES if d not in ("None", "Wheelchair")])
+    else:
+        disability = "None"
+    age = rng.randint(60, 85) if rng.random() < demo["elderly"] else rng.randint(8, 59)
+    gender = "Female" if rng.random() < demo["female"] else "Male"
+    return Passenger(pid, age=age, group_id=group_id, gender=gender, disability=disability,
+                     source_stop=source, dest_stop=dest)
+
+def _zone_class(p):
+    """
+    Which zones seat_allowed lets p use: W(heelchair) -> disability only,
+    NM/NF (non-priority) -> general (+ female_only for women),
+    PM/PF (priority) -> disability + general (+ female_only for women).
+    """
+    if p.requires_disability_zone:
+        return "W"
+    female = str(p.gender).lower() != "male"
+    if p.is_disabled or p.age >= 60:
+        return "PF" if female else "PM"
+    return "NF" if female else "NM"
+
+def _zones_fit(counts, caps):
+    # Hall's condition over the unions of allowed zone sets
+    A, F, G = caps["disability"], caps["female_only"], caps["general"]
+    return (counts["W"] <= A
+            and counts["NM"] <= G
+            and counts["NM"] + counts["NF"] <= G + F
+            and counts["W"] + counts["NM"] + counts["PM"] <= A + G
+            and sum(counts.values()) <= A + F + G)
+
+def generate_scenario(rows, cols, group_mix="pairs", demographics="standard", stops=1, load=0.75, seed=0):
+    """
+    Passengers + layout for one benchmark case. Parties board and alight
+    together; parties are added until the busiest stop segment reaches
+    load * seats. A party is only admitted if every segment it rides can
+    still seat everyone within the zone rules, so cases are feasible.
+    """
+    rng = random.Random(seed)
+    bus = get_bus_layout(rows, cols, **LAYOUT_KWARGS)
+    mix, demo = GROUP_MIXES[group_mix], DEMOGRAPHICS[demographics]
+    target = max(1, int(load * len(bus.seats)))
+    caps = {zone: 0 for zone in ("disability", "female_only", "general")}
+    for s in bus.seats:
+        caps[s.zone] += 1
+    onboard = [dict.fromkeys(("W", "NM", "NF", "PM", "PF"), 0) for _ in range(stops)]
+
+    passengers, group_no, misses = [], 0, 0
+    while misses < 50:
+        size = _sample_party_size(rng, mix)
+        source = rng.randrange(stops)
+        dest = rng.randint(source + 1, stops)
+        segments = range(source, dest)
+        if any(sum(onboard[k].values()) + size > target for k in segments):
+            misses += 1
+            continue
+        group_id = f"g{group_no + 1}" if size > 1 else None
+        party = [_sample_passenger(rng, f"p{len(passengers) + i}", group_id, demo, source, dest) for i in range(size)]
+        counts = [dict(onboard[k]) for k in segments]
+        for c in counts:
+            for p in party:
+                c[_zone_class(p)] += 1
+        if not all(_zones_fit(c, caps) for c in counts):
+            misses += 1
+            continue
+        for k, c in zip(segments, counts):
+            onboard[k] = c
+        if group_id:
+            group_no += 1
+        passengers.extend(party)
+    return passengers, bus
+
+# ---- Stub Models ----
+
+def _synthetic_features(rng):
+    return {"is_priority": rng.randint(0, 1), "is_female": rng.randint(0, 1), "is_in_group": rng.randint(0, 1),
+            "age": rng.randint(5, 90), "norm_row": rng.random(), "norm_col": rng.random(),
+            "disability": rng.choice(DISABILITIES)}
+
+def make_stub_models(seed=0, samples=400):
+    """
+    Global models with the production architecture, fitted on synthetic
+    feedback rows: (seat_type_model, penalty_model, disability_encoder).
+    """
+    rng = random.Random(seed)
+    seat_recs = [(_synthetic_features(rng), rng.choice(["front", "window", "aisle"])) for _ in range(samples)]
+    pen_recs = []
+    for _ in range(samples):
+        feat = _synthetic_features(rng)
+        feat["group_distance"] = rng.randint(0, 8)
+        pen_recs.append((feat, 5 - 0.4 * feat["group_distance"] + rng.random()))
+    disability_encoder = build_disability_encoder()
+    return (fit_seat_type_model(seat_recs, disability_encoder),
+            fit_penalty_model(pen_recs, disability_encoder),
+            disability_encoder)
+
+def make_personal_models(passengers, share=0.3, seed=0):
+    rng = random.Random(seed)
+    return {p.id: PersonalModel([rng.uniform(-2, 2), rng.uniform(-2, 2)], rng.uniform(1, 5))
+            for p in passengers if rng.random() < share}
+
+# ---- Runner ----
+
+def _max_rss_mb():
+    # process high-water mark so far; CBC runs as a subprocess and is not included
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0, 1)
+
+def run_case(rows, cols, group_mix, demographics, stops, ml, cohesion, seed, models, time_limit=None,
+             trace_memory=False, engine="milp", backend=MILP_BACKEND):
+    """
+    One optimizer run. Returns a flat result row (see README for columns).
+    """
+    passengers, bus = generate_scenario(rows, cols, group_mix, demographics, stops, seed=seed)
+    seat_type_model = penalty_model = disability_encoder = None
+    personal_models = {}
+    if ml:
+        seat_type_model, penalty_model, disability_encoder = models
+        personal_models = make_personal_models(passengers, seed=seed)
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    scores = score_problem(passengers, bus, seat_type_model, penalty_model, personal_models, disability_encoder)
+    scoring_seconds = time.perf_counter() - started
+    info = {}
+    if engine == "decomposed":
+        details = optimize_seating_decomposed(passengers, bus, scores, cohesion=cohesion, time_limit=time_limit,
+                                              solve_info=info, backend=backend) or {}
+        info["status"] = "Feasible" if details else "Failed"
+    else:
+        details = optimize_seating_with_ml(passengers, bus, cohesion=cohesion, scores=scores, time_limit=time_limit,
+                                           solve_info=info, backend=backend)
+    total_seconds = time.perf_counter() - started
+    py_peak_mb = None
+    if trace_memory:
+        py_peak_mb = round(tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0), 1)
+        tracemalloc.stop()
+
+    # named after the backend that actually ran (an uninstalled one falls back
+    # to cbc); cbc keeps the case names of earlier runs, so old baselines still match
+    backend = info.get("backend", backend)
+    engine_name = engine if backend == "cbc" else f"{engine}-{backend}"
+    return {
+        "case": f"{rows}x{cols}/{group_mix}/{demographics}/stops{stops}/ml-{'on' if ml else 'off'}/{cohesion}/{engine_name}/seed{seed}",
+        "rows": rows, "cols": cols, "group_mix": group_mix, "demographics": demographics, "stops": stops,
+        "ml": ml, "cohesion": cohesion, "engine": engine, "backend": backend, "seed": seed,
+        "passengers": len(passengers),
+        "groups": len({p.group_id for p in passengers if p.group_id}),
+        "variables": info.get("variables"),
+        "constraints": info.get("constraints"),
+        "scoring_s": round(scoring_seconds, 4),
+        "build_s": round(info.get("build_seconds", 0.0), 4),
+        "solve_s": round(info.get("solve_seconds", 0.0), 4),
+        "total_s": round(total_seconds, 4),
+        "status": info.get("status"),
+        "optimal": info.get("optimal", False),
+        "objective": info.get("objective"),
+        "blocks": info.get("blocks"),
+        "assigned": len(details),
+        "py_peak_mb": py_peak_mb,
+        "rss_mb": _max_rss_mb(),
+    }
+
+def run_suite(sizes=BUS_SIZES, group_mixes=tuple(GROUP_MIXES), demographics=("standard",), stops=STOP_COUNTS,
+              ml=(False, True), cohesion=("pairwise",), engines=("milp",), seeds=(0,), time_limit=None,
+              trace_memory=False, log=print, backends=(MILP_BACKEND,)):
+    models = make_stub_models() if any(ml) else None
+    results = []
+    for (rows, cols), mix, demo, n_stops, use_ml, form, engine, backend, seed in itertools.product(
+            sizes, group_mixes, demographics, stops, ml, cohesion, engines, backends, seeds):
+        row = run_case(rows, cols, mix, demo, n_stops, use_ml, form, seed, models,
+                       time_limit=time_limit, trace_memory=trace_memory, engine=engine, backend=backend)
+        results.append(row)
+        if log:
+            log(f"{row['case']:<65} P={row['passengers']:<3} vars={row['variables'] or '-':<7} cons={row['constraints'] or '-':<7} "
+                f"build={row['build_s']:.2f}s solve={row['solve_s']:.2f}s "
+                f"{'optimal' if row['optimal'] else 'incumbent' if row['assigned'] else row['status']} "
+                f"obj={row['objective']}")
+    return results
+
+# ---- Output ----
+
+def environment_info():
+    return {"python": platform.python_version(), "platform": platform.platform(), "pulp": pulp.__version__,
+            "milp_backends": available_backends(), "cpu_count": os.cpu_count(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def write_json(path, results):
+    with open(path, "w") as f:
+        json.dump({"environment": environment_info(), "results": results}, f, indent=2)
+
+def write_csv(path, results):
+    if not results:
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+def compare(results, baseline_path, threshold=1.25):
+    """
+    Print cases whose total time grew by more than threshold x, or whose
+    objective dropped, against a previous JSON run. Cases are matched on
+    (case, backend); baselines written before --backends count as cbc.
+    Returns (regressions, missing): missing lists the cases of this run
+    the baseline has no row for, so a renamed case cannot pass unnoticed.
+    """
+    with open(baseline_path) as f:
+        baseline = {(row["case"], row.get("backend", "cbc")): row for row in json.load(f)["results"]}
+    regressions, missing = [], []
+    for row in results:
+        old = baseline.get((row["case"], row["backend"]))
+        if old is None:
+            missing.append(row["case"])
+            print(f"[MISSING] {row['case']} ({row['backend']}) is not in {baseline_path}")
+            continue
+        slower = old["total_s"] and row["total_s"] > threshold * old["total_s"]
+        worse = old["objective"] is not None and (row["objective"] is None or row["objective"] < old["objective"] - 1e-6)
+        if slower or worse:
+            regressions.append((row["case"], old["total_s"], row["total_s"], old["objective"], row["objective"]))
+            print(f"[REGRESSION] {row['case']}: {old['total_s']}s -> {row['total_s']}s, "
+                  f"objective {old['objective']} -> {row['objective']}")
+    return regressions, missing
+
+def _parse_sizes(text):
+    return tuple(tuple(int(v) for v in size.lower().split("x")) for size in text.split(","))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark optimize_seating_with_ml on synthetic scenarios.")
+    parser.add_argument("--sizes", default=",".join(f"{r}x{c}" for r, c in BUS_SIZES), help="e.g. 8x4,15x5")
+    parser.add_argument("--mixes", default=",".join(GROUP_MIXES), help=f"group mixes: {', '.join(GROUP_MIXES)}")
+    parser.add_argument("--demographics", default="standard", help=f"{', '.join(DEMOGRAPHICS)}")
+    parser.add_argument("--stops", default=",".join(map(str, STOP_COUNTS)), help="stop counts, e.g. 1,6")
+    parser.add_argument("--ml", default="off,on", help="off,on")
+    parser.add_argument("--cohesion", default="pairwise", help=f"{', '.join(COHESION_FORMULATIONS)}")
+    parser.add_argument("--engines", default="milp", help=f"{', '.join(ENGINES)}")
+    parser.add_argument("--backends", default=MILP_BACKEND, help=f"MILP backends: {', '.join(MILP_BACKENDS)}")
+    parser.add_argument("--seeds", default="0", help="scenario seeds, e.g. 0,1,2")
+    parser.add_argument("--time-limit", type=float, default=None, help="solver budget per case (s)")
+    parser.add_argument("--trace-memory", action="store_true", help="record Python peak memory (slows model build)")
+    parser.add_argument("--json", default=None, help="write results JSON here")
+    parser.add_argument("--csv", default=None, help="write results CSV here")
+    parser.add_argument("--baseline", default=None, help="previous results JSON to compare against")
+    parser.add_argument("--allow-missing", action="store_true", help="do not fail on cases missing from the baseline")
+    args = parser.parse_args(argv)
+
+    results = run_suite(
+        sizes=_parse_sizes(args.sizes),
+        group_mixes=tuple(args.mixes.split(",")),
+        demographics=tuple(args.demographics.split(",")),
+        stops=tuple(int(v) for v in args.stops.split(",")),
+        ml=tuple(v == "on" for v in args.ml.split(",")),
+        cohesion=tuple(args.cohesion.split(",")),
+        engines=tuple(args.engines.split(",")),
+        backends=tuple(args.backends.split(",")),
+        seeds=tuple(int(v) for v in args.seeds.split(",")),
+        time_limit=args.time_limit,
+        trace_memory=args.trace_memory,
+    )
+    if args.json:
+        write_json(args.json, results)
+    if args.csv:
+        write_csv(args.csv, results)
+    if args.baseline:
+        regressions, missing = compare(results, args.baseline)
+        return 1 if regressions or (missing and not args.allow_missing) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+# ==============================================================================
+# FILE: compiled_models.py
+# PURPOSE: Export the global ensembles as flat tree arrays in one .npz and
+#          evaluate them with NumPy (no sklearn objects at serving time)
+# ==============================================================================
+
+import io
+import os
+import struct
+import zipfile
+import threading
+import numpy as np
+
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+COMPILED_MODELS_FILE = os.getenv("COMPILED_MODELS_FILE", "global_models.npz")
+# Largest (trees x rows) block evaluated at once; bounds the temporaries
+COMPILED_BLOCK = int(os.getenv("COMPILED_BLOCK", str(1 << 20)))
+
+MODEL_NAMES = ("seat_type_model", "penalty_model")
+
+# -------------------- Export --------------------
+
+def _float32_floor(threshold):
+    """
+    sklearn compares float32 features against float64 thresholds; the largest
+    float32 <= threshold gives the same decisions with float32 arithmetic.
+    """
+    t32 = threshold.astype(np.float32)
+    return np.where(t32.astype(np.float64) > threshold, np.nextafter(t32, np.float32(-np.inf)), t32)
+
+def _flatten_ensemble(estimator):
+    """
+    Split a fitted VotingClassifier/VotingRegressor (soft voting), forest, or
+    linear model into tree arrays + linear terms, one "group" per sub-estimator.
+    """
+    if hasattr(estimator, "estimators_") and hasattr(estimator, "named_estimators_"):
+        if getattr(estimator, "voting", "soft") != "soft":
+            raise ValueError("only soft voting can be compiled")
+        members = list(estimator.estimators_)
+        weights = estimator.weights if estimator.weights is not None else [1.0] * len(members)
+        weights = [w for w, m in zip(weights, estimator.estimators) if m[1] != "drop"]
+    else:
+        members, weights = [estimator], [1.0]
+
+    trees, tree_group, linear = [], [], []
+    for g, member in enumerate(members):
+        if hasattr(member, "estimators_") and all(hasattr(t, "tree_") for t in member.estimators_):
+            trees += [t.tree_ for t in member.estimators_]
+            tree_group += [g] * len(member.estimators_)
+        elif hasattr(member, "tree_"):
+            trees.append(member.tree_)
+            tree_group.append(g)
+        elif hasattr(member, "coef_") and not hasattr(member, "classes_"):
+            linear.append((g, np.atleast_1d(member.coef_).astype(float), float(member.intercept_)))
+        else:
+            raise ValueError(f"cannot compile {type(member).__name__}")
+
+    feature, threshold, left, value, roots, offset = [], [], [], [], [], 0
+    for tree in trees:
+        # renumber so every internal node's children are adjacent (right = left + 1)
+        order = [0]
+        for node in order:
+            if tree.children_left[node] != -1:
+                order += [tree.children_left[node], tree.children_right[node]]
+        order = np.array(order)
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order)) + offset
+        leaf = tree.children_left[order] == -1
+        # leaves point at themselves with an infinite threshold, so extra
+        # traversal steps are no-ops
+        feature.append(np.where(leaf, 0, tree.feature[order]))
+        threshold.append(np.where(leaf, np.inf, tree.threshold[order]))
+        left.append(np.where(leaf, position[order], position[np.where(leaf, 0, tree.children_left[order])]))
+        v = tree.value[order, 0, :].astype(float)
+        if v.shape[1] > 1:
+            # sklearn >= 1.4 stores class fractions (used as they are), older versions counts
+            sums = v.sum(axis=1, keepdims=True)
+            v = np.where(np.isclose(sums, 1.0) | (sums == 0), v, v / np.where(sums == 0, 1.0, sums))
+        value.append(v)
+        roots.append(offset)
+        offset += len(order)
+
+    arrays = {
+        "feature": np.concatenate(feature).astype(np.int32) if trees else np.zeros(0, np.int32),
+        "threshold": _float32_floor(np.concatenate(threshold)) if trees else np.zeros(0, np.float32),
+        "left": np.concatenate(left).astype(np.int32) if trees else np.zeros(0, np.int32),
+        "value": np.concatenate(value) if trees else np.zeros((0, 1)),
+        "roots": np.array(roots, dtype=np.int32),
+        "tree_group": np.array(tree_group, dtype=np.int32),
+        "group_weight": np.array(weights, dtype=float),
+        "linear_group": np.array([g for g, _, _ in linear], dtype=np.int32),
+        "linear_coef": np.array([c for _, c, _ in linear], dtype=float) if linear else np.zeros((0, 0)),
+        "linear_intercept": np.array([b for _, _, b in linear], dtype=float),
+    }
+    if hasattr(estimator, "classes_"):
+        arrays["classes"] = np.asarray(estimator.classes_).astype(str)
+    return arrays
+
+def save_aligned_npz(path, arrays):
+    """
+    Write { key: array } as an uncompressed .npz whose arrays start on 64-byte
+    boundaries, so they can be memory-mapped and used in place (mmap_npz).
+    np.load reads the file as usual.
+    """
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:
+        for key, arr in arrays.items():
+            buf = io.BytesIO()
+            np.lib.format.write_array(buf, np.ascontiguousarray(arr), allow_pickle=False)
+            info = zipfile.ZipInfo(f"{key}.npy", date_time=(1980, 1, 1, 0, 0, 0))
+            # pad the local header's extra field (zipalign's 0xD935 record) so the
+            # .npy header, and with it the array data, is 64-byte aligned
+            header_end = archive.fp.tell() + 30 + len(info.filename.encode()) + 4
+            info.extra = struct.pack("<HH", 0xD935, -header_end % 64) + b"\0" * (-header_end % 64)
+            archive.writestr(info, buf.getvalue())
+    return path
+
+def export_compiled_models(path, seat_type_model=None, penalty_model=None):
+    """
+    Write the given models into one aligned .npz (save_aligned_npz), keys
+    "<model name>.<array>".
+    """
+    arrays = {}
+    for name, model in zip(MODEL_NAMES, (seat_type_model, penalty_model)):
+        if model is not None:
+            arrays.update({f"{name}.{key}": arr for key, arr in _flatten_ensemble(model).items()})
+    return save_aligned_npz(path, arrays)
+
+# -------------------- Loading --------------------
+
+def mmap_npz(path):
+    """
+    { key: read-only array } for an uncompressed .npz, memory-mapped in place
+    so every process mapping the file shares the same pages.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} in {path} is compressed")
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack("<26xHH", f.read(30))
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            shape, fortran, dtype = (np.lib.format.read_array_header_1_0(f) if version == (1, 0)
+                                     else np.lib.format.read_array_header_2_0(f))
+            key = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if int(np.prod(shape)) == 0:
+                arrays[key] = np.zeros(shape, dtype=dtype)
+            else:
+                mapped = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                   order="F" if fortran else "C")
+                arrays[key] = mapped.view(np.ndarray)  # plain views: memmap subclassing slows indexing
+    return arrays
+
+class CompiledModelFile:
+    """
+    The exported .npz, mapped on first use.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def arrays(self):
+        with self._lock:
+            if self._arrays is None:
+                self._arrays = mmap_npz(self.path)
+            return self._arrays
+
+    def names(self):
+        with zipfile.ZipFile(self.path) as archive:
+            return {n.split(".", 1)[0] for n in archive.namelist()}
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+# -------------------- Evaluation --------------------
+
+class CompiledEnsemble:
+    """
+    Batched evaluation of one exported ensemble: every (tree, row) pair walks
+    its tree in lock-step, dropping pairs that reached a leaf. Outputs are
+    combined in sklearn's order of operations (leaf values summed tree by
+    tree, divided by the tree count, then np.average over the sub-estimators),
+    so results match it bit for bit and argmax breaks exact ties on the lowest
+    class index as VotingClassifier does.
+    """
+    def __init__(self, model_file, name):
+        self.model_file = model_file
+        self.name = name
+
+    def _get(self, key):
+        return self.model_file.arrays()[f"{self.name}.{key}"]
+
+    def _leaves(self, X32):
+        """
+        (T, N) leaf index per tree and row.
+        """
+        feature, threshold, left = self._get("feature"), self._get("threshold"), self._get("left")
+        roots = self._get("roots")
+        n_rows, n_features = X32.shape
+        flat = X32.ravel()
+        node = np.repeat(roots[:, None], n_rows, axis=1).ravel()
+        base = np.tile(np.arange(n_rows, dtype=np.int32) * n_features, len(roots))
+        leaves = node.copy()
+        active = np.arange(node.size)
+        while active.size:
+            for _ in range(3):  # a few steps between compactions
+                # np.take(mode="clip") skips the bounds checks of fancy indexing
+                go_right = np.take(flat, np.take(feature, node, mode="clip") + base, mode="clip") \
+                    > np.take(threshold, node, mode="clip")
+                node = np.take(left, node, mode="clip") + go_right
+            moving = node != leaves[active]
+            leaves[active] = node
+            active, node = active[moving], node[moving]
+            base = base[moving]
+        return leaves.reshape(len(roots), n_rows)
+
+    def _members(self, X):
+        """
+        (G, N, C) output of each sub-estimator.
+        """
+        X = np.asarray(X, dtype=float).reshape(len(X), -1)
+        tree_group, value = self._get("tree_group"), self._get("value")
+        out = np.zeros((len(self._get("group_weight")), len(X), value.shape[1]))
+        if len(tree_group):
+            groups, starts, counts = np.unique(tree_group, return_index=True, return_counts=True)
+            rows = max(1, COMPILED_BLOCK // len(tree_group))
+            X32 = np.ascontiguousarray(X, dtype=np.float32)
+            for start in range(0, len(X), rows):
+                values = value[self._leaves(X32[start:start + rows])]
+                for g, first, count in zip(groups, starts, counts):
+                    # summed tree by tree like the forests do (np.add.reduce may sum pairwise)
+                    out[g, start:start + rows] = np.add.accumulate(values[first:first + count], axis=0)[-1] / count
+        for g, coef, intercept in zip(self._get("linear_group"), self._get("linear_coef"),
+                                      self._get("linear_intercept")):
+            out[g] = (X @ coef + intercept)[:, None]
+        return out
+
+    def _weights(self):
+        # unit weights stand for sklearn's weights=None (a plain mean, the same result as all ones)
+        weights = self._get("group_weight")
+        return None if np.all(weights == 1.0) else weights
+
+class CompiledClassifier(CompiledEnsemble):
+    @property
+    def classes_(self):
+        return np.asarray(self._get("classes"))
+
+    def predict_proba(self, X):
+        return np.average(self._members(X), axis=0, weights=self._weights())
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+class CompiledRegressor(CompiledEnsemble):
+    def predict(self, X):
+        return np.average(self._members(X)[:, :, 0].T, axis=1, weights=self._weights())
+
+def load_compiled_models(path):
+    """
+    { model name: CompiledClassifier | CompiledRegressor | None } for the
+    exported file; arrays are mapped lazily on the first prediction.
+    """
+    model_file = CompiledModelFile(path)
+    present = model_file.names()
+    return {
+        "seat_type_model": CompiledClassifier(model_file, "seat_type_model") if "seat_type_model" in present else None,
+        "penalty_model": CompiledRegressor(model_file, "penalty_model") if "penalty_model" in present else None,
+    }
+
+def parity_error(model, compiled, X):
+    """
+    Max absolute difference between the sklearn model and its compiled form
+    (class probabilities for classifiers, predictions for regressors); a
+    predicted class that differs counts as 1.
+    """
+    if hasattr(model, "predict_proba"):
+        if np.any(model.predict(X) != compiled.predict(X)):
+            return 1.0
+        return float(np.abs(model.predict_proba(X) - compiled.predict_proba(X)).max())
+    return float(np.abs(model.predict(X) - compiled.predict(X)).max())
@@ -0,0 +1,261 @@
+# ==============================================================================
+# FILE: decomposition.py
+# PURPOSE: Split large trips into zone/row-band blocks, solve the blocks as
+#          independent MILPs, then repair across block borders
+# ==============================================================================
+#
+# optimize_seating_decomposed solves the blocks one after the other in this
+# process; the API runs each block as its own solver pool job instead
+# (SolverPool.solve_decomposed), built from the same steps: plan_blocks,
+# block_problem + solve_block, solve_lp_bound, finish_decomposition.
+
+import os
+import time
+import collections
+import numpy as np
+from .utils import seat_allowed, group_passengers
+from .integrated_seat_ml_model import allowed_zones, onboard_cliques, optimize_seating_with_ml
+from .solver_backends import MILP_BACKEND, MILPBuilder, solve_milp
+from .heuristic_allocator import SeatingObjective, improve_seating, heuristic_seating
+
+# Max rows per block, whether to also solve the monolithic LP relaxation
+# for a gap bound (solver.gap; off by default, it is as large as the MILP
+# the decomposition avoids), and the share of the budget kept for it
+DECOMPOSE_BLOCK_ROWS = int(os.getenv("DECOMPOSE_BLOCK_ROWS", "4"))
+DECOMPOSE_LP_BOUND = os.getenv("DECOMPOSE_LP_BOUND", "0").lower() in ("1", "true", "yes")
+DECOMPOSE_BOUND_SHARE = float(os.getenv("DECOMPOSE_BOUND_SHARE", "0.2"))
+
+# -------------------- Partition --------------------
+
+class SeatBlock:
+    def __init__(self, zone, seat_idx, bus):
+        self.zone = zone
+        self.seat_idx = np.array(seat_idx, dtype=int)
+        self.seat_ids = tuple(bus.seats[j].id for j in seat_idx)
+
+    def __len__(self):
+        return len(self.seat_idx)
+
+def partition_seats(bus, block_rows=DECOMPOSE_BLOCK_ROWS):
+    """
+    Runs of consecutive rows in the same zone, cut into bands of at most
+    block_rows rows. Every seat in a block is allowed for the same passengers.
+    """
+    rows = collections.defaultdict(list)
+    for j, s in enumerate(bus.seats):
+        rows[s.row].append(j)
+    blocks, band, band_zone, band_rows = [], [], None, 0
+    for r in sorted(rows):
+        zone = bus.seats[rows[r][0]].zone
+        if band and (zone != band_zone or band_rows == block_rows):
+            blocks.append(SeatBlock(band_zone, band, bus))
+            band, band_rows = [], 0
+        band += rows[r]
+        band_zone = zone
+        band_rows += 1
+    if band:
+        blocks.append(SeatBlock(band_zone, band, bus))
+    return blocks
+
+def travel_units(passengers):
+    """
+    [(members, zones)]: passengers that must land in the same block. Solo
+    passengers are their own unit; a group is one unit unless its members
+    share no zone (e.g. a wheelchair user with a non-priority companion),
+    in which case it is split into zone-compatible parts. Members keep
+    input order.
+    """
+    order = {p.id: i for i, p in enumerate(passengers)}
+    units = [([p], allowed_zones(p)) for p in passengers if not p.group_id]
+    for members in group_passengers(passengers).values():
+        parts = []
+        for p in sorted(members, key=lambda q: len(allowed_zones(q))):
+            zones = allowed_zones(p)
+            for part in parts:
+                if part[1] & zones:
+                    part[0].append(p)
+                    part[1] &= zones
+                    break
+            else:
+                parts.append([[p], zones])
+        units += [(sorted(part, key=lambda q: order[q.id]), zones) for part, zones in parts]
+    return units
+
+# -------------------- Master Problem --------------------
+
+def assign_units(units, blocks, passengers, scores, cliques, time_limit=None, backend=MILP_BACKEND):
+    """
+    Small MILP placing each unit in one compatible block, so that on every
+    on-board clique no block holds more riders than seats (which makes every
+    block subproblem feasible). A unit's value in a block is its members'
+    mean best seat bonuses there. Returns { unit: block } or None.
+    """
+    p_index = {p.id: i for i, p in enumerate(passengers)}
+    builder = MILPBuilder()
+    place = {}
+    for u, (members, zones) in enumerate(units):
+        rows = [p_index[p.id] for p in members]
+        candidates = [b for b, block in enumerate(blocks) if block.zone in zones and len(members) <= len(block)]
+        if not candidates:
+            return None
+        values = [float(np.sort(scores.seat_bonus[np.ix_(rows, blocks[b].seat_idx)], axis=1)[:, -len(members):]
+                        .mean(axis=1).sum()) for b in candidates]
+        index = builder.add_vars(len(candidates), cost=values)
+        place.update(zip(((u, b) for b in candidates), index))
+        builder.add_rows([index], 1.0, lower=1.0, upper=1.0)  # one block per unit
+
+    unit_of = {p.id: u for u, (members, _) in enumerate(units) for p in members}
+    for riders in cliques:
+        riding = collections.Counter(unit_of[p.id] for p in riders)
+        for b, block in enumerate(blocks):
+            terms = [(n, place[u, b]) for u, n in riding.items() if (u, b) in place]
+            if sum(n for n, _ in terms) > len(block):
+                builder.add_rows([[k for _, k in terms]], [[n for n, _ in terms]], upper=len(block))
+
+    result = solve_milp(builder.build(), backend=backend, time_limit=time_limit)
+    if not result.feasible:
+        return None
+    return {u: b for (u, b), k in place.items() if result.x[k] > 0.5}
+
+def plan_blocks(passengers, bus, scores, block_rows=DECOMPOSE_BLOCK_ROWS, time_limit=None, backend=MILP_BACKEND):
+    """
+    Partition and master problem: ([(block, members)], block rows used), members
+    in passenger order, or None when no split works. If the master problem is
+    infeasible, bands are widened (x2) and it is retried.
+    """
+    started = time.monotonic()
+    units = travel_units(passengers)
+    cliques = onboard_cliques(passengers)
+    rows = max(1, block_rows)
+    while True:
+        blocks = partition_seats(bus, rows)
+        left = max(0.0, time_limit - (time.monotonic() - started)) if time_limit else None
+        assignment = assign_units(units, blocks, passengers, scores, cliques, time_limit=left, backend=backend)
+        if assignment is not None or rows >= bus.rows:
+            break
+        rows *= 2
+    if assignment is None:
+        return None
+    p_index = {p.id: i for i, p in enumerate(passengers)}
+    members_by_block = collections.defaultdict(list)
+    for u, b in assignment.items():
+        members_by_block[b] += units[u][0]
+    plan = [(blocks[b], sorted(members, key=lambda p: p_index[p.id])) for b, members in sorted(members_by_block.items())]
+    return plan, min(rows, bus.rows)
+
+# -------------------- Block Solves --------------------
+
+def block_problem(block, members, scores, passengers):
+    """
+    (seat ids, scores) of one block's subproblem; scores.subset of the
+    trip's scores, which are indexed like passengers.
+    """
+    p_index = {p.id: i for i, p in enumerate(passengers)}
+    return block.seat_ids, scores.subset(members, [p_index[p.id] for p in members], block.seat_idx)
+
+def solve_block(members, sub_bus, sub_scores, cohesion, time_limit, backend=MILP_BACKEND):
+    """
+    Seat a block's members: MILP within time_limit, then the heuristic if
+    the MILP was skipped (no time left: time_limit <= 0) or seated nobody.
+    Returns ({ passenger_id: seat_id }, info), empty when neither worked;
+    info["engine"] says which one did.
+    """
+    info = {"engine": "milp"}
+    chosen = {}
+    if time_limit is None or time_limit > 0:
+        details = optimize_seating_with_ml(members, sub_bus, cohesion=cohesion, scores=sub_scores,
+                                           time_limit=time_limit, solve_info=info, backend=backend)
+        chosen = {pid: d["seat_id"] for pid, d in details.items()}
+    if len(chosen) != len(members):
+        heuristic_chosen, _ = heuristic_seating(members, sub_bus, sub_scores, cohesion=cohesion,
+                                                deadline=time.monotonic())
+        chosen = heuristic_chosen or {}
+        info.update({"engine": "heuristic", "optimal": False})
+    return chosen, info
+
+def solve_lp_bound(passengers, bus, scores, cohesion, time_limit=None, backend=MILP_BACKEND):
+    """
+    Objective of the monolithic LP relaxation (an upper bound), or None if
+    it was not solved within time_limit (None when time_limit <= 0).
+    """
+    if time_limit is not None and time_limit <= 0:
+        return None
+    info = {}
+    optimize_seating_with_ml(passengers, bus, cohesion=cohesion, scores=scores, relax=True, time_limit=time_limit,
+                             solve_info=info, backend=backend)
+    return info.get("objective") if info.get("optimal") else None
+
+def finish_decomposition(passengers, bus, scores, cohesion, plan, results, bound=None, deadline=None,
+                         solve_info=None):
+    """
+    Combine the block seatings (results: [(chosen, info)] in plan order) and
+    repair across block borders with moves/swaps on the full objective (group
+    members split across blocks, separation penalties between blocks).
+    Returns { passenger_id: seat_id }, or None if a block seated nobody.
+    """
+    blocks, block_rows = plan
+    chosen = {}
+    for b, ((_, members), (block_chosen, info)) in enumerate(zip(blocks, results)):
+        if len(block_chosen) != len(members):
+            print(f"[WARN] decomposed block {b} returned no seating ({info.get('status')})")
+            return None
+        chosen.update(block_chosen)
+    block_infos = [info for _, info in results]
+
+    objective = SeatingObjective(passengers, bus, scores, cohesion)
+    allowed = {p.id: [s for s in bus.seats if seat_allowed(p, s)] for p in passengers}
+    chosen = improve_seating(passengers, bus, objective, allowed, chosen, deadline=deadline)
+
+    if solve_info is not None:
+        value = objective.total(passengers, chosen)
+        solve_info.update({
+            "blocks": len(blocks),
+            "block_rows": block_rows,
+            "objective": value,
+            "block_status": "Optimal" if all(i.get("optimal") for i in block_infos) else "Feasible",
+            "heuristic_blocks": sum(i["engine"] == "heuristic" for i in block_infos),
+            "variables": sum(i.get("variables") or 0 for i in block_infos),
+            "constraints": sum(i.get("constraints") or 0 for i in block_infos),
+            "build_seconds": sum(i.get("build_seconds", 0.0) for i in block_infos),
+            "solve_seconds": sum(i.get("solve_seconds", 0.0) for i in block_infos),
+            "bound": bound,
+            "gap": max(0.0, (bound - value) / abs(bound)) if bound else None,
+        })
+    return chosen
+
+def optimize_seating_decomposed(passengers, bus, scores, cohesion="pairwise", time_limit=None,
+                                block_rows=DECOMPOSE_BLOCK_ROWS, lp_bound=DECOMPOSE_LP_BOUND, solve_info=None,
+                                backend=MILP_BACKEND):
+    """
+    Decomposed MILP, blocks solved in turn in this process. Returns
+    { passenger_id: seat_id }, or None when no block split works (caller
+    should fall back to the monolithic MILP).
+    With lp_bound, the monolithic LP relaxation is solved first with up to
+    DECOMPOSE_BOUND_SHARE of the time left (so a hard block cannot starve
+    it). Each block then gets an equal share of the time left; once it has
+    run out the remaining blocks are seated by the heuristic.
+    solve_info gets: blocks, block_rows, objective (full objective of the
+    combined seating), block_status, heuristic_blocks, variables/constraints/
+    build_seconds/solve_seconds summed over blocks, bound and relative gap.
+    backend: MILP backend for the master, block and LP bound solves.
+    """
+    deadline = time.monotonic() + time_limit if time_limit else None
+
+    def remaining():
+        return max(0.0, deadline - time.monotonic()) if deadline is not None else None
+
+    plan = plan_blocks(passengers, bus, scores, block_rows, time_limit=remaining(), backend=backend)
+    if plan is None:
+        return None
+    bound = None
+    if lp_bound:
+        left = remaining()
+        bound = solve_lp_bound(passengers, bus, scores, cohesion,
+                               left * DECOMPOSE_BOUND_SHARE if left is not None else None, backend)
+    results = []
+    for k, (block, members) in enumerate(plan[0]):
+        seat_ids, sub_scores = block_problem(block, members, scores, passengers)
+        left = remaining()
+        results.append(solve_block(members, bus.subset(seat_ids), sub_scores, cohesion,
+                                   left / (len(plan[0]) - k) if left is not None else None, backend))
+    return finish_decomposition(passengers, bus, scores, cohesion, plan, results, bound, deadline, solve_info)
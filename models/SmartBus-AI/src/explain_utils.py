@@ -1,35 +1,73 @@
 # ==============================================================================
 # FILE: explain_utils.py
-# PURPOSE: Transparent reasoning for a seat assignment
+# PURPOSE: Transparent reasoning for a seat assignment — reason codes for a
+#          whole trip in one array pass, rendered to text on demand
 # ==============================================================================
 
-from .utils import get_seat_type
+import functools
+import numpy as np
 
-def explain_assignment(passenger, seat, bus_layout, predicted_type=None, is_personalized=False):
-    explanation = [f"Passenger {passenger.id} (Age: {passenger.age}) -> Seat {seat.id}"]
-
-    if is_personalized:
-        explanation.append("• Personalized choice based on past history.")
-    if passenger.group_id:
-        explanation.append("• Group cohesion prioritized.")
+# Reason code -> text line, in the order lines appear in an explanation
+# ({seat_type} / {disability} are filled from the passenger and seat)
+REASON_TEXTS = {
+    "personalized": "Personalized choice based on past history.",
+    "group": "Group cohesion prioritized.",
+    "model_seat_type": "Global model matched seat type: {seat_type}.",
+    "female_zone": "Female-only zone respected for safety.",
+    "wheelchair": "Accessible seat required for Wheelchair (mandatory).",
+    "accessible": "Accessible seat for {disability}.",
+    "senior": "Senior priority in accessible zone.",
+    "standard": "Standard assignment based on availability.",
+}
+REASON_CODES = tuple(REASON_TEXTS)
+_BIT = {code: 1 << k for k, code in enumerate(REASON_CODES)}
 
-    actual_type = get_seat_type(seat, bus_layout)
-    if predicted_type and predicted_type == actual_type:
-        explanation.append(f"• Global model matched seat type: {predicted_type}.")
+@functools.lru_cache(maxsize=None)
+def _codes(mask):
+    return tuple(code for code in REASON_CODES if mask & _BIT[code]) or ("standard",)
 
-    if seat.zone == 'female_only' and str(passenger.gender).lower() == 'female':
-        explanation.append("• Female-only zone respected for safety.")
+@functools.lru_cache(maxsize=1024)
+def _body(codes, seat_type, disability):
+    return "".join("\n• " + REASON_TEXTS[code].format(seat_type=seat_type, disability=disability) for code in codes)
 
-    if seat.zone == 'disability':
-        if passenger.disability.lower() == 'wheelchair':
-            explanation.append("• Accessible seat required for Wheelchair (mandatory).")
-        elif passenger.disability.lower() != 'none':
-            explanation.append(f"• Accessible seat for {passenger.disability}.")
-        elif passenger.age >= 60:
-            explanation.append("• Senior priority in accessible zone.")
+def reason_codes(passengers, seat_ids, bus_layout, predicted_types=None, personalized=()):
+    """
+    [(code, ...) per passenger] for passengers seated at seat_ids: one pass
+    over the passengers' flags, combined with the layout's cached seat types
+    and zone masks as bitmasks. predicted_types: global model seat type per
+    passenger (None entries allowed); personalized: ids of passengers with a
+    personal model.
+    """
+    n = len(passengers)
+    if n == 0:
+        return []
+    idx = np.fromiter((bus_layout.seat_index[s] for s in seat_ids), dtype=np.int64, count=n)
+    # per passenger: personalized, group, female, wheelchair, other disability, senior
+    flags = np.fromiter(((p.id in personalized) | bool(p.group_id) << 1 | (str(p.gender).lower() == "female") << 2
+                         | p.requires_disability_zone << 3 | (p.is_disabled and not p.requires_disability_zone) << 4
+                         | (p.age >= 60) << 5 for p in passengers), dtype=np.int64, count=n)
+    accessible = bus_layout.zone_masks["disability"][idx]
+    female_zone = bus_layout.zone_masks["female_only"][idx]
+    wheelchair, disabled = (flags >> 3) & 1, (flags >> 4) & 1
+    mask = flags & (_BIT["personalized"] | _BIT["group"])
+    if predicted_types is not None:
+        actual = bus_layout.seat_types[idx]
+        matched = np.fromiter((t is not None and t == a for t, a in zip(predicted_types, actual)), dtype=np.int64, count=n)
+        mask |= matched * _BIT["model_seat_type"]
+    mask |= (female_zone & (flags >> 2) & 1) * _BIT["female_zone"]
+    mask |= (accessible & wheelchair) * _BIT["wheelchair"]
+    mask |= (accessible & disabled) * _BIT["accessible"]
+    mask |= (accessible & ~(wheelchair | disabled) & (flags >> 5)) * _BIT["senior"]
+    return [_codes(m) for m in mask.tolist()]
 
-    if len(explanation) == 1:
-        explanation.append("• Standard assignment based on availability.")
-
-    return "\n".join(explanation)
+def render_explanation(passenger, seat_id, codes, seat_type=None):
+    """
+    Explanation text for one passenger's reason codes.
+    """
+    return f"Passenger {passenger.id} (Age: {passenger.age}) -> Seat {seat_id}" + _body(tuple(codes), seat_type,
+                                                                                       passenger.disability)
 
+def explain_assignment(passenger, seat, bus_layout, predicted_type=None, is_personalized=False):
+    codes = reason_codes([passenger], [seat.id], bus_layout, [predicted_type],
+                         personalized={passenger.id} if is_personalized else ())[0]
+    return render_explanation(passenger, seat.id, codes, predicted_type)
@@ -0,0 +1,285 @@
+# ==============================================================================
+# FILE: heuristic_allocator.py
+# PURPOSE: Greedy + local-search seating over the same objective as the MILP
+# ==============================================================================
+
+import bisect
+import itertools
+import time
+import numpy as np
+from .utils import seat_allowed, group_passengers
+from .integrated_seat_ml_model import (
+    COHESION_FORMULATIONS,
+    adjacency_bonus,
+    ride_end,
+    rides_overlap,
+    span_penalty_weight,
+)
+
+IMPROVEMENT_EPS = 1e-9
+# Riders a stuck passenger may push along to other seats (repair_seating)
+REPAIR_DEPTH = 3
+
+# -------------------- Objective --------------------
+
+class SeatingObjective:
+    """
+    Evaluates the optimizer objective for a fixed seating, term by term,
+    so single moves can be scored without rebuilding anything.
+    """
+    def __init__(self, passengers, bus, scores, cohesion="pairwise"):
+        if cohesion not in COHESION_FORMULATIONS:
+            raise ValueError(f"Unknown cohesion formulation: {cohesion}")
+        self.bus = bus
+        self.scores = scores
+        self.cohesion = cohesion
+        self.p_index = {p.id: i for i, p in enumerate(passengers)}
+        self.groups = group_passengers(passengers)
+        self.adjacent = {(a, b): adjacency_bonus(bus.seat_map[a], bus.seat_map[b]) for a, b in bus.adjacent_pairs}
+        self.span_weights = {}
+        if scores.penalty_tables is not None:
+            for gid, members in self.groups.items():
+                if len(members) > 1:
+                    self.span_weights[gid] = span_penalty_weight(members, scores.penalty_tables)
+
+    def adjacency(self, s1, s2):
+        """
+        Adjacency bonus of two seats in either order (adjacent holds each pair once).
+        """
+        return self.adjacent.get((s1, s2)) or self.adjacent.get((s2, s1), 0)
+
+    def seat_score(self, passenger, seat_id):
+        return float(self.scores.seat_bonus[self.p_index[passenger.id], self.bus.seat_index[seat_id]])
+
+    def group_score(self, gid, chosen):
+        """
+        Cohesion terms of one group; members without a seat yet are skipped.
+        """
+        placed = [(p, chosen[p.id]) for p in self.groups[gid] if p.id in chosen]
+        tables = self.scores.penalty_tables
+        total = 0.0
+        if self.cohesion == "pairwise":
+            for (p1, s1), (p2, s2) in itertools.combinations(placed, 2):
+                total += self.adjacency(s1, s2)
+                if tables is not None:
+                    j1 = self.bus.seat_index[s1]
+                    dist = int(self.bus.distances[j1, self.bus.seat_index[s2]])
+                    if dist > 1:
+                        total -= tables[p1.id][j1, dist] * dist
+            return total
+
+        held = set()
+        for (_, s1), (_, s2) in itertools.combinations(placed, 2):
+            for pair in ((s1, s2), (s2, s1)):
+                if pair in self.adjacent:
+                    held.add(pair)
+        total += sum(self.adjacent[pair] for pair in held)
+        weight = self.span_weights.get(gid, 0.0)
+        if weight > 0 and len(placed) > 1:
+            idx = [self.bus.seat_index[s] for _, s in placed]
+            rows, cols = self.bus.seat_rows[idx], self.bus.seat_cols[idx]
+            total -= weight * int((rows.max() - rows.min()) + (cols.max() - cols.min()))
+        return total
+
+    def total(self, passengers, chosen):
+        value = sum(self.seat_score(p, chosen[p.id]) for p in passengers)
+        value += sum(self.group_score(gid, chosen) for gid in self.groups)
+        return float(value)
+
+    def move_delta(self, chosen, moves):
+        """
+        Objective change of applying moves { passenger: seat_id } to chosen.
+        chosen is restored before returning.
+        """
+        before = {p.id: chosen.get(p.id) for p in moves}
+        gids = {p.group_id for p in moves if p.group_id}
+        delta = -sum(self.group_score(gid, chosen) for gid in gids)
+        for p, seat_id in moves.items():
+            if before[p.id] is not None:
+                delta -= self.seat_score(p, before[p.id])
+            delta += self.seat_score(p, seat_id)
+            chosen[p.id] = seat_id
+        delta += sum(self.group_score(gid, chosen) for gid in gids)
+        for p in moves:
+            if before[p.id] is None:
+                del chosen[p.id]
+            else:
+                chosen[p.id] = before[p.id]
+        return delta
+
+# -------------------- Greedy + Local Search --------------------
+
+def _fits(passenger, seat_id, occupants, ignore=()):
+    return not any(rides_overlap(passenger, q) for q in occupants[seat_id] if q.id not in ignore)
+
+class ZoneLedger:
+    """
+    Zone capacity per boarding stop: seats placed passengers hold in each zone,
+    and passengers still to be placed by the set of zones they may use. fits()
+    keeps enough seats free for the riders who can sit nowhere else (Hall's
+    condition over every union of zones, at every stop of the ride).
+    """
+    def __init__(self, passengers, bus, allowed):
+        self.points = sorted({p.source_stop for p in passengers})
+        zones = sorted({s.zone for s in bus.seats})
+        self.zone_index = {z: k for k, z in enumerate(zones)}
+        self.capacity = np.array([sum(s.zone == z for s in bus.seats) for z in zones], dtype=float)
+        self.zones_of = {p.id: frozenset(s.zone for s in allowed[p.id]) for p in passengers}
+        sets = sorted(set(self.zones_of.values()), key=sorted)
+        self.set_index = {zs: k for k, zs in enumerate(sets)}
+        unions = [frozenset(c) for n in range(1, len(zones) + 1) for c in itertools.combinations(zones, n)]
+        # subset x zone-set: every user of the zone-set must sit inside the union
+        self.inside = np.array([[zs <= u for zs in sets] for u in unions], dtype=float)
+        self.member = np.array([[z in u for z in zones] for u in unions], dtype=float)
+        self.placed = np.zeros((len(zones), len(self.points)))
+        self.pending = np.zeros((len(sets), len(self.points)))
+        for p in passengers:
+            self.pending[self.set_index[self.zones_of[p.id]], self._span(p)] += 1
+
+    def _span(self, passenger):
+        lo = bisect.bisect_left(self.points, passenger.source_stop)
+        return slice(lo, bisect.bisect_left(self.points, ride_end(passenger), lo))
+
+    def fits(self, passenger, zone):
+        span, z, c = self._span(passenger), self.zone_index[zone], self.set_index[self.zones_of[passenger.id]]
+        placed, pending = self.placed[:, span].copy(), self.pending[:, span].copy()
+        placed[z] += 1
+        pending[c] -= 1
+        return bool((self.inside @ pending <= self.member @ (self.capacity[:, None] - placed)).all())
+
+    def place(self, passenger, zone, previous=None):
+        span = self._span(passenger)
+        if previous is None:
+            self.pending[self.set_index[self.zones_of[passenger.id]], span] -= 1
+        else:
+            self.placed[self.zone_index[previous], span] -= 1
+        self.placed[self.zone_index[zone], span] += 1
+
+def repair_seating(passenger, allowed, occupants, depth=REPAIR_DEPTH, claimed=frozenset()):
+    """
+    Ejection chain for a passenger with no free seat: take an allowed seat
+    held by a single overlapping rider, who moves on the same way (at most
+    depth riders pushed). Returns [(passenger, seat_id), ...] or None.
+    """
+    pushed = []
+    for s in allowed[passenger.id]:
+        if s.id in claimed:
+            continue
+        blockers = [q for q in occupants[s.id] if rides_overlap(passenger, q)]
+        if not blockers:
+            return [(passenger, s.id)]
+        if len(blockers) == 1:
+            pushed.append((s.id, blockers[0]))
+    if depth > 0:
+        for seat_id, q in pushed:
+            moves = repair_seating(q, allowed, occupants, depth - 1, claimed | {seat_id})
+            if moves is not None:
+                return [(passenger, seat_id)] + moves
+    return None
+
+def greedy_seating(passengers, bus, objective, allowed):
+    """
+    Constraint-respecting construction in boarding order (interval colouring:
+    a rider only competes with riders already on board), wheelchair users and
+    large groups first at each stop. Each passenger takes the free allowed seat
+    with the best marginal objective among zones the ZoneLedger can spare;
+    if none is free, repair_seating pushes riders along.
+    Returns { passenger_id: seat_id } or None if someone is stuck.
+    """
+    group_size = {gid: len(members) for gid, members in objective.groups.items()}
+    order = sorted(passengers, key=lambda p: (
+        p.source_stop,
+        not p.requires_disability_zone,
+        -group_size.get(p.group_id, 0),
+        str(p.group_id),
+        len(allowed[p.id]),
+    ))
+
+    neighbours = {s.id: [] for s in bus.seats}
+    for (a, b), bonus in objective.adjacent.items():
+        neighbours[a].append((b, bonus))
+        neighbours[b].append((a, bonus))
+    unplaced = {gid: len(members) for gid, members in objective.groups.items()}
+    ledger = ZoneLedger(passengers, bus, allowed)
+
+    chosen = {}
+    occupants = {s.id: [] for s in bus.seats}
+    for p in order:
+        free = [s for s in allowed[p.id] if _fits(p, s.id, occupants)]
+        spare = {zone for zone in {s.zone for s in free} if ledger.fits(p, zone)}
+        best_seat, best_gain = None, None
+        for s in free:
+            if spare and s.zone not in spare:
+                continue
+            gain = objective.move_delta(chosen, {p: s.id})
+            if p.group_id and unplaced[p.group_id] > 1:
+                # look-ahead: leave room next to us for the rest of the group
+                gain += max((bonus for n, bonus in neighbours[s.id] if not occupants[n]), default=0)
+            if best_gain is None or gain > best_gain:
+                best_seat, best_gain = s, gain
+        moves = [(p, best_seat.id)] if best_seat is not None else repair_seating(p, allowed, occupants)
+        if moves is None:
+            return None
+        for q, seat_id in moves:
+            previous = chosen.get(q.id)
+            if previous is not None:
+                occupants[previous].remove(q)
+            chosen[q.id] = seat_id
+            occupants[seat_id].append(q)
+            ledger.place(q, bus.seat_map[seat_id].zone, bus.seat_map[previous].zone if previous else None)
+        if p.group_id:
+            unplaced[p.group_id] -= 1
+    return chosen
+
+def improve_seating(passengers, bus, objective, allowed, chosen, deadline=None, max_passes=20):
+    """
+    First-improvement local search: relocate one passenger to a free seat or
+    swap two passengers, while the objective improves and time remains.
+    """
+    occupants = {s.id: [] for s in bus.seats}
+    for p in passengers:
+        occupants[chosen[p.id]].append(p)
+    allowed_ids = {p.id: {s.id for s in allowed[p.id]} for p in passengers}
+
+    def relocate(p, seat_id):
+        occupants[chosen[p.id]].remove(p)
+        occupants[seat_id].append(p)
+        chosen[p.id] = seat_id
+
+    for _ in range(max_passes):
+        improved = False
+        for i, p in enumerate(passengers):
+            if deadline is not None and time.monotonic() > deadline:
+                return chosen
+            for s in allowed[p.id]:
+                if s.id == chosen[p.id] or not _fits(p, s.id, occupants, ignore=(p.id,)):
+                    continue
+                if objective.move_delta(chosen, {p: s.id}) > IMPROVEMENT_EPS:
+                    relocate(p, s.id)
+                    improved = True
+            for q in passengers[i + 1:]:
+                seat_p, seat_q = chosen[p.id], chosen[q.id]
+                if seat_p == seat_q or seat_q not in allowed_ids[p.id] or seat_p not in allowed_ids[q.id]:
+                    continue
+                if not (_fits(p, seat_q, occupants, ignore=(p.id, q.id)) and _fits(q, seat_p, occupants, ignore=(p.id, q.id))):
+                    continue
+                if objective.move_delta(chosen, {p: seat_q, q: seat_p}) > IMPROVEMENT_EPS:
+                    relocate(p, seat_q)
+                    relocate(q, seat_p)
+                    improved = True
+        if not improved:
+            break
+    return chosen
+
+def heuristic_seating(passengers, bus, scores, cohesion="pairwise", deadline=None):
+    """
+    Greedy construction + local search. Returns (chosen, objective_value),
+    or (None, None) when the greedy pass cannot seat everyone.
+    """
+    objective = SeatingObjective(passengers, bus, scores, cohesion)
+    allowed = {p.id: [s for s in bus.seats if seat_allowed(p, s)] for p in passengers}
+    chosen = greedy_seating(passengers, bus, objective, allowed)
+    if chosen is None:
+        return None, None
+    chosen = improve_seating(passengers, bus, objective, allowed, chosen, deadline=deadline)
+    return chosen, objective.total(passengers, chosen)
@@ -3,11 +3,14 @@
 # PURPOSE: MILP + ML seat optimizer (group cohesion + zones + ML bonuses)
 # ==============================================================================
 
-import pulp
+import os
+import time
+import functools
 import itertools
-import collections
 import numpy as np
-from .utils import get_seat_type
+from .utils import SEAT_TYPES, SEAT_ZONES, get_seat_type, seat_allowed, group_passengers
+from .scoring import score_problem
+from .solver_backends import MILP_BACKEND, MILPBuilder, solve_milp
 
 # -------------------- Data Structures --------------------
 
@@ -41,9 +44,11 @@ class BusLayout:
         self.aisle_after = aisle_after
         self.accessibility_rows = accessibility_rows
         self.gender_zones = gender_zones
-        self.seats = self._generate_seats()
+        self.seats = tuple(self._generate_seats())
         self.seat_map = {s.id: s for s in self.seats}
-        self.adjacent_pairs = self._compute_adjacents()
+        self.seat_index = {s.id: j for j, s in enumerate(self.seats)}
+        self.adjacent_pairs = tuple(self._compute_adjacents())
+        self._precompute_arrays()
 
     def _generate_seats(self):
         seats = []
@@ -70,157 +75,404 @@ class BusLayout:
                 adj.add(tuple(sorted((s.id, seats_by_pos[(s.row + 1, s.col)]))))
         return list(adj)
 
+    def _precompute_arrays(self):
+        """
+        Per-seat arrays in self.seats order (read-only, shared by every request):
+          seat_rows/seat_cols (S,), norm_coords (S, 2), seat_types (S,) str,
+          seat_type_codes (S,) index into SEAT_TYPES, zone_masks {zone: (S,) bool},
+          distances (S, S) Manhattan seat distance.
+        """
+        self.seat_rows = np.array([s.row for s in self.seats], dtype=int)
+        self.seat_cols = np.array([s.col for s in self.seats], dtype=int)
+        norm_rows = self.seat_rows / (self.rows - 1) if self.rows > 1 else np.zeros(len(self.seats))
+        norm_cols = self.seat_cols / (self.cols - 1) if self.cols > 1 else np.zeros(len(self.seats))
+        self.norm_coords = np.column_stack([norm_rows, norm_cols]).astype(float).reshape(len(self.seats), 2)
+        self.seat_types = np.array([get_seat_type(s, self) for s in self.seats], dtype=object)
+        self.seat_type_codes = np.array([SEAT_TYPES.index(t) for t in self.seat_types], dtype=int)
+        zones = np.array([s.zone for s in self.seats], dtype=object)
+        self.zone_masks = {zone: zones == zone for zone in SEAT_ZONES}
+        self.distances = (np.abs(self.seat_rows[:, None] - self.seat_rows[None, :]) +
+                          np.abs(self.seat_cols[:, None] - self.seat_cols[None, :]))
+        for arr in (self.seat_rows, self.seat_cols, self.norm_coords, self.seat_types,
+                    self.seat_type_codes, self.distances, *self.zone_masks.values()):
+            arr.flags.writeable = False
+
+    def subset(self, seat_ids):
+        """
+        This layout restricted to seat_ids (same seat objects, coordinates,
+        types and distances), e.g. one block of a decomposed problem.
+        """
+        keep = np.array([self.seat_index[sid] for sid in seat_ids], dtype=int)
+        sub = object.__new__(BusLayout)
+        sub.rows, sub.cols, sub.aisle_after = self.rows, self.cols, self.aisle_after
+        sub.accessibility_rows, sub.gender_zones = self.accessibility_rows, self.gender_zones
+        sub.seats = tuple(self.seats[j] for j in keep)
+        sub.seat_map = {s.id: s for s in sub.seats}
+        sub.seat_index = {s.id: j for j, s in enumerate(sub.seats)}
+        sub.adjacent_pairs = tuple(pair for pair in self.adjacent_pairs
+                                   if pair[0] in sub.seat_map and pair[1] in sub.seat_map)
+        sub.seat_rows, sub.seat_cols = self.seat_rows[keep], self.seat_cols[keep]
+        sub.norm_coords, sub.seat_types = self.norm_coords[keep], self.seat_types[keep]
+        sub.seat_type_codes = self.seat_type_codes[keep]
+        sub.zone_masks = {zone: mask[keep] for zone, mask in self.zone_masks.items()}
+        sub.distances = self.distances[np.ix_(keep, keep)]
+        for arr in (sub.seat_rows, sub.seat_cols, sub.norm_coords, sub.seat_types,
+                    sub.seat_type_codes, sub.distances, *sub.zone_masks.values()):
+            arr.flags.writeable = False
+        return sub
+
+# -------------------- Layout Cache --------------------
+
+LAYOUT_CACHE_SIZE = int(os.getenv("LAYOUT_CACHE_SIZE", "32"))
+
+def get_bus_layout(rows, cols, accessibility_rows=2, gender_zones=None, aisle_after=1):
+    """
+    Shared, precomputed BusLayout per vehicle shape. Callers must not mutate it.
+    """
+    if gender_zones is None:
+        gender_zones = {"female": [2, 3]}
+    zones_key = tuple(sorted((k, tuple(v)) for k, v in gender_zones.items()))
+    return _cached_layout(rows, cols, accessibility_rows, zones_key, aisle_after)
+
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def _cached_layout(rows, cols, accessibility_rows, zones_key, aisle_after):
+    gender_zones = {k: list(v) for k, v in zones_key}
+    return BusLayout(rows, cols, accessibility_rows=accessibility_rows, gender_zones=gender_zones, aisle_after=aisle_after)
+
+# -------------------- Seat Sharing (interval graph) --------------------
+
+def ride_end(passenger):
+    """
+    Exclusive end of the passenger's ride; degenerate intervals ride one stop.
+    """
+    if passenger.dest_stop > passenger.source_stop:
+        return passenger.dest_stop
+    return passenger.source_stop + 1
+
+def rides_overlap(p1, p2):
+    return p1.source_stop < ride_end(p2) and p2.source_stop < ride_end(p1)
+
+def onboard_cliques(passengers):
+    """
+    Maximal sets of passengers on board at the same time, via a sweep over
+    sorted interval endpoints. Intervals are half-open [source_stop, dest_stop);
+    a passenger with dest_stop <= source_stop is treated as riding one stop.
+    Returns at most one clique per distinct stop, only those with 2+ riders.
+    """
+    events = []
+    for p in passengers:
+        events.append((p.source_stop, 1, p))
+        events.append((ride_end(p), 0, p))
+    # drops (0) sort before boardings (1) at the same stop
+    events.sort(key=lambda e: (e[0], e[1]))
+
+    cliques, onboard, grew = [], {}, False
+    for _, boarding, p in events:
+        if boarding:
+            onboard[p.id] = p
+            grew = True
+        else:
+            if grew and len(onboard) > 1:
+                cliques.append(list(onboard.values()))
+            grew = False
+            onboard.pop(p.id, None)
+    return cliques
+
+# -------------------- Group Cohesion Formulations --------------------
+
+COHESION_FORMULATIONS = ("pairwise", "compact")
+
+def adjacency_bonus(s1, s2):
+    """
+    Horizontal neighbours are worth twice as much as vertical ones.
+    """
+    return 3000 if s1.row == s2.row else 1500
+
+def span_penalty_weight(members, penalty_tables):
+    """
+    Compact formulation: penalty per unit of group row+column span, the sum
+    over member pairs of the first member's mean predicted penalty.
+    """
+    weight = 0.0
+    for p1, p2 in itertools.combinations(members, 2):
+        far = penalty_tables[p1.id][:, 2:]
+        if far.size:
+            weight += float(far.mean())
+    return weight
+
+def _pairwise_cohesion_terms(builder, x, p_index, group_dict, bus, penalty_tables=None):
+    """
+    Original formulation: one adj binary per member pair x adjacent seat pair
+    in either orientation, one far binary per member pair x seat pair further
+    than 1 apart.
+    x: (P, S) variable indices of the assignment binaries (-1 = not a candidate);
+    pairs of seats the members cannot both take get no variable.
+    """
+    pairs = [(p_index[p1.id], p_index[p2.id], p1)
+             for members in group_dict.values() for p1, p2 in itertools.combinations(members, 2)]
+    if not pairs:
+        return
+    # adjacent_pairs lists each pair once; either member may take either seat
+    first = np.array([bus.seat_index[a] for a, _ in bus.adjacent_pairs], dtype=int)
+    second = np.array([bus.seat_index[b] for _, b in bus.adjacent_pairs], dtype=int)
+    bonus = np.array([adjacency_bonus(bus.seat_map[a], bus.seat_map[b]) for a, b in bus.adjacent_pairs], dtype=float)
+    adj1, adj2 = np.concatenate([first, second]), np.concatenate([second, first])
+    bonus = np.concatenate([bonus, bonus])
+    for i1, i2, _ in pairs:
+        both = (x[i1, adj1] >= 0) & (x[i2, adj2] >= 0)
+        adj = builder.add_vars(int(both.sum()), cost=bonus[both])
+        # adj <= x[p1, s1], adj <= x[p2, s2]
+        builder.add_rows(np.column_stack([adj, x[i1, adj1[both]]]), [1, -1], upper=0)
+        builder.add_rows(np.column_stack([adj, x[i2, adj2[both]]]), [1, -1], upper=0)
+
+    if penalty_tables is None:
+        return
+    far1, far2 = np.nonzero(bus.distances > 1)
+    dist = bus.distances[far1, far2]
+    for i1, i2, p1 in pairs:
+        both = (x[i1, far1] >= 0) & (x[i2, far2] >= 0)
+        far = builder.add_vars(int(both.sum()), cost=-penalty_tables[p1.id][far1[both], dist[both]] * dist[both])
+        # far >= x[p1, s1] + x[p2, s2] - 1
+        builder.add_rows(np.column_stack([x[i1, far1[both]], x[i2, far2[both]], far]), [1, 1, -1], upper=1)
+
+def _compact_cohesion_terms(builder, x, p_index, group_dict, bus, penalty_tables=None):
+    """
+    Compact formulation, linear in seats per group:
+      - adjacency: one continuous occ in [0, 1] per group x adjacent seat pair,
+        bounded by the group's occupancy of both seats (pays once per pair of
+        adjacent seats held by two members).
+      - separation: per-group row/column span variables; the ML penalty is
+        charged per unit of span, weighted by the members' mean predicted penalty.
+    """
+    adj1 = np.array([bus.seat_index[a] for a, _ in bus.adjacent_pairs], dtype=int)
+    adj2 = np.array([bus.seat_index[b] for _, b in bus.adjacent_pairs], dtype=int)
+    bonus = np.array([adjacency_bonus(bus.seat_map[a], bus.seat_map[b]) for a, b in bus.adjacent_pairs], dtype=float)
+    for gid, members in group_dict.items():
+        if len(members) < 2:
+            continue
+        idx = [p_index[p.id] for p in members]
+        # only seat pairs the group can hold both of
+        held = (x[np.ix_(idx, adj1)] >= 0).any(axis=0) & (x[np.ix_(idx, adj2)] >= 0).any(axis=0)
+        occ = builder.add_vars(int(held.sum()), cost=bonus[held], integer=False)
+        coefs = [1] + [-1] * len(idx)
+        # occ <= sum over members of x[m, s1] (and of x[m, s2])
+        builder.add_rows(np.column_stack([occ, x[np.ix_(idx, adj1[held])].T]), coefs, upper=0)
+        builder.add_rows(np.column_stack([occ, x[np.ix_(idx, adj2[held])].T]), coefs, upper=0)
+
+    if penalty_tables is None:
+        return
+    for gid, members in group_dict.items():
+        if len(members) < 2:
+            continue
+        weight = span_penalty_weight(members, penalty_tables)
+        if weight <= 0:
+            continue
+        idx = [p_index[p.id] for p in members]
+        for coords, size in ((bus.seat_rows, bus.rows), (bus.seat_cols, bus.cols)):
+            lo, hi = builder.add_vars(2, cost=[weight, -weight], upper=size - 1, integer=False)
+            pos = np.broadcast_to(coords.astype(float), (len(idx), len(coords)))
+            # lo <= position of every member <= hi
+            builder.add_rows(np.column_stack([np.full(len(idx), lo), x[idx]]),
+                             np.column_stack([np.ones(len(idx)), -pos]), upper=0)
+            builder.add_rows(np.column_stack([np.full(len(idx), hi), x[idx]]),
+                             np.column_stack([-np.ones(len(idx)), pos]), upper=0)
+
+# -------------------- Candidate Seats --------------------
+
+# Merge interchangeable passengers (same ride, same candidate seats and bonuses,
+# no group) into one variable per seat; MILP_SYMMETRY=0 keeps one per passenger
+MILP_SYMMETRY = os.getenv("MILP_SYMMETRY", "1").lower() in ("1", "true", "yes")
+
+_ZONE_PROBES = {zone: Seat("probe", 0, 0, zone=zone) for zone in SEAT_ZONES}
+
+def allowed_zones(passenger):
+    return frozenset(zone for zone, probe in _ZONE_PROBES.items() if seat_allowed(passenger, probe))
+
+def candidate_seats(passengers, bus, allowed_seats=None):
+    """
+    (P, S) bool: seats each passenger may take. The zone rules are checked
+    once per passenger and zone, then spread over the layout's zone masks;
+    allowed_seats ({ passenger_id: seat ids }) narrows it further.
+    """
+    allowed = np.zeros((len(passengers), len(bus.seats)), dtype=bool)
+    for i, p in enumerate(passengers):
+        for zone in allowed_zones(p):
+            allowed[i] |= bus.zone_masks[zone]
+        only = allowed_seats.get(p.id) if allowed_seats else None
+        if only is not None:
+            keep = np.zeros(len(bus.seats), dtype=bool)
+            keep[[bus.seat_index[sid] for sid in only if sid in bus.seat_index]] = True
+            allowed[i] &= keep
+    return allowed
+
+def interchangeable_units(passengers, seat_bonus, allowed, merge=MILP_SYMMETRY):
+    """
+    (unit_of (P,), units [[passenger indices]]): passengers outside groups with
+    the same ride, candidate seats and seat bonuses share a unit, as any
+    permutation of their seats scores the same. Units keep input order.
+    """
+    unit_of = np.empty(len(passengers), dtype=int)
+    units, keys = [], {}
+    for i, p in enumerate(passengers):
+        key = None
+        if merge and not p.group_id:
+            key = (p.source_stop, ride_end(p), allowed[i].tobytes(), np.asarray(seat_bonus[i], dtype=float).tobytes())
+        u = keys.get(key) if key is not None else None
+        if u is None:
+            u = len(units)
+            units.append([])
+            if key is not None:
+                keys[key] = u
+        units[u].append(i)
+        unit_of[i] = u
+    return unit_of, units
+
 # -------------------- MILP with ML Adjustments --------------------
 
-def optimize_seating_with_ml(passengers, bus, seat_type_model=None, penalty_model=None, personal_models=None, disability_encoder=None):
+def optimize_seating_with_ml(passengers, bus, seat_type_model=None, penalty_model=None, personal_models=None, disability_encoder=None,
+                             cohesion="pairwise", scores=None, time_limit=None, warm_start=None, solve_info=None,
+                             relax=False, allowed_seats=None, lookup_tables=None, backend=MILP_BACKEND):
     """
     Run MILP and return dict keyed by passenger id:
       { passenger_id: { "seat_id": "3A", "universal_features": {...} } }
     ML models are optional (seat_type_model, penalty_model, disability_encoder). personal_models is a dict.
+    cohesion selects the group formulation: "pairwise" (exact, quadratic in seats)
+    or "compact" (span/occupancy variables, linear in seats).
+    scores: precomputed ProblemScores (skips ML scoring). time_limit: solver budget in
+    seconds; the best feasible incumbent is accepted when it runs out.
+    warm_start: { passenger_id: seat_id } fed to the solver as a MIP start.
+    solve_info: optional dict, filled with solver status, objective value, model
+    size (variables/constraints), backend and build/solve seconds.
+    relax: solve the LP relaxation only; solve_info["objective"] is then an upper
+    bound on the optimum and {} is returned.
+    allowed_seats: { passenger_id: set of seat ids } further restricts those
+    passengers (e.g. pinned riders, or seats held by riders outside the model).
+    Only candidate seats get a variable, and interchangeable passengers share
+    one per seat (see interchangeable_units); seats are dealt to them in input order.
+    lookup_tables: SeatPreferenceTables; tabulated layouts are scored by lookup
+    instead of model inference.
+    backend: MILP engine (see solver_backends.py; MILP_THREADS / MILP_GAP apply).
     """
-    personal_models = personal_models or {}
-    model = pulp.LpProblem("SeatAllocation_ML", pulp.LpMaximize)
-    assign = pulp.LpVariable.dicts("x", ((p.id, s.id) for p in passengers for s in bus.seats), cat="Binary")
+    if cohesion not in COHESION_FORMULATIONS:
+        raise ValueError(f"Unknown cohesion formulation: {cohesion}")
+    if scores is None:
+        scores = score_problem(passengers, bus, seat_type_model, penalty_model, personal_models, disability_encoder,
+                               lookup_tables)
+    build_started = time.perf_counter()
+    n_seats = len(bus.seats)
+    p_index = {p.id: i for i, p in enumerate(passengers)}
 
-    # --- Hard Constraints ---
-    for p in passengers:
-        model += pulp.lpSum(assign[(p.id, s.id)] for s in bus.seats) == 1, f"oneSeat_{p.id}"
+    # Assignment variables only for candidate seats (-1 = no variable), one row
+    # of them per unit of interchangeable passengers, with the seat-type +
+    # personalization bonuses. Members of a unit ride together, so each seat
+    # holds at most one of them and the variables stay binary.
+    seat_bonus = np.asarray(scores.seat_bonus, dtype=float)
+    allowed = candidate_seats(passengers, bus, allowed_seats)
+    unit_of, units = interchangeable_units(passengers, seat_bonus, allowed)
+    reps = [members[0] for members in units]
+    builder = MILPBuilder()
+    ux = np.full((len(units), n_seats), -1, dtype=np.int64)
+    ux[allowed[reps]] = builder.add_vars(int(allowed[reps].sum()), cost=seat_bonus[reps][allowed[reps]])
+    x = ux[unit_of]
 
-    for s in bus.seats:
-        for p1, p2 in itertools.combinations(passengers, 2):
-            # overlapping intervals cannot share seat
-            if not (p1.dest_stop <= p2.source_stop or p2.dest_stop <= p1.source_stop):
-                model += assign[(p1.id, s.id)] + assign[(p2.id, s.id)] <= 1, f"noOverlap_{s.id}_{p1.id}_{p2.id}"
+    # --- Hard Constraints ---
+    builder.add_rows(ux, 1, lower=[len(members) for members in units],
+                     upper=[len(members) for members in units])  # one seat per passenger
 
-    for p in passengers:
-        for s in bus.seats:
-            if str(p.gender).lower() == "male" and s.zone == "female_only":
-                model += assign[(p.id, s.id)] == 0
-            if not (p.is_disabled or p.age >= 60) and s.zone == "disability":
-                model += assign[(p.id, s.id)] == 0
-            if p.requires_disability_zone and s.zone != "disability":
-                model += assign[(p.id, s.id)] == 0
+    # overlapping intervals cannot share seat: one row per seat per maximal on-board clique
+    for riders in onboard_cliques(passengers):
+        builder.add_rows(ux[np.unique(unit_of[[p_index[p.id] for p in riders]])].T, 1, upper=1)
 
     # --- Objective ---
-    obj = []
-    group_dict = collections.defaultdict(list)
-    for p in passengers:
-        if p.group_id:
-            group_dict[p.group_id].append(p)
+    # Group cohesion: adjacency bonuses + ML-informed separation penalty (soft)
+    group_dict = group_passengers(passengers)
+    if cohesion == "pairwise":
+        _pairwise_cohesion_terms(builder, x, p_index, group_dict, bus, scores.penalty_tables)
+    else:
+        _compact_cohesion_terms(builder, x, p_index, group_dict, bus, scores.penalty_tables)
+    problem = builder.build()
 
-    # Strong group adjacency bonuses
-    for gid, members in group_dict.items():
-        for p1, p2 in itertools.combinations(members, 2):
-            for s1_id, s2_id in bus.adjacent_pairs:
-                adj_var = pulp.LpVariable(f"adj_{p1.id}_{p2.id}_{s1_id}_{s2_id}", cat="Binary")
-                model += adj_var >= assign[(p1.id, s1_id)] + assign[(p2.id, s2_id)] - 1
-                s1_obj, s2_obj = bus.seat_map[s1_id], bus.seat_map[s2_id]
-                bonus = 3000 if s1_obj.row == s2_obj.row else 1500
-                obj.append(bonus * adj_var)
-
-    # ML-informed group separation penalty (soft)
-    if penalty_model and disability_encoder:
-        for gid, members in group_dict.items():
-            for p1, p2 in itertools.combinations(members, 2):
-                for s1 in bus.seats:
-                    for s2 in bus.seats:
-                        dist = abs(s1.row - s2.row) + abs(s1.col - s2.col)
-                        if dist > 1:
-                            far_var = pulp.LpVariable(f"far_{p1.id}_{s1.id}_{p2.id}_{s2.id}", cat="Binary")
-                            model += far_var >= assign[(p1.id, s1.id)] + assign[(p2.id, s2.id)] - 1
-                            norm_s1_row = s1.row / (bus.rows - 1) if bus.rows > 1 else 0.0
-                            norm_s1_col = s1.col / (bus.cols - 1) if bus.cols > 1 else 0.0
-                            try:
-                                onehot = disability_encoder.transform([[p1.disability]]).toarray()[0]
-                            except Exception:
-                                onehot = [0] * (len(disability_encoder.categories_[0]) if hasattr(disability_encoder, 'categories_') else 1)
-                            features = [int(p1.is_disabled or p1.age >= 60),
-                                        int(str(p1.gender).lower() == 'female'),
-                                        1,  # in group
-                                        p1.age, norm_s1_row, norm_s1_col, dist] + list(onehot)
-                            try:
-                                predicted = float(penalty_model.predict([features])[0])
-                                penalty = max(0.0, 5.0 - predicted)
-                            except Exception:
-                                penalty = 5.0
-                            obj.append(-penalty * dist * far_var)
-
-    # Global seat-type preference bonus
-    if seat_type_model and disability_encoder:
-        for p in passengers:
-            for s in bus.seats:
-                norm_s_row = s.row / (bus.rows - 1) if bus.rows > 1 else 0.0
-                norm_s_col = s.col / (bus.cols - 1) if bus.cols > 1 else 0.0
-                try:
-                    onehot = disability_encoder.transform([[p.disability]]).toarray()[0]
-                except Exception:
-                    onehot = [0] * (len(disability_encoder.categories_[0]) if hasattr(disability_encoder, 'categories_') else 1)
-                vec = [int(p.is_disabled or p.age >= 60),
-                       int(str(p.gender).lower() == 'female'),
-                       int(p.group_id is not None),
-                       p.age, norm_s_row, norm_s_col] + list(onehot)
-                try:
-                    probs = seat_type_model.predict_proba([vec])[0]
-                    preferred = seat_type_model.classes_[int(np.argmax(probs))]
-                except Exception:
-                    try:
-                        preferred = seat_type_model.predict([vec])[0]
-                    except Exception:
-                        preferred = None
-                if preferred and get_seat_type(s, bus) == preferred:
-                    obj.append(assign[(p.id, s.id)] * 50)
-
-    # Personalization bonus (per passenger tiny model)
-    for p in passengers:
-        personal_model = personal_models.get(p.id)
-        if not personal_model:
-            continue
-        for s in bus.seats:
-            norm_s_row = s.row / (bus.rows - 1) if bus.rows > 1 else 0.0
-            norm_s_col = s.col / (bus.cols - 1) if bus.cols > 1 else 0.0
-            try:
-                personal_score = float(personal_model.predict([[norm_s_row, norm_s_col]])[0])
-                bonus = max(0.0, personal_score - 3.0) * 100.0
-                obj.append(assign[(p.id, s.id)] * bonus)
-            except Exception:
-                pass
-
-    model += pulp.lpSum(obj)
-    model.solve(pulp.PULP_CBC_CMD(msg=0))
-
-    if model.status != pulp.LpStatusOptimal:
+    start = None
+    if warm_start:
+        start = _warm_start_vector(problem, x, p_index, group_dict, bus, warm_start, cohesion, scores)
+    solve_started = time.perf_counter()
+    result = solve_milp(problem, backend=backend, time_limit=time_limit, warm_start=start, relax=relax)
+
+    if solve_info is not None:
+        solve_info["status"] = result.status
+        solve_info["backend"] = result.backend
+        solve_info["variables"] = problem.num_vars
+        solve_info["constraints"] = problem.num_rows
+        solve_info["build_seconds"] = solve_started - build_started
+        solve_info["solve_seconds"] = time.perf_counter() - solve_started
+    if not result.feasible:
+        return {}
+    if solve_info is not None:
+        solve_info["optimal"] = result.optimal
+        solve_info["objective"] = float(problem.c @ result.x)
+    if relax:
         return {}
 
-    # Collect assignment mapping
+    # Collect assignment mapping: a unit's seats go to its members in order
     chosen = {}
-    for (p_id, s_id), var in assign.items():
-        if pulp.value(var) == 1:
-            chosen[p_id] = s_id
+    taken = (ux >= 0) & (result.x[ux] > 0.5)
+    for members, seats in zip(units, taken):
+        for i, j in zip(members, np.flatnonzero(seats)):
+            chosen[passengers[i].id] = bus.seats[j].id
 
-    # Compute group distances & universal features for DB
+    return build_assignment_details(passengers, bus, chosen)
+
+def _warm_start_vector(problem, x, p_index, group_dict, bus, warm_start, cohesion, scores):
+    """
+    Full variable vector for a { passenger_id: seat_id } start: assignment
+    binaries from the start, every auxiliary variable at its best value given
+    them (so a feasible start is passed as a feasible, correctly scored point).
+    """
+    values = np.zeros(problem.num_vars)
+    for pid, seat_id in warm_start.items():
+        if pid in p_index and seat_id in bus.seat_index and x[p_index[pid], bus.seat_index[seat_id]] >= 0:
+            values[x[p_index[pid], bus.seat_index[seat_id]]] = 1.0
+    # auxiliaries (everything but x) start at their most profitable bound; every
+    # row holding exactly one of them then clamps it against the fixed assignment
+    aux = np.ones(problem.num_vars, dtype=bool)
+    aux[x[x >= 0]] = False
+    values[aux] = np.where(problem.c[aux] > 0, problem.upper[aux], problem.lower[aux])
+    row_of = np.repeat(np.arange(problem.num_rows), np.diff(problem.indptr))
+    entry_aux = aux[problem.indices]
+    single = np.bincount(row_of, weights=entry_aux, minlength=problem.num_rows) == 1
+    rest = np.bincount(row_of, weights=np.where(entry_aux, 0.0, problem.data * values[problem.indices]),
+                       minlength=problem.num_rows)
+    entries = np.flatnonzero(entry_aux & single[row_of])
+    rows, cols, coefs = row_of[entries], problem.indices[entries], problem.data[entries]
+    for bound, caps_positive in ((problem.row_upper, True), (problem.row_lower, False)):
+        finite = np.isfinite(bound[rows])
+        limit = (bound[rows] - rest[rows]) / coefs
+        upper_limit = finite & ((coefs > 0) == caps_positive)
+        np.minimum.at(values, cols[upper_limit], limit[upper_limit])
+        lower_limit = finite & ((coefs > 0) != caps_positive)
+        np.maximum.at(values, cols[lower_limit], limit[lower_limit])
+    return values
+
+def build_assignment_details(passengers, bus, chosen):
+    """
+    Group distances & universal features for DB, from { passenger_id: seat_id }.
+    """
     group_distances = {}
-    for gid, members in group_dict.items():
-        seats = [bus.seat_map[chosen[p.id]] for p in members]
-        maxd = 0
-        for i in range(len(seats)):
-            for j in range(i+1, len(seats)):
-                d = abs(seats[i].row - seats[j].row) + abs(seats[i].col - seats[j].col)
-                if d > maxd:
-                    maxd = d
-        group_distances[gid] = maxd
+    for gid, members in group_passengers(passengers).items():
+        idx = [bus.seat_index[chosen[p.id]] for p in members]
+        group_distances[gid] = int(bus.distances[np.ix_(idx, idx)].max())
 
     assignment_details = {}
     for p in passengers:
-        seat = bus.seat_map[chosen[p.id]]
+        j = bus.seat_index[chosen[p.id]]
         assignment_details[p.id] = {
-            "seat_id": seat.id,
+            "seat_id": bus.seats[j].id,
             "universal_features": {
-                "seat_type": get_seat_type(seat, bus),
-                "norm_row": seat.row / (bus.rows - 1) if bus.rows > 1 else 0.0,
-                "norm_col": seat.col / (bus.cols - 1) if bus.cols > 1 else 0.0,
+                "seat_type": bus.seat_types[j],
+                "norm_row": float(bus.norm_coords[j, 0]),
+                "norm_col": float(bus.norm_coords[j, 1]),
                 "group_distance": group_distances.get(p.group_id)
             }
         }
 
     return assignment_details
-
@@ -0,0 +1,351 @@
+# ==============================================================================
+# FILE: lookup_tables.py
+# PURPOSE: Per-profile lookup tables of the global models' seat type and
+#          separation penalty predictions, so scoring needs no model calls
+# ==============================================================================
+#
+#   python -m src.lookup_tables --layouts 12x5 --age-buckets 1,2,5,10
+#
+# The models only see [is_priority, is_female, is_in_group, age, norm_row,
+# norm_col, (group_distance,) disability one-hot]. With ages bucketed, every
+# passenger maps to one of a few hundred profiles, and for a layout shape
+# (rows x cols) the seat columns take rows * cols values, so both predictions
+# can be tabulated once per shape and looked up per request.
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+import numpy as np
+from .scoring import (SEAT_TYPE_BONUS, MAX_PENALTY, profile_features, seat_type_features, penalty_features,
+                      seat_type_bonus_matrix, separation_penalty_tables)
+from .integrated_seat_ml_model import Passenger, get_bus_layout
+from .compiled_models import COMPILED_MODELS_FILE, save_aligned_npz, mmap_npz
+
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+# Tables live next to the models, in MODELS_DIR/lookup_tables/<rows>x<cols>.npz
+LOOKUP_TABLES_SUBDIR = "lookup_tables"
+# Years per age bucket: 1 (default) is exact for whole-year ages, wider buckets
+# are opt-in (smaller, faster to build, approximate); older passengers share the last bucket
+LOOKUP_AGE_BUCKET = int(os.getenv("LOOKUP_AGE_BUCKET", "1"))
+LOOKUP_MAX_AGE = int(os.getenv("LOOKUP_MAX_AGE", "100"))
+# Layout shapes tabulated right after training; other shapes are tabulated on first use
+LOOKUP_LAYOUTS = os.getenv("LOOKUP_LAYOUTS", "10x4,12x4,12x5")
+# Seconds before a failed background build is retried, doubled per failure up to an hour
+LOOKUP_RETRY_SECONDS = float(os.getenv("LOOKUP_RETRY_SECONDS", "60"))
+LOOKUP_RETRY_MAX_SECONDS = 3600.0
+
+def parse_layouts(text):
+    """
+    "12x5,10x4" -> [(12, 5), (10, 4)].
+    """
+    return [tuple(int(v) for v in item.lower().split("x")) for item in text.split(",") if item.strip()]
+
+def models_stamp(models_dir=MODELS_DIR):
+    """
+    Identifies the model files on disk; tables stamped otherwise are rebuilt.
+    """
+    parts = []
+    for name in ("seat_type_model.pkl", "penalty_model.pkl", "disability_encoder.pkl", COMPILED_MODELS_FILE):
+        path = os.path.join(models_dir, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            parts.append(f"{name}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+def _positions(bus):
+    # index of each seat in the full rows x cols grid (also right for BusLayout.subset)
+    return bus.seat_rows * bus.cols + bus.seat_cols
+
+# -------------------- Tables --------------------
+
+class SeatPreferenceTables:
+    """
+    Preferred seat type (K, rows * cols) and separation penalty
+    (K, rows * cols, max_dist - 1) per profile, for each layout shape.
+    Shapes are loaded from directory (<rows>x<cols>.npz; None = keep in memory)
+    or, when missing or built from other models, tabulated in a background
+    thread; until then lookups return None and callers use the models. A
+    failed build is logged and retried after LOOKUP_RETRY_SECONDS (doubling).
+    """
+    def __init__(self, seat_type_model, penalty_model, disability_encoder, directory=None,
+                 age_bucket=LOOKUP_AGE_BUCKET, max_age=LOOKUP_MAX_AGE, stamp=""):
+        self.seat_type_model = seat_type_model
+        self.penalty_model = penalty_model
+        self.disability_encoder = disability_encoder
+        self.directory = directory
+        self.age_bucket = max(1, age_bucket)
+        self.n_buckets = max_age // self.age_bucket + 1
+        self.max_age = max_age
+        self.stamp = stamp
+        # known disabilities, plus one all-zero slot for values the encoder ignores
+        self._slots = {str(d): k for k, d in enumerate(disability_encoder.categories_[0])}
+        self._tables = {}
+        self._building = set()
+        self._failures = {}  # shape -> (failed builds, monotonic time of the next attempt)
+        self._lock = threading.Lock()
+
+    # ---- Profiles ----
+
+    def _profile_grid(self, groups):
+        """
+        (K, 4) profile rows and (K, D) one-hot rows for every combination of
+        priority, female, in-group (groups), age bucket and disability slot;
+        ages are bucket midpoints.
+        """
+        grid = np.array(list(itertools.product((0, 1), (0, 1), groups, range(self.n_buckets),
+                                               range(len(self._slots) + 1))), dtype=float)
+        ages = grid[:, 3] * self.age_bucket + (self.age_bucket - 1) / 2.0
+        onehot = np.eye(len(self._slots) + 1)[grid[:, 4].astype(int)][:, :len(self._slots)]
+        return np.column_stack([grid[:, :3], ages]), onehot
+
+    def profile_codes(self, passengers, in_group=None):
+        """
+        Row of each passenger in the tables (in_group=1: penalty tables).
+        """
+        profile = profile_features(passengers, in_group)
+        buckets = np.clip(profile[:, 3] // self.age_bucket, 0, self.n_buckets - 1)
+        slots = np.array([self._slots.get(str(p.disability), len(self._slots)) for p in passengers])
+        flags = profile[:, 0] * 2 + profile[:, 1]
+        if in_group is None:
+            flags = flags * 2 + profile[:, 2]
+        return ((flags * self.n_buckets + buckets) * (len(self._slots) + 1) + slots).astype(int)
+
+    # ---- Building ----
+
+    def build(self, rows, cols):
+        """
+        Tabulate both models for a rows x cols layout (one model call each).
+        """
+        bus = get_bus_layout(rows, cols)
+        arrays = {}
+        if self.seat_type_model is not None:
+            profile, onehot = self._profile_grid((0, 1))
+            X = seat_type_features(profile, onehot, bus.norm_coords)
+            if hasattr(self.seat_type_model, "predict_proba"):
+                probs = self.seat_type_model.predict_proba(X)
+                preferred = np.asarray(self.seat_type_model.classes_)[np.argmax(probs, axis=1)]
+            else:
+                preferred = np.asarray(self.seat_type_model.predict(X))
+            arrays["preferred"] = preferred.astype(str).reshape(len(profile), len(bus.seats))
+        if self.penalty_model is not None:
+            profile, onehot = self._profile_grid((1,))
+            dists = np.arange(2, (rows - 1) + (cols - 1) + 1, dtype=float)
+            penalties = np.full(len(profile) * len(bus.seats) * len(dists), MAX_PENALTY)
+            if len(dists):
+                predicted = np.asarray(self.penalty_model.predict(
+                    penalty_features(profile, onehot, bus.norm_coords, dists)), dtype=float)
+                penalties = np.maximum(0.0, MAX_PENALTY - predicted)
+            arrays["penalty"] = penalties.reshape(len(profile), len(bus.seats), len(dists))
+        return arrays
+
+    def _path(self, rows, cols):
+        return os.path.join(self.directory, f"{rows}x{cols}.npz")
+
+    def _load(self, rows, cols):
+        path = self._path(rows, cols) if self.directory else None
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            # memory-mapped: every worker serving this version shares the pages
+            f = mmap_npz(path)
+            if (str(f["stamp"]) != self.stamp or int(f["age_bucket"]) != self.age_bucket
+                    or int(f["max_age"]) != self.max_age):
+                return None
+            return {key: f[key] for key in ("preferred", "penalty") if key in f}
+        except Exception as e:
+            print(f"[WARN] Could not read lookup table {path}: {e}")
+            return None
+
+    def _save(self, rows, cols, arrays):
+        if not self.directory:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(rows, cols)
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        save_aligned_npz(tmp, {"stamp": np.array(self.stamp), "age_bucket": np.array(self.age_bucket),
+                               "max_age": np.array(self.max_age), **arrays})
+        os.replace(tmp, path)  # atomic: readers never see a partial file
+        return path
+
+    def prepare(self, rows, cols):
+        """
+        Load or build (and save) the tables for a shape now; returns its path.
+        """
+        arrays = self._load(rows, cols)
+        path = self._path(rows, cols) if self.directory else None
+        if arrays is None:
+            arrays = self.build(rows, cols)
+            path = self._save(rows, cols, arrays)
+        with self._lock:
+            self._tables[(rows, cols)] = arrays
+        return path
+
+    def _build_in_background(self, rows, cols):
+        key = (rows, cols)
+        try:
+            arrays = self._load(rows, cols)  # another process may have finished first
+            if arrays is None:
+                arrays = self.build(rows, cols)
+                if self._save(rows, cols, arrays):
+                    arrays = self._load(rows, cols) or arrays  # serve the shared mapping
+        except Exception as e:
+            with self._lock:
+                failures = self._failures.get(key, (0, 0.0))[0] + 1
+                delay = min(LOOKUP_RETRY_MAX_SECONDS, LOOKUP_RETRY_SECONDS * 2 ** (failures - 1))
+                self._failures[key] = (failures, time.monotonic() + delay)
+                self._building.discard(key)
+            print(f"[WARN] Could not tabulate {rows}x{cols} (failure {failures}): {e}; retrying in {delay:.0f} s")
+            return
+        with self._lock:
+            self._tables[key] = arrays
+            self._failures.pop(key, None)
+            self._building.discard(key)
+
+    def tables(self, rows, cols):
+        """
+        The shape's arrays, or None while they are being built (or until a
+        failed build is retried).
+        """
+        key = (rows, cols)
+        with self._lock:
+            arrays = self._tables.get(key)
+            if arrays is not None or key in self._building:
+                return arrays
+            if time.monotonic() < self._failures.get(key, (0, 0.0))[1]:
+                return None
+            arrays = self._load(rows, cols)
+            if arrays is not None:
+                self._tables[key] = arrays
+                return arrays
+            self._building.add(key)
+        threading.Thread(target=self._build_in_background, args=key, daemon=True).start()
+        return None
+
+    # ---- Lookups (same results as scoring.py's model-based functions) ----
+
+    def seat_type_bonus(self, passengers, bus):
+        """
+        (P, S) seat type bonus like seat_type_bonus_matrix, or None.
+        """
+        arrays = self.tables(bus.rows, bus.cols)
+        if arrays is None or "preferred" not in arrays:
+            return None
+        preferred = arrays["preferred"][np.ix_(self.profile_codes(passengers), _positions(bus))]
+        return np.where(preferred == bus.seat_types.astype(str)[None, :], SEAT_TYPE_BONUS, 0.0)
+
+    def preferred_seat_types(self, passengers, bus, seat_idx):
+        """
+        Preferred seat type of passenger i in seat seat_idx[i] like
+        predicted_seat_types, or None.
+        """
+        arrays = self.tables(bus.rows, bus.cols)
+        if arrays is None or "preferred" not in arrays:
+            return None
+        return arrays["preferred"][self.profile_codes(passengers), _positions(bus)[seat_idx]]
+
+    def penalty_tables(self, members, bus, keys=None):
+        """
+        { passenger_id: (S, max_dist + 1) } like separation_penalty_tables, or None.
+        """
+        if not members:
+            return {}
+        arrays = self.tables(bus.rows, bus.cols)
+        if arrays is None or "penalty" not in arrays:
+            return None
+        penalties = arrays["penalty"][self.profile_codes(members, in_group=1)][:, _positions(bus)]
+        max_dist = (bus.rows - 1) + (bus.cols - 1)
+        tables = {}
+        for i, key in enumerate([p.id for p in members] if keys is None else keys):
+            table = np.zeros((len(bus.seats), max_dist + 1))
+            table[:, 2:] = penalties[i]
+            tables[key] = table
+        return tables
+
+# -------------------- Accuracy Report --------------------
+
+def accuracy_report(lookup, rows, cols, passengers=200, seed=0):
+    """
+    Tabulated vs exact model scores for random passengers (ages 0..max_age,
+    all genders and disabilities) on a rows x cols layout: share of seat
+    type bonuses that agree, penalty error, and scoring time both ways.
+    """
+    rng = np.random.default_rng(seed)
+    disabilities = list(lookup._slots)
+    sample = [Passenger(id=f"p{i}", age=int(rng.integers(0, lookup.max_age + 1)),
+                        gender=str(rng.choice(["Male", "Female"])), disability=str(rng.choice(disabilities)),
+                        group_id="g" if rng.random() < 0.5 else None)
+              for i in range(passengers)]
+    bus = get_bus_layout(rows, cols)
+    lookup.prepare(rows, cols)
+    report = {"layout": f"{rows}x{cols}", "age_bucket": lookup.age_bucket, "passengers": passengers,
+              "exact_ms": 0.0, "lookup_ms": 0.0}
+
+    def timed(key, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        report[key] += round((time.perf_counter() - started) * 1000.0, 1)
+        return result
+
+    if lookup.seat_type_model is not None:
+        exact = timed("exact_ms", seat_type_bonus_matrix, sample, bus, lookup.seat_type_model,
+                      lookup.disability_encoder)
+        tabulated = timed("lookup_ms", lookup.seat_type_bonus, sample, bus)
+        report["seat_type_agreement"] = round(float(np.mean(exact == tabulated)), 4)
+    if lookup.penalty_model is not None:
+        exact = timed("exact_ms", separation_penalty_tables, sample, bus, lookup.penalty_model,
+                      lookup.disability_encoder)
+        tabulated = timed("lookup_ms", lookup.penalty_tables, sample, bus)
+        errors = np.abs(np.stack([exact[p.id] - tabulated[p.id] for p in sample]))[:, :, 2:]
+        report["penalty_mae"] = round(float(errors.mean()), 4)
+        report["penalty_max_error"] = round(float(errors.max()), 4)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Accuracy of seat preference lookup tables vs the models.")
+    parser.add_argument("--layouts", default=LOOKUP_LAYOUTS, help="rows x cols shapes, e.g. 12x5,10x4")
+    parser.add_argument("--age-buckets", default=f"1,2,{LOOKUP_AGE_BUCKET},10", help="bucket widths in years")
+    parser.add_argument("--passengers", type=int, default=200, help="random passengers per layout")
+    parser.add_argument("--stub", action="store_true", help="use synthetic stub models instead of MODELS_DIR")
+    parser.add_argument("--json", help="write the report rows to this file")
+    args = parser.parse_args(argv)
+
+    if args.stub:
+        from .benchmark import make_stub_models
+        seat_type_model, penalty_model, disability_encoder = make_stub_models()
+    else:
+        from .solver_pool import load_global_models
+        models = load_global_models(MODELS_DIR)
+        seat_type_model, penalty_model = models["seat_type_model"], models["penalty_model"]
+        disability_encoder = models["disability_encoder"]
+    if disability_encoder is None or (seat_type_model is None and penalty_model is None):
+        print(f"[ERROR] No global models in {MODELS_DIR} (train them or use --stub)", file=sys.stderr)
+        return 1
+
+    rows_out = []
+    print(f"{'layout':>7} {'bucket':>6} {'build_s':>8} {'kb':>7} {'seat_agree':>10} {'pen_mae':>8} "
+          f"{'pen_max':>8} {'exact_ms':>9} {'lookup_ms':>9}")
+    for width in (int(w) for w in args.age_buckets.split(",")):
+        lookup = SeatPreferenceTables(seat_type_model, penalty_model, disability_encoder, directory=None,
+                                      age_bucket=width)
+        for rows, cols in parse_layouts(args.layouts):
+            started = time.perf_counter()
+            lookup.prepare(rows, cols)
+            build_s = time.perf_counter() - started
+            report = accuracy_report(lookup, rows, cols, passengers=args.passengers)
+            report["build_s"] = round(build_s, 2)
+            report["kb"] = round(sum(a.nbytes for a in lookup.tables(rows, cols).values()) / 1024.0)
+            rows_out.append(report)
+            print(f"{report['layout']:>7} {width:>6} {report['build_s']:>8} {report['kb']:>7} "
+                  f"{report.get('seat_type_agreement', '-'):>10} {report.get('penalty_mae', '-'):>8} "
+                  f"{report.get('penalty_max_error', '-'):>8} {report['exact_ms']:>9} {report['lookup_ms']:>9}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows_out, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+# ==============================================================================
+# FILE: metrics.py
+# PURPOSE: In-process counters/histograms, Prometheus text exposition,
+#          per-request stage timers and sampled profiling
+# ==============================================================================
+
+import os
+import time
+import uuid
+import random
+import bisect
+import cProfile
+import threading
+import contextlib
+
+try:
+    from pyinstrument import Profiler as _AsyncProfiler
+except ImportError:  # optional: only the solver stage is profiled without it
+    _AsyncProfiler = None
+
+# Server-Timing header on /allocate responses, fraction of requests profiled, where profiles go
+METRICS_TIMING_HEADERS = os.getenv("METRICS_TIMING_HEADERS", "0").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (100, 1000, 5000, 10000, 50000, 100000, 250000, 500000, 1000000)
+
+# -------------------- Metric Types --------------------
+
+def _label_str(labelnames, values):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labelnames, values)) + "}"
+
+def _fmt(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = tuple(str(labels[k]) for k in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_label_str(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[k]) for k in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def collect(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in items:
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                running += count
+                le = bound if bound == "+Inf" else _fmt(bound)
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames + ('le',), key + (le,))} {running}")
+            labels = _label_str(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_fmt(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {running}")
+        return lines
+
+class CallbackMetric:
+    """
+    Value read at scrape time: fn() -> number, or [(labels dict, number), ...].
+    """
+    def __init__(self, name, help, fn, kind="gauge"):
+        self.name, self.help, self.fn, self.kind = name, help, fn, kind
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"[WARN] metric {self.name} failed: {e}")
+            return lines
+        samples = value if isinstance(value, list) else [({}, value)]
+        for labels, v in samples:
+            if v is not None:
+                lines.append(f"{self.name}{_label_str(tuple(labels), tuple(labels.values()))} {_fmt(v)}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.collect()
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# -------------------- Engine Metrics --------------------
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "smartbus_stage_seconds", "Time spent per /allocate stage.", ("stage",)))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "smartbus_request_seconds", "End-to-end request latency.", ("endpoint",)))
+REQUESTS = REGISTRY.register(Counter(
+    "smartbus_requests_total", "Requests by endpoint and HTTP status.", ("endpoint", "code")))
+SOLVER_RUNS = REGISTRY.register(Counter(
+    "smartbus_solver_runs_total", "Allocations by engine and solver status.", ("engine", "status")))
+MILP_VARIABLES = REGISTRY.register(Histogram(
+    "smartbus_milp_variables", "Variables per MILP built.", buckets=SIZE_BUCKETS))
+MILP_CONSTRAINTS = REGISTRY.register(Histogram(
+    "smartbus_milp_constraints", "Constraints per MILP built.", buckets=SIZE_BUCKETS))
+OUTBOX_POST_SECONDS = REGISTRY.register(Histogram(
+    "smartbus_outbox_post_seconds", "Latency of POST /allocations from the outbox forwarder.", ("result",)))
+
+def record_solve(info):
+    """
+    Fold allocate_seating's info (engine, status, timings, model size) into the metrics.
+    """
+    SOLVER_RUNS.inc(engine=info.get("engine") or "none", status=info.get("status") or "unknown")
+    if info.get("variables") is not None:
+        MILP_VARIABLES.observe(info["variables"])
+        MILP_CONSTRAINTS.observe(info["constraints"])
+
+# -------------------- Per-request Timing --------------------
+
+class RequestTimer:
+    """
+    Collects stage durations for one request; record() feeds STAGE_SECONDS.
+    Stages measured elsewhere (e.g. in a solver process) are added with add().
+    """
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record(self):
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, stage=name)
+
+    def server_timing(self):
+        return ", ".join(f"{name};dur={seconds * 1000.0:.1f}" for name, seconds in self.stages.items())
+
+# -------------------- Sampled Profiling --------------------
+
+def should_profile():
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def profile_path(tag, suffix):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{tag}-{uuid.uuid4().hex[:8]}.{suffix}")
+
+@contextlib.contextmanager
+def profiled(path):
+    """
+    cProfile the current thread into path (pstats format). path=None -> no-op.
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            profiler.dump_stats(path)
+        except OSError as e:
+            print(f"[WARN] could not write profile {path}: {e}")
+
+@contextlib.contextmanager
+def profiled_request(tag, enabled):
+    """
+    Async-aware profile of a whole request (HTML) when pyinstrument is installed.
+    """
+    if not enabled or _AsyncProfiler is None:
+        yield
+        return
+    profiler = _AsyncProfiler(async_mode="enabled")
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        try:
+            with open(profile_path(tag, "html"), "w") as f:
+                f.write(profiler.output_html())
+        except OSError as e:
+            print(f"[WARN] could not write request profile: {e}")
@@ -1,36 +1,166 @@
 # ==============================================================================
 # FILE: ml_feedback_integration.py
-# PURPOSE: Backend integration hooks + personalization trainer
+# PURPOSE: Backend integration hooks (histories, allocations, training feedback)
 # ==============================================================================
 
 import os
-import requests
-import numpy as np
-from sklearn.linear_model import LinearRegression
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from .utils import TTLCache
 
 # Backend base URL (override with env var)
 BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://localhost:8080")
 
+# History fetching: pool size, overall deadline per request (s), cache bounds
+HISTORY_FETCH_WORKERS = int(os.getenv("HISTORY_FETCH_WORKERS", "16"))
+HISTORY_FETCH_DEADLINE = float(os.getenv("HISTORY_FETCH_DEADLINE", "3.0"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "300"))
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "10000"))
+# Training feedback rows requested per GET /feedback page (0 = one unpaginated call)
+FEEDBACK_PAGE_SIZE = int(os.getenv("FEEDBACK_PAGE_SIZE", "5000"))
+
+# ---------------- Records ----------------
+
+def feedback_key(record):
+    """
+    (timestamp, id) of a served feedback or history record, None where the
+    backend sends neither ("timestamp"/"createdAt" as ISO 8601 UTC, "id"/"_id").
+    """
+    return record.get("timestamp") or record.get("createdAt"), record.get("id") or record.get("_id")
+
+# ---------------- HTTP Session ----------------
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Shared keep-alive session; the pool is sized for concurrent history fetches.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HISTORY_FETCH_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
 # ---------------- Backend Hooks ----------------
 
-def fetch_passenger_history(passenger_id):
+history_cache = TTLCache(maxsize=HISTORY_CACHE_SIZE, ttl=HISTORY_CACHE_TTL)
+_history_pool = None
+_batch_unsupported_until = 0.0
+
+def _get_history(passenger_id, timeout=5):
     """
-    GET {BACKEND_BASE_URL}/histories/{passenger_id}
-    Expected response: list of dicts with keys: norm_row, norm_col, feedback_score
+    One GET /histories/{id}. Returns the list, or None if the call failed.
     """
     url = f"{BACKEND_BASE_URL}/histories/{passenger_id}"
     try:
-        resp = requests.get(url, timeout=5)
+        resp = get_session().get(url, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
-        return data if isinstance(data, list) else []
+        history = data if isinstance(data, list) else []
     except Exception as e:
         print(f"[WARN] fetch_passenger_history failed for {passenger_id}: {e}")
-        return []
+        return None
+    history_cache.set(passenger_id, history)
+    return history
 
-def send_allocation_to_backend(trip_id, vehicle, assignments_payload):
+def _get_histories_batch(passenger_ids, timeout):
     """
-    POST {BACKEND_BASE_URL}/allocations
+    GET /histories?ids=a,b,c -> { id: [records] }. Returns None when the backend
+    has no batch endpoint (remembered for HISTORY_CACHE_TTL) or the call failed.
+    """
+    global _batch_unsupported_until
+    if time.monotonic() < _batch_unsupported_until:
+        return None
+    url = f"{BACKEND_BASE_URL}/histories"
+    try:
+        resp = get_session().get(url, params={"ids": ",".join(passenger_ids)}, timeout=timeout)
+        if resp.status_code in (404, 405, 501):
+            _batch_unsupported_until = time.monotonic() + HISTORY_CACHE_TTL
+            return None
+        resp.raise_for_status()
+        data = resp.json()
+    except Exception as e:
+        print(f"[WARN] batch history fetch failed: {e}")
+        return None
+    if not isinstance(data, dict):
+        _batch_unsupported_until = time.monotonic() + HISTORY_CACHE_TTL
+        return None
+    histories = {}
+    for pid in passenger_ids:
+        if pid in data:
+            history = data[pid] if isinstance(data[pid], list) else []
+            history_cache.set(pid, history)
+            histories[pid] = history
+    return histories
+
+def _get_history_pool():
+    global _history_pool
+    with _session_lock:
+        if _history_pool is None:
+            _history_pool = ThreadPoolExecutor(max_workers=HISTORY_FETCH_WORKERS, thread_name_prefix="history")
+        return _history_pool
+
+def fetch_passenger_history(passenger_id):
+    """
+    GET {BACKEND_BASE_URL}/histories/{passenger_id}
+    Expected response: list of dicts with keys: norm_row, norm_col, feedback_score
+    (and, when the backend has them, id/_id and timestamp/createdAt; see feedback_key)
+    """
+    cached = history_cache.get(passenger_id)
+    if cached is not None:
+        return cached
+    return _get_history(passenger_id) or []
+
+def fetch_passenger_histories(passenger_ids, deadline=None):
+    """
+    Histories for many passengers: { passenger_id: [records] }.
+    Served from the TTL cache where possible, then the batch endpoint if the
+    backend has one, then concurrent per-id GETs over the shared pool. Anything
+    not back within the deadline (seconds, default HISTORY_FETCH_DEADLINE) is [].
+    """
+    deadline = HISTORY_FETCH_DEADLINE if deadline is None else deadline
+    started = time.monotonic()
+
+    def remaining():
+        return max(0.0, deadline - (time.monotonic() - started))
+
+    histories, missing = {}, []
+    for pid in dict.fromkeys(passenger_ids):
+        cached = history_cache.get(pid)
+        if cached is not None:
+            histories[pid] = cached
+        else:
+            missing.append(pid)
+    if not missing:
+        return histories
+
+    if len(missing) > 1:
+        batch = _get_histories_batch(missing, timeout=remaining())
+        if batch is not None:
+            histories.update(batch)
+            missing = [pid for pid in missing if pid not in batch]
+
+    futures = {_get_history_pool().submit(_get_history, pid, min(5, remaining())): pid for pid in missing}
+    done, _ = wait(futures, timeout=remaining())
+    for future, pid in futures.items():
+        history = future.result() if future in done else None
+        if future not in done:
+            print(f"[WARN] fetch_passenger_history timed out for {pid}")
+        histories[pid] = history or []
+    return histories
+
+def post_allocation(payload, timeout=8):
+    """
+    POST {BACKEND_BASE_URL}/allocations with one allocation payload; raises on
+    transport errors and non-2xx (the outbox forwarder decides whether to retry).
     Payload example:
     {
       "tripId": "...",
@@ -40,47 +170,30 @@ def send_allocation_to_backend(trip_id, vehicle, assignments_payload):
       ]
     }
     """
-    url = f"{BACKEND_BASE_URL}/allocations"
-    payload = {
-        "tripId": trip_id,
-        "vehicle": vehicle,
-        "assignments": assignments_payload
-    }
-    try:
-        resp = requests.post(url, json=payload, timeout=8)
-        resp.raise_for_status()
-    except Exception as e:
-        print(f"[WARN] send_allocation_to_backend failed: {e}")
+    resp = get_session().post(f"{BACKEND_BASE_URL}/allocations", json=payload, timeout=timeout)
+    resp.raise_for_status()
 
-def fetch_training_feedback(since=None):
+def iter_training_feedback(since=None, page_size=FEEDBACK_PAGE_SIZE, timeout=30):
     """
-    GET {BACKEND_BASE_URL}/feedback?since=YYYY-MM-DD
-    Expected response:
-      { "seattype": [(features, seat_type_str), ...],
-        "penalty":  [(features, feedback_score_float), ...] }
+    GET {BACKEND_BASE_URL}/feedback?since=YYYY-MM-DD&limit=N[&cursor=C], one page
+    at a time: yields { "seattype": [...], "penalty": [...], "watermark": str|None,
+    "nextCursor": str|None }. The next page is requested with the response's
+    "nextCursor"; backends that ignore since/limit/cursor (no watermark, no
+    nextCursor) return the whole history as one page.
+    Raises on errors, so a partial history is never taken for the whole one.
     """
     url = f"{BACKEND_BASE_URL}/feedback"
     params = {"since": since} if since else {}
-    try:
-        resp = requests.get(url, params=params, timeout=10)
+    if page_size:
+        params["limit"] = page_size
+    while True:
+        resp = get_session().get(url, params=params, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
-        return data if isinstance(data, dict) else {"seattype": [], "penalty": []}
-    except Exception as e:
-        print(f"[WARN] fetch_training_feedback failed: {e}")
-        return {"seattype": [], "penalty": []}
-
-# ---------------- Personalization ----------------
-
-def train_personalization_model(passenger_history):
-    """
-    Train per-passenger tiny regressor using normalized seat (row/col) -> feedback_score.
-    """
-    if not passenger_history or len(passenger_history) < 3:
-        return None
-    X = np.array([[rec['norm_row'], rec['norm_col']] for rec in passenger_history])
-    y = np.array([rec['feedback_score'] for rec in passenger_history])
-    model = LinearRegression()
-    model.fit(X, y)
-    return model
-
+        if not isinstance(data, dict):
+            raise ValueError("GET /feedback did not return an object")
+        yield {"seattype": data.get("seattype") or [], "penalty": data.get("penalty") or [],
+               "watermark": data.get("watermark"), "nextCursor": data.get("nextCursor")}
+        if not page_size or not data.get("nextCursor"):
+            return
+        params["cursor"] = data["nextCursor"]
@@ -0,0 +1,202 @@
+# ==============================================================================
+# FILE: model_registry.py
+# PURPOSE: Versioned global models for the API — watches MODELS_DIR for a newly
+#          published version, loads it in the background and swaps it in
+# ==============================================================================
+#
+# Requests take the active ModelSet once (current()) and hand its ref to the
+# solver jobs, so a request admitted before a swap finishes on the version it
+# started with. With solver processes, a new version is pre-loaded in every
+# worker (SolverPool.preload) before it is swapped in, and the API process only
+# reads its manifest; a worker still loads a version it lacks on its first job
+# (solver_pool._models_for). Compiled models and lookup tables are
+# memory-mapped, so every process serving a version shares the same pages.
+
+import os
+import json
+import time
+import threading
+from .solver_pool import MODELS_DIR, load_global_models, resolve_models
+from .compiled_models import COMPILED_MODELS_FILE
+from .lookup_tables import LOOKUP_TABLES_SUBDIR
+
+# Seconds between checks of MODELS_DIR for a new version (0 = no hot reload)
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "10"))
+
+def read_manifest(directory):
+    """
+    The training report of a published version (manifest.json), {} if none.
+    """
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+class ModelSet:
+    """
+    One loaded version: the load_global_models dict (None when only the
+    manifest was read) plus where and when it was loaded.
+    """
+    def __init__(self, version, directory, models, loaded_at, load_seconds, manifest=None):
+        self.version = version
+        self.directory = directory
+        self.models = models
+        self.loaded_at = loaded_at
+        self.load_seconds = load_seconds
+        self.manifest = manifest or {}
+
+    @property
+    def ref(self):
+        # what solver jobs carry: enough for a worker to load the same version
+        return (self.version, self.directory)
+
+    def info(self):
+        info = {
+            "version": self.version,
+            "loadedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.loaded_at)),
+            "loadSeconds": round(self.load_seconds, 3),
+            "mode": self.manifest.get("mode"),
+        }
+        if self.models is None:
+            # manifest only: report the files the workers load
+            def present(*names):
+                return any(os.path.exists(os.path.join(self.directory, name)) for name in names)
+            info.update({
+                "seat_type": present("seat_type_model.pkl", COMPILED_MODELS_FILE),
+                "penalty": present("penalty_model.pkl", COMPILED_MODELS_FILE),
+                "encoder": present("disability_encoder.pkl"),
+                "lookupTables": present(LOOKUP_TABLES_SUBDIR),
+            })
+        else:
+            info.update({
+                "seat_type": self.models["seat_type_model"] is not None,
+                "penalty": self.models["penalty_model"] is not None,
+                "encoder": self.models["disability_encoder"] is not None,
+                "lookupTables": self.models.get("lookup_tables") is not None,
+            })
+        return info
+
+class ModelRegistry:
+    """
+    The active ModelSet, replaced in one reference assignment when a new
+    version shows up. A version published through models/CURRENT is loaded
+    as soon as it is seen; bare model files (no CURRENT) are loaded once
+    their size/mtime stayed unchanged for one check, so a half-copied set is
+    never served. on_swap(model_set) runs after each swap.
+    load_models=False reads only the version and its manifest (the models
+    are loaded by the solver processes). preload(model_set), when given, runs
+    before a new version is swapped in (e.g. loading it in every worker); if
+    it raises, the version counts as failed and the active one stays.
+    """
+    def __init__(self, models_dir=MODELS_DIR, interval=MODEL_RELOAD_INTERVAL, on_swap=None, load_models=True,
+                 preload=None):
+        self.models_dir = models_dir
+        self.interval = interval
+        self.on_swap = on_swap
+        self.load_models = load_models
+        self.preload = preload
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self._active = None
+        self._seen = None
+        self._failed = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load(self, version, directory, preload=False):
+        started = time.perf_counter()
+        models = load_global_models(directory) if self.load_models else None
+        model_set = ModelSet(version, directory, models, time.time(), 0.0, read_manifest(directory))
+        if preload and self.preload:
+            self.preload(model_set)
+        model_set.load_seconds = time.perf_counter() - started
+        return model_set
+
+    def _swap(self, model_set):
+        with self._lock:
+            previous, self._active = self._active, model_set
+        if previous is not None:
+            self.reloads += 1
+            print(f"[INFO] Serving models {model_set.version} (was {previous.version}), "
+                  f"loaded in {model_set.load_seconds:.2f}s")
+        if self.on_swap:
+            self.on_swap(model_set)
+
+    def peek(self):
+        """
+        The active ModelSet, or None before the first load.
+        """
+        with self._lock:
+            return self._active
+
+    def current(self):
+        """
+        The active ModelSet; the first call loads the published version
+        (concurrent first calls wait for that one load).
+        """
+        active = self.peek()
+        if active is None:
+            with self._load_lock:
+                active = self.peek() or self.reload()
+        return active
+
+    def reload(self):
+        """
+        Load the published version now and make it active.
+        """
+        model_set = self._load(*resolve_models(self.models_dir))
+        self._swap(model_set)
+        return model_set
+
+    def check(self):
+        """
+        One watcher pass: load and swap in a newer version if there is one.
+        Returns True if the active version changed.
+        """
+        version, directory = resolve_models(self.models_dir)
+        active = self._active
+        if active is not None and version == active.version or version == self._failed:
+            return False
+        if directory == self.models_dir and version != self._seen:
+            self._seen = version  # unversioned files: wait until they settle
+            return False
+        try:
+            model_set = self._load(version, directory, preload=True)
+        except Exception as e:
+            # keep serving the active version; this one is retried only if it changes
+            self.failures += 1
+            self.last_error = f"{version}: {e}"
+            self._failed = version
+            print(f"[WARN] Could not load models {version}: {e}")
+            return False
+        self._swap(model_set)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[WARN] Model watcher error: {e}")
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="model-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self):
+        active = self.peek()
+        return {**(active.info() if active else {"version": None, "loaded": False}), "reloads": self.reloads,
+                "reloadFailures": self.failures, "lastError": self.last_error}
@@ -0,0 +1,195 @@
+# ==============================================================================
+# FILE: personalization_store.py
+# PURPOSE: Persistent per-passenger personalization (closed-form least squares)
+# ==============================================================================
+
+import os
+import time
+import json
+import sqlite3
+import threading
+import numpy as np
+from .ml_feedback_integration import feedback_key
+
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+PERSONALIZATION_DB = os.getenv("PERSONALIZATION_DB", os.path.join(MODELS_DIR, "personalization.sqlite"))
+MIN_HISTORY = 3  # records needed before a passenger gets a personal model
+
+# Sufficient statistics for y ~ b0 + b1*norm_row + b2*norm_col
+_STAT_COLUMNS = ("n", "s_r", "s_c", "s_y", "s_rr", "s_rc", "s_cc", "s_ry", "s_cy")
+
+# -------------------- Model --------------------
+
+class PersonalModel:
+    """
+    Two coefficients + intercept over (norm_row, norm_col); predict() mirrors
+    LinearRegression so it drops in wherever a personal model is expected.
+    """
+    def __init__(self, coef, intercept):
+        self.coef_ = np.asarray(coef, dtype=float)
+        self.intercept_ = float(intercept)
+
+    def predict(self, X):
+        return np.asarray(X, dtype=float) @ self.coef_ + self.intercept_
+
+def _history_stats(records):
+    X = np.array([[rec['norm_row'], rec['norm_col']] for rec in records], dtype=float).reshape(-1, 2)
+    y = np.array([rec['feedback_score'] for rec in records], dtype=float)
+    r, c = X[:, 0], X[:, 1]
+    return np.array([len(y), r.sum(), c.sum(), y.sum(),
+                     (r * r).sum(), (r * c).sum(), (c * c).sum(), (r * y).sum(), (c * y).sum()])
+
+def new_records(history, stored_count, last_seen, last_ids):
+    """
+    (records of history not folded in yet, rebuild). When every record has a
+    timestamp, those after last_seen, or at it with an id not in last_ids,
+    are new, so a backend serving a sliding window or re-sent rows is
+    handled; otherwise (or on the first keyed sync of an older row) history
+    is taken as append-only beyond stored_count. rebuild: history shrank,
+    refit it from scratch.
+    """
+    keys = [feedback_key(rec) for rec in history]
+    if last_seen is not None and all(ts is not None for ts, _ in keys):
+        ids = set(last_ids)
+        return [rec for rec, (ts, rid) in zip(history, keys)
+                if ts > last_seen or (ts == last_seen and rid is not None and rid not in ids)], False
+    if len(history) < stored_count:
+        return history, True
+    return history[stored_count:], False
+
+def advance_last_seen(last_seen, last_ids, records):
+    """
+    The newest timestamp over last_seen and records, with the ids of the
+    records at it; (None, []) when the records carry no timestamps.
+    """
+    ids = set(last_ids)
+    for rec in records:
+        ts, rid = feedback_key(rec)
+        if ts is None:
+            continue
+        if last_seen is None or ts > last_seen:
+            last_seen, ids = ts, set()
+        if ts == last_seen and rid is not None:
+            ids.add(rid)
+    return last_seen, sorted(ids) if last_seen is not None else []
+
+def solve_stats(stats):
+    """
+    Centered normal equations, minimum-norm solution like LinearRegression
+    (a passenger who always sat in one seat gets zero slopes).
+    Returns (coef, intercept) or None below MIN_HISTORY records.
+    """
+    n, s_r, s_c, s_y, s_rr, s_rc, s_cc, s_ry, s_cy = stats
+    if n < MIN_HISTORY:
+        return None
+    mean = np.array([s_r, s_c]) / n
+    sxx = np.array([[s_rr, s_rc], [s_rc, s_cc]]) - n * np.outer(mean, mean)
+    sxy = np.array([s_ry, s_cy]) - mean * s_y
+    w, V = np.linalg.eigh(sxx)
+    keep = w > 1e-9 * max(1.0, n)
+    coef = V[:, keep] @ ((V[:, keep].T @ sxy) / w[keep])
+    intercept = s_y / n - coef @ mean
+    return coef, intercept
+
+# -------------------- Store --------------------
+
+class PersonalizationStore:
+    """
+    SQLite table of per-passenger sufficient statistics + fitted coefficients,
+    with the newest record folded in (last_seen timestamp and the ids at it)
+    so each sync only adds records the store has not seen (new_records).
+    """
+    def __init__(self, path=PERSONALIZATION_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS personal_models ("
+            " passenger_id TEXT PRIMARY KEY, "
+            + ", ".join(f"{c} REAL NOT NULL" for c in _STAT_COLUMNS)
+            + ", coef_row REAL, coef_col REAL, intercept REAL, updated_at REAL, last_seen TEXT, last_ids TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(personal_models)")}
+        for column in ("last_seen", "last_ids"):
+            if column not in columns:  # stores written before records were tracked by timestamp
+                self._conn.execute(f"ALTER TABLE personal_models ADD COLUMN {column} TEXT")
+        self._conn.commit()
+
+    def _load_rows(self, passenger_ids):
+        rows = {}
+        ids = list(passenger_ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cur = self._conn.execute(
+                f"SELECT passenger_id, {', '.join(_STAT_COLUMNS)}, coef_row, coef_col, intercept, last_seen, last_ids "
+                f"FROM personal_models WHERE passenger_id IN ({', '.join('?' * len(chunk))})", chunk)
+            for row in cur:
+                rows[row[0]] = row[1:]
+        return rows
+
+    def sync(self, histories):
+        """
+        Fold new feedback from { passenger_id: history } into the store and
+        return { passenger_id: PersonalModel } for every passenger in histories
+        with enough data (stored models are used even if this fetch came back empty).
+        """
+        with self._lock:
+            rows = self._load_rows(histories.keys())
+            updates = []
+            for pid, history in histories.items():
+                if not history:
+                    continue
+                stored = rows.get(pid)
+                last_seen, last_ids = (stored[-2], json.loads(stored[-1] or "[]")) if stored else (None, [])
+                fresh, rebuild = new_records(history, int(stored[0]) if stored else 0, last_seen, last_ids)
+                if not fresh:
+                    continue
+                if rebuild or not stored:
+                    stats, last_seen, last_ids = _history_stats(fresh), None, []
+                else:
+                    stats = _history_stats(fresh) + np.array(stored[:len(_STAT_COLUMNS)])
+                last_seen, last_ids = advance_last_seen(last_seen, last_ids, history)
+                fit = solve_stats(stats)
+                coefs = (float(fit[0][0]), float(fit[0][1]), float(fit[1])) if fit else (None, None, None)
+                row = tuple(float(v) for v in stats) + coefs + (last_seen, json.dumps(last_ids))
+                rows[pid] = row
+                updates.append((pid,) + row[:-2] + (time.time(),) + row[-2:])
+            if updates:
+                placeholders = ", ".join("?" * (len(_STAT_COLUMNS) + 7))
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO personal_models (passenger_id, {', '.join(_STAT_COLUMNS)}, "
+                    f"coef_row, coef_col, intercept, updated_at, last_seen, last_ids) VALUES ({placeholders})",
+                    updates)
+                self._conn.commit()
+
+        models = {}
+        for pid, row in rows.items():
+            coef_row, coef_col, intercept = row[len(_STAT_COLUMNS):len(_STAT_COLUMNS) + 3]
+            if intercept is not None:
+                models[pid] = PersonalModel([coef_row, coef_col], intercept)
+        return models
+
+    def models(self, passenger_ids):
+        """
+        Stored PersonalModels for the given passengers (no update).
+        """
+        return self.sync({pid: [] for pid in passenger_ids})
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_personalization_store():
+    """
+    Process-wide store, opened lazily on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PersonalizationStore()
+        return _store
@@ -0,0 +1,239 @@
+# ==============================================================================
+# FILE: reallocation.py
+# PURPOSE: Incremental re-allocation of an existing trip (late bookings and
+#          cancellations) that keeps everyone else's seat
+# ==============================================================================
+
+import os
+import time
+import collections
+from .utils import seat_allowed
+from .scoring import score_problem, ProblemScores
+from .integrated_seat_ml_model import rides_overlap, optimize_seating_with_ml, build_assignment_details
+from .heuristic_allocator import SeatingObjective, improve_seating
+
+# fixed: seated passengers keep their seats; preferred: anyone may move, but
+# each kept seat earns REALLOCATE_STAY_BONUS (above any adjacency bonus).
+KEEP_POLICIES = ("fixed", "preferred")
+REALLOCATE_STAY_BONUS = float(os.getenv("REALLOCATE_STAY_BONUS", "10000"))
+# Blocking solo passengers allowed to move when new passengers do not fit as-is
+REALLOCATE_MAX_MOVABLE = int(os.getenv("REALLOCATE_MAX_MOVABLE", "8"))
+
+# -------------------- Insertion --------------------
+
+def _holders(passengers, chosen):
+    held = collections.defaultdict(list)
+    for p in passengers:
+        if p.id in chosen:
+            held[chosen[p.id]].append(p)
+    return held
+
+def _free_seats(passenger, bus, held):
+    """
+    Seats the passenger may take: zone rules, and no rider already holding the
+    seat for an overlapping part of the trip.
+    """
+    return {s.id for s in bus.seats
+            if seat_allowed(passenger, s) and not any(rides_overlap(passenger, q) for q in held[s.id])}
+
+def insert_passengers(free, bus, objective, chosen, held):
+    """
+    Seat each free passenger in turn on the free seat with the best marginal
+    objective (wheelchair users and groups first). With a single free
+    passenger this is the exact optimum. Updates chosen/held; False if stuck.
+    """
+    order = sorted(free, key=lambda p: (not p.requires_disability_zone, not p.group_id, str(p.group_id)))
+    for p in order:
+        best_seat, best_gain = None, None
+        for seat_id in sorted(_free_seats(p, bus, held), key=bus.seat_index.get):
+            gain = objective.move_delta(chosen, {p: seat_id})
+            if best_gain is None or gain > best_gain:
+                best_seat, best_gain = seat_id, gain
+        if best_seat is None:
+            return False
+        chosen[p.id] = best_seat
+        held[best_seat].append(p)
+    return True
+
+def warm_start_seating(passengers, bus, scores, previous, cohesion="pairwise", deadline=None):
+    """
+    A full seating grown from a previous one (e.g. a cached result for a
+    near-identical trip): previous seats still allowed and free are kept,
+    the other passengers inserted, then local search.
+    Returns (chosen, objective_value), or (None, None) if someone is stuck.
+    """
+    objective = SeatingObjective(passengers, bus, scores, cohesion)
+    chosen, held, free = {}, collections.defaultdict(list), []
+    for p in passengers:
+        seat = bus.seat_map.get(previous.get(p.id))
+        if seat is not None and seat_allowed(p, seat) and not any(rides_overlap(p, q) for q in held[seat.id]):
+            chosen[p.id] = seat.id
+            held[seat.id].append(p)
+        else:
+            free.append(p)
+    if not insert_passengers(free, bus, objective, chosen, held):
+        return None, None
+    allowed = {p.id: [s for s in bus.seats if seat_allowed(p, s)] for p in passengers}
+    chosen = improve_seating(passengers, bus, objective, allowed, chosen, deadline=deadline)
+    return chosen, objective.total(passengers, chosen)
+
+# -------------------- Re-allocation --------------------
+
+def _with_stay_bonus(scores, passengers, bus, previous):
+    seat_bonus = scores.seat_bonus.copy()
+    for i, p in enumerate(passengers):
+        if p.id in previous and previous[p.id] in bus.seat_index:
+            seat_bonus[i, bus.seat_index[previous[p.id]]] += REALLOCATE_STAY_BONUS
+    return ProblemScores(seat_bonus, scores.penalty_tables)
+
+def movable_blockers(new, passengers, bus, previous, held, limit=REALLOCATE_MAX_MOVABLE):
+    """
+    Up to limit seated passengers who sit where a new passenger is allowed to
+    sit and who have another free seat they could move to. Those who can move
+    to a seat no new passenger may take (e.g. female-only or accessible rows)
+    come first, then solo passengers before group members.
+    """
+    ranked = []
+    for p in passengers:
+        if p.id not in previous:
+            continue
+        seat = bus.seat_map[previous[p.id]]
+        if not any(seat_allowed(q, seat) for q in new):
+            continue
+        alternatives = _free_seats(p, bus, held)
+        if alternatives:
+            elsewhere = any(not seat_allowed(q, bus.seat_map[sid]) for sid in alternatives for q in new)
+            ranked.append((not elsewhere, bool(p.group_id), bus.seat_index[seat.id], p))
+    return [r[-1] for r in sorted(ranked, key=lambda r: r[:3])[:limit]]
+
+def reallocate_seating(passengers, bus, previous, seat_type_model=None, penalty_model=None, personal_models=None,
+                       disability_encoder=None, keep="fixed", time_limit=None, cohesion="pairwise", lookup_tables=None):
+    """
+    Re-seat a trip after passengers were added/removed. passengers is the new
+    passenger list; previous is { passenger_id: seat_id } of the prior allocation
+    (entries for removed passengers are ignored, passengers missing from it are new).
+    Returns (assignment_details, info) like allocate_seating, for all passengers;
+    info adds "moved" (ids of previously seated passengers whose seat changed),
+    "reoptimized" (passengers in the optimized subproblem) and "escalation".
+      - fixed: only new passengers are placed; members of the groups they join
+        are pinned to their seats so cohesion is scored. One new passenger is
+        placed by exact enumeration, several by a MILP over just the seats they
+        can take, warm-started with the insertion result. If they do not fit,
+        up to REALLOCATE_MAX_MOVABLE blocking passengers may also move
+        (escalation "neighbours"), then everyone (escalation "full", as preferred).
+      - preferred: full MILP where keeping the previous seat earns
+        REALLOCATE_STAY_BONUS, warm-started with the previous seating.
+    The objective covers the re-optimized passengers only (without stay bonuses).
+    """
+    if keep not in KEEP_POLICIES:
+        raise ValueError(f"Unknown keep policy: {keep}")
+    started = time.monotonic()
+    deadline = started + time_limit if time_limit else None
+    timings = {"scoring": 0.0, "model_build": 0.0, "cbc_solve": 0.0, "insertion": 0.0}
+    model_size = {"variables": None, "constraints": None}
+    previous = {p.id: previous[p.id] for p in passengers if p.id in previous}
+    new = [p for p in passengers if p.id not in previous]
+
+    def remaining():
+        return max(1.0, deadline - time.monotonic()) if deadline is not None else None
+
+    def score(model_passengers):
+        scoring_started = time.monotonic()
+        scores = score_problem(model_passengers, bus, seat_type_model, penalty_model, personal_models,
+                               disability_encoder, lookup_tables)
+        timings["scoring"] += time.monotonic() - scoring_started
+        return scores
+
+    def run_milp(model_passengers, milp_bus, scores, warm_start, allowed_seats=None):
+        milp_info = {}
+        details = optimize_seating_with_ml(model_passengers, milp_bus, cohesion=cohesion, scores=scores,
+                                           time_limit=remaining(), warm_start=warm_start,
+                                           allowed_seats=allowed_seats, solve_info=milp_info)
+        timings["model_build"] += milp_info.get("build_seconds", 0.0)
+        timings["cbc_solve"] += milp_info.get("solve_seconds", 0.0)
+        model_size["variables"] = milp_info.get("variables")
+        model_size["constraints"] = milp_info.get("constraints")
+        return {pid: d["seat_id"] for pid, d in details.items()}, milp_info
+
+    def insert(objective, chosen, held):
+        insertion_started = time.monotonic()
+        inserted = insert_passengers(new, bus, objective, chosen, held)
+        timings["insertion"] += time.monotonic() - insertion_started
+        return inserted
+
+    def fixed(movable=()):
+        touched = {p.group_id for p in (*new, *movable) if p.group_id}
+        movable_ids = {p.id for p in movable}
+        pinned = [p for p in passengers if p.id in previous and p.group_id in touched and p.id not in movable_ids]
+        in_model = {p.id for p in (*new, *pinned, *movable)}
+        model_passengers = [p for p in passengers if p.id in in_model]
+        if not new:
+            return model_passengers, {p.id: previous[p.id] for p in pinned}, None, "kept", "Optimal"
+        held = _holders([p for p in passengers if p.id not in in_model], previous)
+        allowed_seats = {p.id: _free_seats(p, bus, held) for p in (*new, *movable)}
+        allowed_seats.update({p.id: {previous[p.id]} for p in pinned})
+        scores = score(model_passengers)
+        objective = SeatingObjective(model_passengers, bus, scores, cohesion)
+
+        chosen = {p.id: previous[p.id] for p in (*pinned, *movable)}
+        for p in (*pinned, *movable):
+            held[previous[p.id]].append(p)
+        inserted = insert(objective, chosen, held)
+        if inserted and len(new) == 1 and not movable:
+            return model_passengers, chosen, objective, "insertion", "Optimal"
+
+        # MILP over the seats anyone in the subproblem can take, not the whole bus
+        seat_ids = sorted(set().union(*allowed_seats.values()), key=bus.seat_index.get)
+        sub_bus = bus.subset(seat_ids)
+        sub_scores = scores.subset(model_passengers, list(range(len(model_passengers))),
+                                   [bus.seat_index[sid] for sid in seat_ids])
+        if movable:
+            sub_scores = _with_stay_bonus(sub_scores, model_passengers, sub_bus, previous)
+        milp_chosen, milp_info = run_milp(model_passengers, sub_bus, sub_scores, chosen if inserted else None,
+                                          allowed_seats)
+        if len(milp_chosen) == len(model_passengers):
+            return model_passengers, milp_chosen, objective, "milp", milp_info["status"]
+        if inserted:
+            return model_passengers, chosen, objective, "insertion", "Feasible"
+        return None
+
+    def preferred():
+        scores = score(passengers)
+        objective = SeatingObjective(passengers, bus, scores, cohesion)
+        warm_start = dict(previous)
+        insert(objective, warm_start, _holders(passengers, previous))
+        milp_chosen, milp_info = run_milp(passengers, bus, _with_stay_bonus(scores, passengers, bus, previous), warm_start)
+        if len(milp_chosen) != len(passengers):
+            return None
+        return passengers, milp_chosen, objective, "milp", milp_info["status"]
+
+    result, escalation = None, None
+    if keep == "fixed":
+        result = fixed()
+        if result is None:
+            escalation = "neighbours"
+            blockers = movable_blockers(new, passengers, bus, previous, _holders(passengers, previous))
+            result = fixed(blockers) if blockers else None
+    if result is None:
+        escalation = "full" if keep == "fixed" else None
+        result = preferred()
+
+    info = {"engine": None, "status": "Infeasible", "objective": None, "moved": [], "reoptimized": 0,
+            "escalation": escalation}
+    details = {}
+    if result is not None:
+        model_passengers, chosen, objective, engine, status = result
+        seating = {p.id: previous[p.id] for p in passengers if p.id in previous}
+        seating.update(chosen)
+        details = build_assignment_details(passengers, bus, seating)
+        info.update({
+            "engine": engine,
+            "status": status,
+            "objective": objective.total(model_passengers, chosen) if objective is not None else 0.0,
+            "moved": [pid for pid, seat_id in previous.items() if seating[pid] != seat_id],
+            "reoptimized": len(model_passengers),
+        })
+    info["wall_time_ms"] = round((time.monotonic() - started) * 1000.0, 1)
+    info["timings"] = timings
+    info.update(model_size)
+    return details, info
@@ -0,0 +1,188 @@
+# ==============================================================================
+# FILE: result_cache.py
+# PURPOSE: Cache of solved allocations keyed by a canonical fingerprint of the
+#          optimization input (in-memory LRU + optional SQLite tier)
+# ==============================================================================
+#
+# Two requests with the same fingerprint are the same optimization problem:
+# same layout, passengers (attributes, group structure, stops), engine
+# settings, solver configuration (backend, symmetry merging, lookup table age
+# buckets, compiled models / lookup tables on or off), global model version
+# and personal models. A miss can still reuse
+# the cached seats of a near-identical trip on the same layout as a warm start.
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import collections
+from .utils import TTLCache
+
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+# In-memory entries (0 = no result cache) and how long a result stays valid (seconds)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1000"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", str(7 * 86400)))
+# Optional on-disk tier shared by restarts/processes, e.g. models/results.sqlite ("" = memory only)
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", "")
+# A cached trip on the same layout sharing at least this share of passengers seeds the warm start
+RESULT_CACHE_WARM_OVERLAP = float(os.getenv("RESULT_CACHE_WARM_OVERLAP", "0.8"))
+# Recent results per layout considered for warm starts
+RESULT_CACHE_NEAR = int(os.getenv("RESULT_CACHE_NEAR", "16"))
+
+# -------------------- Fingerprint --------------------
+
+def _personal_state(model):
+    return [float(c) for c in model.coef_] + [float(model.intercept_)]
+
+def problem_fingerprint(passengers, layout, personal_models=None, model_version=None, mode="exact", time_limit=None,
+                        config=None):
+    """
+    (fingerprint, layout key). Passengers are taken in id order and groups
+    are named after their first member id, so input order and group labels
+    do not matter. config: { setting: value } of the process settings that
+    change the result (solver_pool.solver_config()).
+    """
+    group_name = {}
+    for p in sorted(passengers, key=lambda p: p.id):
+        if p.group_id is not None:
+            group_name.setdefault(p.group_id, p.id)
+    personal_models = personal_models or {}
+    layout_key = json.dumps(layout, sort_keys=True, separators=(",", ":"))
+    canonical = {
+        "layout": layout_key,
+        "mode": mode,
+        "timeLimit": time_limit,
+        "models": model_version,
+        "config": config or {},
+        "passengers": [
+            [p.id, p.age, p.gender, p.disability, group_name.get(p.group_id), p.source_stop, p.dest_stop,
+             _personal_state(personal_models[p.id]) if p.id in personal_models else None]
+            for p in sorted(passengers, key=lambda p: p.id)
+        ],
+    }
+    text = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode()).hexdigest(), layout_key
+
+# -------------------- Cache --------------------
+
+class ResultCache:
+    """
+    fingerprint -> { "seats": { passenger_id: seat_id }, "solver": {...},
+    "predicted": { passenger_id: predicted seat type } }.
+    Lookups try memory, then the SQLite tier (if configured); near() finds a
+    warm start among recent results for the same layout.
+    """
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, path=RESULT_CACHE_DB):
+        self.enabled = maxsize > 0
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=max(1, maxsize), ttl=ttl)
+        self._recent = collections.defaultdict(lambda: collections.deque(maxlen=RESULT_CACHE_NEAR))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        if self.enabled and path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, layout TEXT NOT NULL, entry TEXT NOT NULL, created_at REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_layout ON results (layout, created_at)")
+            self._conn.commit()
+
+    def peek(self, key):
+        """
+        Like get() without counting a hit or miss.
+        """
+        if not self.enabled:
+            return None
+        entry = self._memory.get(key)
+        if entry is None and self._conn is not None:
+            with self._lock:
+                row = self._conn.execute("SELECT entry FROM results WHERE key = ? AND created_at >= ?",
+                                         (key, time.time() - self.ttl)).fetchone()
+            if row is not None:
+                entry = json.loads(row[0])
+                self._memory.set(key, entry)
+        return entry
+
+    def get(self, key):
+        entry = self.peek(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key, layout_key, seats, solver, predicted=None):
+        if not self.enabled:
+            return
+        entry = {"seats": seats, "solver": solver, "predicted": predicted or {}}
+        self._memory.set(key, entry)
+        now = time.time()
+        with self._lock:
+            self._recent[layout_key].append((key, seats))
+            if self._conn is not None:
+                try:
+                    self._conn.execute("INSERT OR REPLACE INTO results (key, layout, entry, created_at) VALUES (?, ?, ?, ?)",
+                                       (key, layout_key, json.dumps(entry), now))
+                    self._conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl,))
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    print(f"[WARN] Result cache write failed: {e}")
+
+    def near(self, layout_key, passenger_ids):
+        """
+        Seats ({ passenger_id: seat_id }, only passengers in passenger_ids) of
+        the recent result on this layout sharing the most passengers, if it
+        shares at least RESULT_CACHE_WARM_OVERLAP of them; else None.
+        Mode, time limit and config are not compared: any feasible seating
+        of the same layout is a usable warm start, whichever engine produced
+        it (the solver still checks it against this trip's rules).
+        """
+        if not self.enabled or not passenger_ids:
+            return None
+        with self._lock:
+            candidates = [seats for _, seats in self._recent.get(layout_key, ())]
+            if self._conn is not None:
+                rows = self._conn.execute(
+                    "SELECT entry FROM results WHERE layout = ? AND created_at >= ? ORDER BY created_at DESC LIMIT ?",
+                    (layout_key, time.time() - self.ttl, RESULT_CACHE_NEAR)).fetchall()
+                candidates += [json.loads(row[0])["seats"] for row in rows]
+        wanted = set(passenger_ids)
+        best, best_overlap = None, 0.0
+        for seats in candidates:
+            overlap = len(wanted & seats.keys()) / max(len(wanted), len(seats))
+            if overlap > best_overlap:
+                best, best_overlap = seats, overlap
+        if best is None or best_overlap < RESULT_CACHE_WARM_OVERLAP:
+            return None
+        return {pid: seat_id for pid, seat_id in best.items() if pid in wanted}
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._memory._data),
+                "disk": self._conn is not None}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """
+    Process-wide cache, created lazily on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
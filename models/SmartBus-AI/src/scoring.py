@@ -0,0 +1,258 @@
+# ==============================================================================
+# FILE: scoring.py
+# PURPOSE: Batched ML scoring for the optimizer (one model call per request)
+# ==============================================================================
+
+import collections
+import numpy as np
+from .utils import group_passengers
+
+SEAT_TYPE_BONUS = 50.0
+PERSONAL_BONUS_SCALE = 100.0
+MAX_PENALTY = 5.0
+
+# -------------------- Feature Blocks --------------------
+
+def encode_disabilities(passengers, disability_encoder):
+    """
+    One-hot disability rows for all passengers, encoded once per passenger.
+    Falls back to an all-zero row for values the encoder rejects.
+    """
+    width = len(disability_encoder.categories_[0]) if hasattr(disability_encoder, 'categories_') else 1
+    try:
+        return np.asarray(disability_encoder.transform([[p.disability] for p in passengers]).toarray(), dtype=float)
+    except Exception:
+        rows = []
+        for p in passengers:
+            try:
+                rows.append(disability_encoder.transform([[p.disability]]).toarray()[0])
+            except Exception:
+                rows.append([0] * width)
+        return np.asarray(rows, dtype=float).reshape(len(passengers), width)
+
+def profile_features(passengers, in_group=None):
+    """
+    Per-passenger [is_priority, is_female, is_in_group, age] block. Shape (P, 4).
+    in_group overrides the group flag for every row when given.
+    """
+    return np.array([
+        [int(p.is_disabled or p.age >= 60),
+         int(str(p.gender).lower() == 'female'),
+         int(p.group_id is not None) if in_group is None else in_group,
+         p.age]
+        for p in passengers
+    ], dtype=float).reshape(len(passengers), 4)
+
+def seat_type_features(profile, onehot, coords):
+    """
+    Seat type model rows for every (profile, seat) pair, profile-major:
+    [is_priority, is_female, is_in_group, age, norm_row, norm_col, one-hot...].
+    """
+    n_s = len(coords)
+    return np.hstack([
+        np.repeat(profile, n_s, axis=0),
+        np.tile(coords, (len(profile), 1)),
+        np.repeat(onehot, n_s, axis=0),
+    ])
+
+def penalty_features(profile, onehot, coords, dists):
+    """
+    Penalty model rows for every (profile, seat, distance) triple, in that
+    order: the seat type columns with group_distance before the one-hot.
+    """
+    rows_per_profile = len(coords) * len(dists)
+    return np.hstack([
+        np.repeat(profile, rows_per_profile, axis=0),
+        np.tile(np.repeat(coords, len(dists), axis=0), (len(profile), 1)),
+        np.tile(dists, len(profile) * len(coords)).reshape(-1, 1),
+        np.repeat(onehot, rows_per_profile, axis=0),
+    ])
+
+# -------------------- Score Tensors --------------------
+
+def seat_type_bonus_matrix(passengers, bus, seat_type_model, disability_encoder):
+    """
+    (P, S) bonus for seating passenger i in seat j when the global model's
+    preferred seat type matches the seat. One predict_proba for the whole grid.
+    """
+    n_p, n_s = len(passengers), len(bus.seats)
+    bonus = np.zeros((n_p, n_s))
+    if not passengers or not seat_type_model or not disability_encoder:
+        return bonus
+
+    X = seat_type_features(profile_features(passengers), encode_disabilities(passengers, disability_encoder),
+                           bus.norm_coords)
+
+    try:
+        probs = seat_type_model.predict_proba(X)
+        preferred = np.asarray(seat_type_model.classes_)[np.argmax(probs, axis=1)]
+    except Exception:
+        try:
+            preferred = np.asarray(seat_type_model.predict(X))
+        except Exception:
+            return bonus
+
+    matches = preferred.astype(object).reshape(n_p, n_s) == bus.seat_types[None, :]
+    bonus[matches] = SEAT_TYPE_BONUS
+    return bonus
+
+def predicted_seat_types(passengers, bus, seat_ids, seat_type_model=None, disability_encoder=None, lookup_tables=None):
+    """
+    The global model's preferred seat type for each passenger in the seat
+    they were given (seat_ids), one prediction for all of them; None entries
+    without a model.
+    """
+    if not passengers or not seat_type_model or not disability_encoder:
+        return [None] * len(passengers)
+    idx = np.array([bus.seat_index[s] for s in seat_ids], dtype=int)
+    preferred = lookup_tables.preferred_seat_types(passengers, bus, idx) if lookup_tables is not None else None
+    if preferred is None:
+        X = np.hstack([profile_features(passengers), bus.norm_coords[idx],
+                       encode_disabilities(passengers, disability_encoder)])
+        try:
+            probs = seat_type_model.predict_proba(X)
+            preferred = np.asarray(seat_type_model.classes_)[np.argmax(probs, axis=1)]
+        except Exception:
+            try:
+                preferred = np.asarray(seat_type_model.predict(X))
+            except Exception:
+                return [None] * len(passengers)
+    return [str(t) for t in preferred]
+
+def separation_penalty_tables(members, bus, penalty_model, disability_encoder, keys=None):
+    """
+    Per-member penalty per unit of distance for group separation:
+      { passenger_id: array (S, max_dist + 1) }
+    Entry [j, d] is the penalty for the member sitting in seat j with a
+    group-mate d seats away (only d > 1 is scored). One predict for all rows.
+    keys, one per member, replaces the passenger ids as dict keys.
+    """
+    if not members or not penalty_model or not disability_encoder:
+        return {}
+    keys = [p.id for p in members] if keys is None else keys
+
+    max_dist = (bus.rows - 1) + (bus.cols - 1)
+    dists = np.arange(2, max_dist + 1, dtype=float)
+    n_m, n_s, n_d = len(members), len(bus.seats), len(dists)
+    if n_d == 0:
+        return {key: np.zeros((n_s, max_dist + 1)) for key in keys}
+
+    X = penalty_features(profile_features(members, in_group=1), encode_disabilities(members, disability_encoder),
+                         bus.norm_coords, dists)
+
+    try:
+        predicted = np.asarray(penalty_model.predict(X), dtype=float)
+        penalties = np.maximum(0.0, MAX_PENALTY - predicted)
+    except Exception:
+        penalties = np.full(X.shape[0], MAX_PENALTY)
+
+    penalties = penalties.reshape(n_m, n_s, n_d)
+    tables = {}
+    for i, key in enumerate(keys):
+        table = np.zeros((n_s, max_dist + 1))
+        table[:, 2:] = penalties[i]
+        tables[key] = table
+    return tables
+
+def personal_bonus_matrix(passengers, bus, personal_models):
+    """
+    (P, S) bonus from each passenger's linear personal model, computed for all
+    passengers and seats as one matrix product against the seat coordinates.
+    Models without coef_/intercept_ fall back to one predict per passenger.
+    """
+    bonus = np.zeros((len(passengers), len(bus.seats)))
+    if not personal_models:
+        return bonus
+    coords = bus.norm_coords
+    weights = np.zeros((len(passengers), 3))
+    linear = np.zeros(len(passengers), dtype=bool)
+    for i, p in enumerate(passengers):
+        personal_model = personal_models.get(p.id)
+        if not personal_model:
+            continue
+        try:
+            weights[i, :2] = np.asarray(personal_model.coef_, dtype=float).ravel()[:2]
+            weights[i, 2] = float(personal_model.intercept_)
+            linear[i] = True
+        except (AttributeError, TypeError, ValueError):
+            try:
+                scores = np.asarray(personal_model.predict(coords), dtype=float)
+                bonus[i] = np.maximum(0.0, scores - 3.0) * PERSONAL_BONUS_SCALE
+            except Exception:
+                pass
+    if linear.any():
+        scores = weights[linear] @ np.hstack([coords, np.ones((len(coords), 1))]).T
+        bonus[linear] = np.maximum(0.0, scores - 3.0) * PERSONAL_BONUS_SCALE
+    return bonus
+
+# -------------------- Problem Scores --------------------
+
+class ProblemScores:
+    def __init__(self, seat_bonus, penalty_tables=None):
+        self.seat_bonus = seat_bonus            # (P, S), passengers/seats in input order
+        self.penalty_tables = penalty_tables    # { passenger_id: (S, max_dist + 1) } or None
+
+    def subset(self, passengers, passenger_rows, seat_idx):
+        """
+        Scores restricted to some passengers (their rows in seat_bonus) and
+        seats (indices into the full layout), matching BusLayout.subset.
+        """
+        seat_bonus = self.seat_bonus[np.ix_(passenger_rows, seat_idx)]
+        penalty_tables = None
+        if self.penalty_tables is not None:
+            penalty_tables = {p.id: self.penalty_tables[p.id][seat_idx]
+                              for p in passengers if p.id in self.penalty_tables}
+        return ProblemScores(seat_bonus, penalty_tables)
+
+def score_problem(passengers, bus, seat_type_model=None, penalty_model=None, personal_models=None, disability_encoder=None,
+                  lookup_tables=None):
+    """
+    All ML terms of the objective for one request, shared by every engine.
+    """
+    return score_problems([(passengers, bus)], seat_type_model, penalty_model, personal_models, disability_encoder,
+                          lookup_tables)[0]
+
+def score_problems(problems, seat_type_model=None, penalty_model=None, personal_models=None, disability_encoder=None,
+                   lookup_tables=None):
+    """
+    score_problem for many (passengers, bus) problems, e.g. a day's trips:
+    problems sharing a layout object are scored together, one model call per
+    layout and term instead of one per problem. Returns [ProblemScores].
+    lookup_tables (SeatPreferenceTables): layouts it has tabulated are scored
+    by per-profile table lookups instead of model calls.
+    """
+    by_layout = collections.defaultdict(list)
+    for k, (_, bus) in enumerate(problems):
+        by_layout[id(bus)].append(k)
+
+    results = [None] * len(problems)
+    for ks in by_layout.values():
+        bus = problems[ks[0]][1]
+        pooled = [p for k in ks for p in problems[k][0]]
+        seat_bonus = np.zeros((len(pooled), len(bus.seats)))
+        if seat_type_model and disability_encoder:
+            bonus = lookup_tables.seat_type_bonus(pooled, bus) if lookup_tables is not None else None
+            if bonus is None:
+                bonus = seat_type_bonus_matrix(pooled, bus, seat_type_model, disability_encoder)
+            seat_bonus += bonus
+        seat_bonus += personal_bonus_matrix(pooled, bus, personal_models or {})
+
+        penalty_tables = None
+        if penalty_model and disability_encoder:
+            # groups are per problem: group and passenger ids may repeat across trips
+            keyed = [((k, p.id), p) for k in ks for group in group_passengers(problems[k][0]).values()
+                     for p in group[:-1]]
+            keys, members = [key for key, _ in keyed], [p for _, p in keyed]
+            penalty_tables = lookup_tables.penalty_tables(members, bus, keys) if lookup_tables is not None else None
+            if penalty_tables is None:
+                penalty_tables = separation_penalty_tables(members, bus, penalty_model, disability_encoder, keys)
+
+        offset = 0
+        for k in ks:
+            passengers = problems[k][0]
+            tables = None
+            if penalty_tables is not None:
+                tables = {p.id: penalty_tables[(k, p.id)] for p in passengers if (k, p.id) in penalty_tables}
+            results[k] = ProblemScores(seat_bonus[offset:offset + len(passengers)], tables)
+            offset += len(passengers)
+    return results
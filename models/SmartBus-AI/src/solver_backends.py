@@ -0,0 +1,379 @@
+# ==============================================================================
+# FILE: solver_backends.py
+# PURPOSE: MILPs as sparse arrays (objective vector + CSR constraint matrix)
+#          and pluggable backends to solve them: CBC (PuLP), HiGHS, CP-SAT
+# ==============================================================================
+#
+#   maximize c @ x   s.t.   row_lower <= A @ x <= row_upper,   lower <= x <= upper,
+#                           x[k] integer where integrality[k]
+#
+# Backends:
+#   cbc    PuLP + CBC subprocess (always available, default)
+#   highs  HiGHS in-process: highspy if installed, else scipy.optimize.milp
+#          (threads and MIP starts need highspy)
+#   cpsat  OR-Tools CP-SAT (ortools); every variable must have integral
+#          optimal values and finite bounds, objective scaled to integers
+#
+# Statuses: Optimal (proven), Feasible (incumbent when the time limit or gap
+# stopped the search), TimeLimit (stopped before any solution), Infeasible,
+# Unbounded, Not Solved. A feasible warm start is the incumbent of last resort.
+
+import os
+import sys
+import threading
+import functools
+import contextlib
+import importlib
+import numpy as np
+
+# Engine for seat MILPs: cbc, highs or cpsat (falls back to cbc if not installed)
+MILP_BACKEND = os.getenv("MILP_BACKEND", "cbc")
+# Solver threads per MILP (CBC, highspy, CP-SAT workers)
+MILP_THREADS = int(os.getenv("MILP_THREADS", "1"))
+# Stop at this relative gap to the best bound (0 = prove optimality)
+MILP_GAP = float(os.getenv("MILP_GAP", "0")) or None
+# CP-SAT needs integer objective coefficients: objective * scale, rounded
+CPSAT_OBJECTIVE_SCALE = float(os.getenv("CPSAT_OBJECTIVE_SCALE", "1000"))
+
+MILP_BACKENDS = ("cbc", "highs", "cpsat")
+_warned_fallback = set()
+# Tolerance for checking a warm start against bounds, rows and integrality
+FEASIBILITY_TOL = 1e-6
+
+@functools.lru_cache(maxsize=None)
+def _optional(module, attr=None):
+    """
+    A solver library (or one of its attributes), imported on first use so
+    importing the API does not pay for it; None if not installed.
+    """
+    try:
+        loaded = importlib.import_module(module)
+    except ImportError:
+        return None
+    return getattr(loaded, attr, None) if attr else loaded
+
+# -------------------- Model --------------------
+
+class SparseMILP:
+    """
+    A maximization MILP as arrays; A is given by CSR (data, indices, indptr).
+    """
+    def __init__(self, c, data, indices, indptr, row_lower, row_upper, lower, upper, integrality):
+        self.c = np.asarray(c, dtype=float)
+        self.data = np.asarray(data, dtype=float)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.row_lower = np.asarray(row_lower, dtype=float)
+        self.row_upper = np.asarray(row_upper, dtype=float)
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        self.integrality = np.asarray(integrality, dtype=bool)
+
+    @property
+    def num_vars(self):
+        return len(self.c)
+
+    @property
+    def num_rows(self):
+        return len(self.row_lower)
+
+    def rows(self):
+        """
+        (columns, coefficients, lower, upper) per constraint row.
+        """
+        for r in range(self.num_rows):
+            span = slice(self.indptr[r], self.indptr[r + 1])
+            yield self.indices[span], self.data[span], self.row_lower[r], self.row_upper[r]
+
+class MILPBuilder:
+    """
+    Collects variable blocks and constraint row blocks as arrays; build()
+    concatenates them into a SparseMILP.
+    """
+    def __init__(self):
+        self.num_vars = 0
+        self._vars = []   # (cost, lower, upper, integer) per block
+        self._rows = []   # (cols (R, L), coefs (R, L), lower (R,), upper (R,)) per block
+
+    def add_vars(self, count, cost=0.0, lower=0.0, upper=1.0, integer=True):
+        """
+        Add count variables; returns their indices.
+        """
+        index = np.arange(self.num_vars, self.num_vars + count)
+        self._vars.append((np.broadcast_to(np.asarray(cost, dtype=float), (count,)),
+                           np.broadcast_to(np.asarray(lower, dtype=float), (count,)),
+                           np.broadcast_to(np.asarray(upper, dtype=float), (count,)),
+                           np.broadcast_to(np.asarray(integer, dtype=bool), (count,))))
+        self.num_vars += count
+        return index
+
+    def add_rows(self, cols, coefs, lower=-np.inf, upper=np.inf):
+        """
+        Add R rows of L terms each: lower <= sum(coefs[r] * x[cols[r]]) <= upper.
+        Negative cols stand for variables that were never created (fixed at 0):
+        their terms are left out, and a row left empty is dropped when 0 satisfies it.
+        """
+        cols = np.atleast_2d(np.asarray(cols, dtype=np.int64))
+        coefs = np.broadcast_to(np.asarray(coefs, dtype=float), cols.shape)
+        lower = np.broadcast_to(np.asarray(lower, dtype=float), (len(cols),))
+        upper = np.broadcast_to(np.asarray(upper, dtype=float), (len(cols),))
+        present = cols >= 0
+        counts = present.sum(axis=1)
+        keep = (counts > 0) | (lower > 0) | (upper < 0)
+        if keep.any():
+            present = present[keep]
+            self._rows.append((cols[keep][present], coefs[keep][present], counts[keep], lower[keep], upper[keep]))
+
+    def build(self):
+        def cat(parts, dtype):
+            return np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype)
+        return SparseMILP(
+            c=cat([v[0] for v in self._vars], float),
+            data=cat([r[1] for r in self._rows], float),
+            indices=cat([r[0] for r in self._rows], np.int64),
+            indptr=np.concatenate([[0], np.cumsum(cat([r[2] for r in self._rows], np.int64))]).astype(np.int64),
+            row_lower=cat([r[3] for r in self._rows], float),
+            row_upper=cat([r[4] for r in self._rows], float),
+            lower=cat([v[1] for v in self._vars], float),
+            upper=cat([v[2] for v in self._vars], float),
+            integrality=cat([v[3] for v in self._vars], bool),
+        )
+
+class MILPResult:
+    """
+    status: see the statuses above; x is None unless a feasible solution was found.
+    """
+    def __init__(self, status, x=None, optimal=False, backend=None):
+        self.status = status
+        self.x = x
+        self.optimal = optimal
+        self.backend = backend
+
+    @property
+    def feasible(self):
+        return self.x is not None
+
+def _result(x, optimal, stopped, infeasible=False, unbounded=False):
+    """
+    MILPResult with the status for a solver outcome: x found or not, proven
+    optimal, stopped by the time limit.
+    """
+    if x is not None:
+        return MILPResult("Optimal" if optimal else "Feasible", x, optimal)
+    if infeasible:
+        return MILPResult("Infeasible")
+    if unbounded:
+        return MILPResult("Unbounded")
+    return MILPResult("TimeLimit" if stopped else "Not Solved")
+
+def start_is_feasible(problem, start):
+    """
+    Whether start satisfies the bounds, rows and integrality of problem.
+    """
+    start = np.asarray(start, dtype=float)
+    if start.shape != (problem.num_vars,):
+        return False
+    if ((start < problem.lower - FEASIBILITY_TOL) | (start > problem.upper + FEASIBILITY_TOL)).any():
+        return False
+    if (np.abs(start - np.rint(start))[problem.integrality] > FEASIBILITY_TOL).any():
+        return False
+    row_of = np.repeat(np.arange(problem.num_rows), np.diff(problem.indptr))
+    activity = np.bincount(row_of, weights=problem.data * start[problem.indices], minlength=problem.num_rows)
+    return bool(((activity >= problem.row_lower - FEASIBILITY_TOL) & (activity <= problem.row_upper + FEASIBILITY_TOL)).all())
+
+# In-process solvers print some messages straight to fd 1 even when silenced;
+# while any of them runs, fd 1 points at stderr so stdout (e.g. NDJSON from
+# batch_allocate) stays clean.
+_stdout_lock = threading.Lock()
+_stdout_users = 0
+_stdout_saved = None
+
+@contextlib.contextmanager
+def _solver_stdout_to_stderr():
+    global _stdout_users, _stdout_saved
+    with _stdout_lock:
+        if _stdout_users == 0:
+            try:
+                sys.stdout.flush()
+                _stdout_saved = os.dup(1)
+                os.dup2(2, 1)
+            except (OSError, ValueError):
+                _stdout_saved = None
+        _stdout_users += 1
+    try:
+        yield
+    finally:
+        with _stdout_lock:
+            _stdout_users -= 1
+            if _stdout_users == 0 and _stdout_saved is not None:
+                os.dup2(_stdout_saved, 1)
+                os.close(_stdout_saved)
+                _stdout_saved = None
+
+# -------------------- Backends --------------------
+
+def _bound(value):
+    return None if not np.isfinite(value) else float(value)
+
+def _solve_cbc(problem, time_limit, threads, gap, warm_start, relax):
+    import pulp
+    model = pulp.LpProblem("SeatAllocation_ML", pulp.LpMaximize)
+    x = [pulp.LpVariable(f"x{k}", lowBound=_bound(lo), upBound=_bound(up),
+                         cat="Integer" if integer and not relax else "Continuous")
+         for k, (lo, up, integer) in enumerate(zip(problem.lower, problem.upper, problem.integrality))]
+    nonzero = np.flatnonzero(problem.c)
+    model += pulp.LpAffineExpression([(x[k], float(problem.c[k])) for k in nonzero.tolist()])
+    for r, (cols, coefs, lo, up) in enumerate(problem.rows()):
+        expr = pulp.LpAffineExpression([(x[k], v) for k, v in zip(cols.tolist(), coefs.tolist())])
+        if lo == up:
+            model += pulp.LpConstraint(expr, pulp.LpConstraintEQ, f"r{r}", float(up))
+            continue
+        if np.isfinite(up):
+            model += pulp.LpConstraint(expr, pulp.LpConstraintLE, f"r{r}", float(up))
+        if np.isfinite(lo):
+            model += pulp.LpConstraint(expr, pulp.LpConstraintGE, f"r{r}_lo", float(lo))
+    if warm_start is not None:
+        for var, value in zip(x, warm_start.tolist()):
+            var.setInitialValue(value)
+    model.solve(pulp.PULP_CBC_CMD(msg=0, timeLimit=time_limit, threads=threads if threads > 1 else None,
+                                  gapRel=gap, warmStart=warm_start is not None, mip=not relax))
+    # LpStatus says "Optimal" for a time-limited incumbent too; sol_status tells them apart
+    found = model.sol_status in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible)
+    values = np.array([var.varValue or 0.0 for var in x]) if found else None
+    return _result(values, model.sol_status == pulp.LpSolutionOptimal,
+                   stopped=bool(time_limit) and model.status == pulp.LpStatusNotSolved,
+                   infeasible=model.sol_status == pulp.LpSolutionInfeasible,
+                   unbounded=model.sol_status == pulp.LpSolutionUnbounded)
+
+def _solve_highspy(problem, time_limit, threads, gap, warm_start, relax):
+    highspy = _optional("highspy")
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", False)
+    if threads > 1:
+        h.setOptionValue("threads", threads)
+    if time_limit:
+        h.setOptionValue("time_limit", float(time_limit))
+    if gap:
+        h.setOptionValue("mip_rel_gap", float(gap))
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = problem.num_vars, problem.num_rows
+    lp.sense_ = highspy.ObjSense.kMaximize
+    lp.col_cost_, lp.col_lower_, lp.col_upper_ = problem.c, problem.lower, problem.upper
+    lp.row_lower_, lp.row_upper_ = problem.row_lower, problem.row_upper
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.start_, lp.a_matrix_.index_, lp.a_matrix_.value_ = problem.indptr, problem.indices, problem.data
+    if not relax:
+        lp.integrality_ = [highspy.HighsVarType.kInteger if integer else highspy.HighsVarType.kContinuous
+                           for integer in problem.integrality]
+    h.passModel(lp)
+    if warm_start is not None and not relax:
+        solution = highspy.HighsSolution()
+        solution.col_value = warm_start.tolist()
+        h.setSolution(solution)
+    with _solver_stdout_to_stderr():
+        h.run()
+    model_status = h.getModelStatus()
+    found = h.getInfo().primal_solution_status == 2  # kSolutionStatusFeasible
+    return _result(np.array(h.getSolution().col_value) if found else None,
+                   model_status == highspy.HighsModelStatus.kOptimal,
+                   stopped=model_status == highspy.HighsModelStatus.kTimeLimit,
+                   infeasible=model_status == highspy.HighsModelStatus.kInfeasible,
+                   unbounded=model_status == highspy.HighsModelStatus.kUnbounded)
+
+def _solve_scipy_highs(problem, time_limit, threads, gap, warm_start, relax):
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    from scipy.sparse import csr_array
+    matrix = csr_array((problem.data, problem.indices, problem.indptr), shape=(problem.num_rows, problem.num_vars))
+    options = {"disp": False}
+    if time_limit:
+        options["time_limit"] = float(time_limit)
+    if gap:
+        options["mip_rel_gap"] = float(gap)
+    with _solver_stdout_to_stderr():
+        res = milp(-problem.c, integrality=np.zeros(problem.num_vars) if relax else problem.integrality.astype(int),
+                   bounds=Bounds(problem.lower, problem.upper),
+                   constraints=[LinearConstraint(matrix, problem.row_lower, problem.row_upper)] if problem.num_rows else [],
+                   options=options)
+    # status 0 optimal, 1 time/iteration limit, 2 infeasible, 3 unbounded
+    return _result(res.x, res.status == 0, stopped=res.status == 1, infeasible=res.status == 2,
+                   unbounded=res.status == 3)
+
+def _solve_cpsat(problem, time_limit, threads, gap, warm_start, relax):
+    cp_model = _optional("ortools.sat.python.cp_model")
+    if not (np.isfinite(problem.lower).all() and np.isfinite(problem.upper).all()):
+        raise ValueError("cpsat needs finite variable bounds")
+    coefs = np.rint(problem.data)
+    if not np.array_equal(coefs, problem.data):
+        raise ValueError("cpsat needs integer constraint coefficients")
+    model = cp_model.CpModel()
+    x = [model.NewIntVar(int(np.ceil(lo)), int(np.floor(up)), f"x{k}")
+         for k, (lo, up) in enumerate(zip(problem.lower, problem.upper))]
+    for cols, row_coefs, lo, up in problem.rows():
+        expr = cp_model.LinearExpr.WeightedSum([x[k] for k in cols.tolist()], np.rint(row_coefs).astype(int).tolist())
+        model.AddLinearConstraint(expr, int(np.ceil(lo)) if np.isfinite(lo) else cp_model.INT_MIN,
+                                  int(np.floor(up)) if np.isfinite(up) else cp_model.INT_MAX)
+    nonzero = np.flatnonzero(problem.c)
+    model.Maximize(cp_model.LinearExpr.WeightedSum(
+        [x[k] for k in nonzero.tolist()], np.rint(problem.c[nonzero] * CPSAT_OBJECTIVE_SCALE).astype(int).tolist()))
+    if warm_start is not None:
+        for var, value in zip(x, np.rint(warm_start).astype(int).tolist()):
+            model.AddHint(var, value)
+    solver = cp_model.CpSolver()
+    solver.parameters.num_workers = max(1, threads)
+    if time_limit:
+        solver.parameters.max_time_in_seconds = float(time_limit)
+    if gap:
+        solver.parameters.relative_gap_limit = float(gap)
+    status = solver.Solve(model)
+    found = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    return _result(np.array([solver.Value(var) for var in x], dtype=float) if found else None,
+                   status == cp_model.OPTIMAL, stopped=status == cp_model.UNKNOWN and bool(time_limit),
+                   infeasible=status == cp_model.INFEASIBLE)
+
+def available_backends():
+    highs = _optional("highspy") is not None or _optional("scipy.optimize", "milp") is not None
+    return [name for name, ok in (("cbc", True), ("highs", highs),
+                                  ("cpsat", _optional("ortools.sat.python.cp_model") is not None)) if ok]
+
+def resolve_backend(backend=MILP_BACKEND, relax=False):
+    """
+    (backend name, solve function) solve_milp will use for backend; importing
+    its solver library here is what the first solve would otherwise pay for.
+    """
+    if backend not in MILP_BACKENDS:
+        raise ValueError(f"Unknown MILP backend: {backend}")
+    if backend == "cpsat" and relax:
+        backend = "highs"
+    if backend not in available_backends():
+        if backend not in _warned_fallback:
+            _warned_fallback.add(backend)
+            print(f"[WARN] MILP backend {backend} is not installed, using cbc")
+        backend = "cbc"
+    if backend == "highs":
+        return backend, _solve_highspy if _optional("highspy") is not None else _solve_scipy_highs
+    if backend == "cbc":
+        _optional("pulp")
+    return backend, {"cbc": _solve_cbc, "cpsat": _solve_cpsat}[backend]
+
+def solve_milp(problem, backend=MILP_BACKEND, time_limit=None, threads=MILP_THREADS, gap=MILP_GAP,
+               warm_start=None, relax=False):
+    """
+    Solve a SparseMILP. warm_start: full x vector used as a MIP start (scipy's
+    HiGHS has none); if it is feasible and the solver stops with nothing
+    better, it is returned as the "Feasible" incumbent. relax: LP relaxation
+    (cpsat falls back to highs/cbc for it). A backend that is not installed
+    falls back to cbc.
+    """
+    backend, solve = resolve_backend(backend, relax)
+    if problem.num_vars == 0:
+        # every candidate was pruned: only the empty rows' bounds can fail
+        feasible = bool(np.all(problem.row_lower <= 0) and np.all(problem.row_upper >= 0))
+        result = MILPResult("Optimal", np.zeros(0), optimal=True) if feasible else MILPResult("Infeasible")
+    else:
+        result = solve(problem, time_limit, threads, gap, warm_start, relax)
+    if warm_start is not None and not relax and not result.optimal and start_is_feasible(problem, warm_start):
+        start = np.asarray(warm_start, dtype=float)
+        if result.x is None or problem.c @ start > problem.c @ result.x + FEASIBILITY_TOL:
+            result = MILPResult("Feasible", start.copy())
+    result.backend = backend
+    return result
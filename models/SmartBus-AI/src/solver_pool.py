@@ -0,0 +1,485 @@
+# ==============================================================================
+# FILE: solver_pool.py
+# PURPOSE: Bounded process pool for model building + CBC solving, with backpressure
+# ==============================================================================
+
+import os
+import time
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .integrated_seat_ml_model import MILP_SYMMETRY, get_bus_layout, build_assignment_details
+from .scoring import score_problem, score_problems, predicted_seat_types
+from .allocator import MIN_MILP_SECONDS, allocate_seating, decomposed_summary
+from .decomposition import (DECOMPOSE_BLOCK_ROWS, DECOMPOSE_LP_BOUND, DECOMPOSE_BOUND_SHARE, plan_blocks,
+                            block_problem, solve_block, solve_lp_bound, finish_decomposition)
+from .reallocation import reallocate_seating
+from .metrics import profiled
+from .compiled_models import COMPILED_MODELS_FILE, load_compiled_models
+from .lookup_tables import LOOKUP_AGE_BUCKET, LOOKUP_TABLES_SUBDIR, SeatPreferenceTables, models_stamp
+from .solver_backends import MILP_BACKEND, resolve_backend
+
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+# Serve seat type / penalty predictions from global_models.npz when present
+USE_COMPILED_MODELS = os.getenv("USE_COMPILED_MODELS", "1") == "1"
+# Score through per-profile lookup tables (models/lookup_tables/) where tabulated
+USE_LOOKUP_TABLES = os.getenv("USE_LOOKUP_TABLES", "1") == "1"
+
+# Solver processes (0 = solve in-process on a worker thread), extra requests
+# allowed to wait for a free worker, and the Retry-After hint when saturated.
+ALLOCATOR_WORKERS = int(os.getenv("ALLOCATOR_WORKERS", str(os.cpu_count() or 1)))
+ALLOCATOR_MAX_PENDING = int(os.getenv("ALLOCATOR_MAX_PENDING", str(2 * max(1, ALLOCATOR_WORKERS))))
+ALLOCATOR_RETRY_AFTER = int(os.getenv("ALLOCATOR_RETRY_AFTER", "2"))
+# Model versions each worker keeps loaded (jobs admitted before a reload finish on the old one)
+WORKER_MODEL_VERSIONS = int(os.getenv("WORKER_MODEL_VERSIONS", "2"))
+# Times a job is resubmitted after its worker process died (OOM kill, segfault)
+ALLOCATOR_JOB_RETRIES = int(os.getenv("ALLOCATOR_JOB_RETRIES", "1"))
+# Seconds to wait for every worker to pre-load a new model version before it is
+# served anyway (workers still without it load it on their first job), and
+# the seconds between checks
+WORKER_PRELOAD_TIMEOUT = float(os.getenv("WORKER_PRELOAD_TIMEOUT", "60"))
+WORKER_PRELOAD_POLL = 0.2
+
+class PoolSaturated(Exception):
+    pass
+
+def solver_config():
+    """
+    Settings of this process that change the seating returned for the same
+    input; part of the result cache fingerprint.
+    """
+    return {"backend": MILP_BACKEND, "symmetry": MILP_SYMMETRY, "ageBucket": LOOKUP_AGE_BUCKET,
+            "compiledModels": USE_COMPILED_MODELS, "lookupTables": USE_LOOKUP_TABLES,
+            "blockRows": DECOMPOSE_BLOCK_ROWS, "lpBound": DECOMPOSE_LP_BOUND}
+
+# -------------------- Worker Side --------------------
+
+NO_MODELS = {"seat_type_model": None, "penalty_model": None, "disability_encoder": None, "lookup_tables": None}
+
+# Global models of this process by version, newest last (see _models_for)
+_model_sets = OrderedDict()
+_model_sets_lock = threading.Lock()
+# Versions being pre-loaded on a background thread, and pre-loads that failed
+_preloading = {}
+_preload_errors = {}
+
+def resolve_models(models_dir=MODELS_DIR):
+    """
+    (version, directory) of the models to serve. models/CURRENT names a
+    directory under models/versions/ (see train_global_models.py); without
+    it the files in models_dir are served, versioned by their size/mtime.
+    version is None when there are no models at all.
+    """
+    try:
+        with open(os.path.join(models_dir, "CURRENT")) as f:
+            version = f.read().strip()
+        directory = os.path.join(models_dir, "versions", version)
+        if version and os.path.isdir(directory):
+            return version, directory
+    except OSError:
+        pass
+    stamp = models_stamp(models_dir)
+    return ("local-" + hashlib.sha1(stamp.encode()).hexdigest()[:12] if stamp else None), models_dir
+
+def load_global_models(models_dir=MODELS_DIR):
+    """
+    { "seat_type_model", "penalty_model", "disability_encoder", "lookup_tables" },
+    None where missing. With USE_COMPILED_MODELS and a compiled .npz, the two
+    ensembles come from it (memory-mapped on first prediction, pages shared by
+    all workers). With USE_LOOKUP_TABLES, lookup_tables serves their predictions
+    per passenger profile.
+    """
+    import joblib
+    models = {}
+    compiled_path = os.path.join(models_dir, COMPILED_MODELS_FILE)
+    if USE_COMPILED_MODELS and os.path.exists(compiled_path):
+        try:
+            models.update(load_compiled_models(compiled_path))
+        except Exception as e:
+            print(f"[WARN] Could not load {compiled_path}: {e}")
+    for name in ("seat_type_model", "penalty_model", "disability_encoder"):
+        path = os.path.join(models_dir, f"{name}.pkl")
+        if models.get(name) is None:
+            models[name] = joblib.load(path) if os.path.exists(path) else None
+    models["lookup_tables"] = None
+    encoder = models["disability_encoder"]
+    if USE_LOOKUP_TABLES and hasattr(encoder, "categories_") and (models["seat_type_model"] or models["penalty_model"]):
+        models["lookup_tables"] = SeatPreferenceTables(
+            models["seat_type_model"], models["penalty_model"], encoder,
+            directory=os.path.join(models_dir, LOOKUP_TABLES_SUBDIR), stamp=models_stamp(models_dir))
+    return models
+
+def install_models(models, version=None):
+    """
+    Make a loaded version available to jobs in this process; only the newest
+    WORKER_MODEL_VERSIONS stay referenced.
+    """
+    with _model_sets_lock:
+        _model_sets[version] = models
+        _model_sets.move_to_end(version)
+        while len(_model_sets) > max(1, WORKER_MODEL_VERSIONS):
+            _model_sets.popitem(last=False)
+
+def _models_for(job):
+    """
+    The global models a job was admitted with: job["models"] is the
+    (version, directory) the API was serving, loaded here on first use.
+    Jobs without it get the newest version in this process.
+    """
+    version, directory = job.get("models") or (None, None)
+    with _model_sets_lock:
+        if version in _model_sets:
+            return _model_sets[version]
+        if directory is None:
+            return next(reversed(_model_sets.values()), NO_MODELS)
+        preloading = _preloading.get(version)
+    if preloading is not None:
+        preloading.join()
+        with _model_sets_lock:
+            if version in _model_sets:
+                return _model_sets[version]
+    models = load_global_models(directory)
+    install_models(models, version)
+    return models
+
+def _init_worker(models_dir):
+    version, directory = resolve_models(models_dir)
+    install_models(load_global_models(directory), version)
+
+def _preload(version, directory):
+    try:
+        install_models(load_global_models(directory), version)
+    except Exception as e:
+        _preload_errors[version] = f"{type(e).__name__}: {e}"
+    finally:
+        with _model_sets_lock:
+            _preloading.pop(version, None)
+
+def preload_job(ref):
+    """
+    Starts loading model version ref = (version, directory) on a background
+    thread of this worker, which meanwhile keeps solving jobs for the
+    versions it holds. -> (pid, loaded); raises if the load failed.
+    """
+    version, directory = ref
+    with _model_sets_lock:
+        if version in _model_sets:
+            return os.getpid(), True
+        error = _preload_errors.pop(version, None)
+        if error is None and version not in _preloading:
+            _preloading[version] = threading.Thread(target=_preload, args=ref, name="model-preload", daemon=True)
+            _preloading[version].start()
+    if error is not None:
+        raise RuntimeError(f"worker {os.getpid()} could not load models {version}: {error}")
+    return os.getpid(), False
+
+def warm_job(_=None):
+    """
+    Returns once this worker is up (its initializer loaded the models) and
+    has imported the MILP solver library.
+    """
+    resolve_backend()
+    return os.getpid()
+
+def _with_predicted_types(result, passengers, bus, models):
+    """
+    Adds predicted_seat_type (the global model's preferred type in the seat
+    given, for the "model_seat_type" reason) to each passenger's assignment
+    details in a job's (assignment_details, info) result.
+    """
+    details = result[0]
+    seated = [p for p in passengers if p.id in details]
+    types = predicted_seat_types(seated, bus, [details[p.id]["seat_id"] for p in seated], models["seat_type_model"],
+                                 models["disability_encoder"], models["lookup_tables"])
+    for p, seat_type in zip(seated, types):
+        details[p.id]["predicted_seat_type"] = seat_type
+    return result
+
+def solve_job(job):
+    """
+    Picklable unit of work: { "passengers", "layout": get_bus_layout kwargs,
+    "personal_models", "mode", "time_limit", "profile_path" (optional),
+    "scores" (optional, precomputed ProblemScores), "warm_start" (optional,
+    { passenger_id: seat_id }), "models" (optional, see _models_for) }
+    -> (assignment_details, info).
+    """
+    with profiled(job.get("profile_path")):
+        bus = get_bus_layout(**job["layout"])
+        models = _models_for(job)
+        return _with_predicted_types(allocate_seating(
+            job["passengers"], bus,
+            personal_models=job.get("personal_models"),
+            mode=job.get("mode", "exact"),
+            time_limit=job.get("time_limit"),
+            scores=job.get("scores"),
+            warm_start=job.get("warm_start"),
+            **models
+        ), job["passengers"], bus, models)
+
+def score_job(job):
+    """
+    { "problems": [{ "passengers", "layout" }], "personal_models" } -> [ProblemScores],
+    scored together (one model call per layout) for batch allocation.
+    """
+    problems = [(problem["passengers"], get_bus_layout(**problem["layout"])) for problem in job["problems"]]
+    return score_problems(problems, personal_models=job.get("personal_models"), **_models_for(job))
+
+def reallocate_job(job):
+    """
+    Like solve_job, plus "previous" ({ passenger_id: seat_id }) and "keep";
+    runs reallocate_seating.
+    """
+    with profiled(job.get("profile_path")):
+        bus = get_bus_layout(**job["layout"])
+        models = _models_for(job)
+        return _with_predicted_types(reallocate_seating(
+            job["passengers"], bus, job["previous"],
+            personal_models=job.get("personal_models"),
+            keep=job.get("keep", "fixed"),
+            time_limit=job.get("time_limit"),
+            **models
+        ), job["passengers"], bus, models)
+
+# ---- Decomposed solves (see SolverPool.solve_decomposed) ----
+# Deadlines here are time.time() values: the stages run in different processes.
+
+def _seconds_left(deadline):
+    return max(0.0, deadline - time.time()) if deadline is not None else None
+
+def decompose_job(job):
+    """
+    First stage, job like solve_job's: scores the trip (unless job["scores"])
+    and plans the blocks. -> (scores, plan or None, timings)
+    """
+    started = time.monotonic()
+    bus = get_bus_layout(**job["layout"])
+    scores, timings = job.get("scores"), {"scoring": 0.0, "decomposition": 0.0}
+    if scores is None:
+        models = _models_for(job)
+        scores = score_problem(job["passengers"], bus, models["seat_type_model"], models["penalty_model"],
+                               job.get("personal_models"), models["disability_encoder"], models["lookup_tables"])
+        timings["scoring"] = time.monotonic() - started
+    plan = plan_blocks(job["passengers"], bus, scores, time_limit=job.get("time_limit"))
+    timings["decomposition"] = time.monotonic() - started - timings["scoring"]
+    return scores, plan, timings
+
+def block_job(job):
+    """
+    { "passengers" (the block's), "layout", "seat_ids", "scores" (the block's),
+    "cohesion", "time_limit", "deadline" } -> solve_block result; the budget is
+    clamped to the time left when the job starts.
+    """
+    limit, left = job.get("time_limit"), _seconds_left(job.get("deadline"))
+    if left is not None:
+        limit = left if limit is None else min(limit, left)
+    bus = get_bus_layout(**job["layout"]).subset(job["seat_ids"])
+    return solve_block(job["passengers"], bus, job["scores"], job.get("cohesion", "pairwise"), limit)
+
+def bound_job(job):
+    """
+    { "passengers", "layout", "scores", "cohesion", "time_limit", "deadline" }
+    -> LP bound or None; the budget is clamped like block_job's.
+    """
+    limit, left = job.get("time_limit"), _seconds_left(job.get("deadline"))
+    if left is not None:
+        limit = left if limit is None else min(limit, left)
+    return solve_lp_bound(job["passengers"], get_bus_layout(**job["layout"]), job["scores"],
+                          job.get("cohesion", "pairwise"), limit)
+
+def finish_job(job):
+    """
+    { "passengers", "layout", "scores", "cohesion", "plan", "results", "bound",
+    "deadline", "models" } -> (assignment_details, decomposed info), ({}, info)
+    if a block seated nobody.
+    """
+    bus = get_bus_layout(**job["layout"])
+    left = _seconds_left(job.get("deadline"))
+    info = {}
+    chosen = finish_decomposition(job["passengers"], bus, job["scores"], job.get("cohesion", "pairwise"),
+                                  job["plan"], job["results"], job.get("bound"),
+                                  time.monotonic() + left if left is not None else None, info)
+    details = build_assignment_details(job["passengers"], bus, chosen) if chosen is not None else {}
+    return _with_predicted_types((details, info), job["passengers"], bus, _models_for(job))
+
+# -------------------- Pool --------------------
+
+class SolverPool:
+    """
+    Admission control + executor. acquire()/release() bracket a whole request
+    (so history fetching also counts against the queue); solve() runs one job
+    without blocking the event loop. A worker process dying breaks the whole
+    ProcessPoolExecutor; the pool is then replaced (and re-warmed) and the
+    jobs it failed are resubmitted up to ALLOCATOR_JOB_RETRIES times.
+    """
+    def __init__(self, workers=ALLOCATOR_WORKERS, max_pending=ALLOCATOR_MAX_PENDING, models_dir=MODELS_DIR,
+                 job_retries=ALLOCATOR_JOB_RETRIES):
+        self.workers = workers
+        self.capacity = max(1, workers) + max(0, max_pending)
+        self.models_dir = models_dir
+        self.job_retries = max(0, job_retries)
+        self.in_flight = 0
+        self.restarts = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _new_executor(self):
+        if self.workers > 0:
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.models_dir,),
+            )
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="solver")
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._new_executor()
+            return self._executor
+
+    def _replace_broken(self, broken, error):
+        """
+        Swap a broken process pool for a new one whose workers start loading
+        now (warm jobs queued ahead of the retries). Jobs failing on the same
+        broken pool replace it only once.
+        """
+        with self._lock:
+            if self._executor is not broken:
+                return
+            print(f"[WARN] Solver worker died ({error}); restarting the pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+            self.restarts += 1
+            for _ in range(self.workers):
+                self._executor.submit(warm_job)
+
+    def warm_up(self):
+        """
+        Start the worker processes now rather than on the first requests;
+        blocks until each has loaded its models and solver library (in-process:
+        imports the solver library here).
+        """
+        if self.workers > 0:
+            list(self._get_executor().map(warm_job, range(self.workers)))
+        else:
+            warm_job()
+
+    def preload(self, ref):
+        """
+        Load model version ref = (version, directory) in every worker process
+        before it is served: preload_job rounds until each worker reports it
+        loaded. Workers keep solving meanwhile. Raises if a worker could not
+        load it; after WORKER_PRELOAD_TIMEOUT the stragglers are left to load
+        it on their first job. No-op in-process or before the workers started
+        (they load the published version when they start).
+        """
+        if self.workers <= 0 or self._executor is None:
+            return
+        loaded = set()
+        deadline = time.monotonic() + WORKER_PRELOAD_TIMEOUT
+        while True:
+            executor = self._get_executor()
+            for future in [executor.submit(preload_job, ref) for _ in range(self.workers)]:
+                pid, done = future.result()
+                if done:
+                    loaded.add(pid)
+            if len(loaded) >= self.workers:
+                return
+            if time.monotonic() >= deadline:
+                print(f"[WARN] Models {ref[0]} pre-loaded by {len(loaded)}/{self.workers} workers "
+                      f"after {WORKER_PRELOAD_TIMEOUT:.0f}s; serving it anyway")
+                return
+            time.sleep(WORKER_PRELOAD_POLL)
+
+    def acquire(self):
+        if self.in_flight >= self.capacity:
+            raise PoolSaturated(f"{self.in_flight} allocations in flight (capacity {self.capacity})")
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight = max(0, self.in_flight - 1)
+
+    async def solve(self, job, fn=solve_job):
+        """
+        fn(job) on a worker. Raises BrokenProcessPool only when the job's
+        worker died on every attempt (likely the job itself crashes it);
+        other jobs carry on on the replacement pool.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.job_retries + 1):
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, fn, job)
+            except BrokenProcessPool as e:
+                self._replace_broken(executor, e)
+                if attempt == self.job_retries:
+                    raise
+
+    async def solve_decomposed(self, job):
+        """
+        solve_job in "decomposed" mode with every block, and the LP bound, as
+        its own job: a trip's blocks run in parallel on the workers, queued
+        with everyone else's jobs. The bound is submitted first with
+        DECOMPOSE_BOUND_SHARE of the budget, the rest is split between waves
+        of blocks and clamped to the time left when a block starts (blocks
+        left without time are seated by the heuristic). Falls back to
+        solve_job in "exact" mode when no block split works.
+        Returns (assignment_details, info) like allocate_seating.
+        """
+        started = time.monotonic()
+        deadline = time.time() + job["time_limit"] if job.get("time_limit") else None
+        cohesion = job.get("cohesion", "pairwise")
+        passengers = job["passengers"]
+        scores, plan, timings = await self.solve(job, fn=decompose_job)
+        details = {}
+        if plan is not None:
+            waves = -(-len(plan[0]) // max(1, self.workers))
+            left = _seconds_left(deadline)
+            stages = []
+            if DECOMPOSE_LP_BOUND:
+                stages.append(self.solve({"passengers": passengers, "layout": job["layout"], "scores": scores,
+                                          "cohesion": cohesion, "deadline": deadline,
+                                          "time_limit": left * DECOMPOSE_BOUND_SHARE if left is not None else None},
+                                         fn=bound_job))
+                left = left * (1.0 - DECOMPOSE_BOUND_SHARE) if left is not None else None
+            block_limit = left / waves if left is not None else None
+            for block, members in plan[0]:
+                seat_ids, sub_scores = block_problem(block, members, scores, passengers)
+                stages.append(self.solve({"passengers": members, "layout": job["layout"], "seat_ids": seat_ids,
+                                          "scores": sub_scores, "cohesion": cohesion, "time_limit": block_limit,
+                                          "deadline": deadline}, fn=block_job))
+            results = await asyncio.gather(*stages)
+            bound = results.pop(0) if DECOMPOSE_LP_BOUND else None
+            details, decomposed_info = await self.solve({
+                "passengers": passengers, "layout": job["layout"], "scores": scores, "cohesion": cohesion,
+                "plan": plan, "results": results, "bound": bound, "deadline": deadline,
+                "models": job.get("models")}, fn=finish_job)
+        decomposition_seconds = time.monotonic() - started - timings["scoring"]
+        if details:
+            info = decomposed_summary(decomposed_info)
+            # blocks run side by side: their build/solve seconds are summed, not wall time
+            info["timings"] = {"scoring": 0.0, "model_build": decomposed_info["build_seconds"],
+                               "cbc_solve": decomposed_info["solve_seconds"], "heuristic": 0.0}
+            info["variables"], info["constraints"] = decomposed_info["variables"], decomposed_info["constraints"]
+        else:
+            left = _seconds_left(deadline)
+            details, info = await self.solve({**job, "mode": "exact", "scores": scores, "warm_start": None,
+                                              "time_limit": max(MIN_MILP_SECONDS, left) if left is not None else None})
+        info["timings"].update({"scoring": timings["scoring"], "decomposition": decomposition_seconds})
+        info["wall_time_ms"] = round((time.monotonic() - started) * 1000.0, 1)
+        return details, info
+
+    def stats(self):
+        return {"workers": self.workers, "capacity": self.capacity, "in_flight": self.in_flight,
+                "restarts": self.restarts}
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,80 @@
+# ==============================================================================
+# FILE: startup_budget.py
+# PURPOSE: Import-time budget for the API and the trainer — imports each entry
+#          point in a fresh interpreter (-X importtime), exit 1 on regression
+# ==============================================================================
+#
+#   python -m src.startup_budget                                # default budgets
+#   python -m src.startup_budget --budget src.api=0.8 --repeat 5
+#
+# A module fails if its import takes longer than its budget (best of --repeat
+# runs) or if it imports any of the heavy libraries in DEFERRED: those load in
+# the API warm-up (see warmup.py) or in the function that needs them.
+
+import os
+import sys
+import argparse
+import subprocess
+
+# Seconds per entry point (wall time of the import statement)
+DEFAULT_BUDGETS = {"src.api": 1.0, "src.train_global_models": 0.5}
+DEFERRED = ("sklearn", "scipy", "pandas", "pyarrow", "joblib", "pulp", "highspy", "ortools", "requests")
+
+_PROBE = ("import sys, time; before = set(sys.modules); started = time.perf_counter(); import {module}; "
+          "print(time.perf_counter() - started); print(' '.join(set(sys.modules) - before))")
+
+def measure_import(module, cwd=None):
+    """
+    (seconds, { top-level package: seconds }) for importing module in a new
+    interpreter; packages are the ones it loaded, with their cumulative
+    -X importtime.
+    """
+    run = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)], cwd=cwd,
+                         capture_output=True, text=True, check=True)
+    seconds, loaded = run.stdout.splitlines()[-2:]
+    loaded = {name.partition(".")[0] for name in loaded.split()}
+    packages = {}
+    for line in run.stderr.splitlines():
+        if line.startswith("import time:") and "imported package" not in line:
+            _, cumulative, name = line.split("|")
+            if name.strip() in loaded:
+                packages[name.strip()] = int(cumulative) / 1e6
+    return float(seconds), packages
+
+def check_budgets(budgets, repeat=3, deferred=DEFERRED, cwd=None, log=print):
+    """
+    Measure every module in budgets; returns the list of failure messages.
+    """
+    failures = []
+    for module, budget in budgets.items():
+        runs = [measure_import(module, cwd) for _ in range(max(1, repeat))]
+        seconds, packages = min(runs, key=lambda run: run[0])
+        heaviest = sorted(packages.items(), key=lambda kv: -kv[1])[:4]
+        log(f"{module:<28} {seconds:6.3f}s (budget {budget:.2f}s)  heaviest: "
+            + ", ".join(f"{name} {t:.3f}s" for name, t in heaviest))
+        if seconds > budget:
+            failures.append(f"{module} imports in {seconds:.3f}s, budget {budget:.2f}s")
+        loaded = sorted(set(packages) & set(deferred))
+        if loaded:
+            failures.append(f"{module} imports {', '.join(loaded)} (deferred to first use)")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time budget for the SmartBus-AI entry points")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=SECONDS",
+                        help="override or add a budget (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per module; the fastest counts")
+    args = parser.parse_args(argv)
+
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in args.budget:
+        module, _, seconds = item.partition("=")
+        budgets[module] = float(seconds)
+    failures = check_budgets(budgets, repeat=args.repeat,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,89 +1,560 @@
 # ==============================================================================
 # FILE: train_global_models.py
-# PURPOSE: Offline trainer – pulls feedback from backend, trains & saves models
+# PURPOSE: Offline trainer – streams feedback from backend (or an export),
+#          trains or incrementally updates the models, publishes a version
 # ==============================================================================
+#
+#   python -m src.train_global_models                 # incremental from the stored watermark
+#   python -m src.train_global_models --full          # retrain from the whole history
+#   python -m src.train_global_models --seattype-file seat.csv --penalty-file pen.parquet
+#
+# Every run writes models/versions/<version>/ (models, compiled models, lookup
+# tables, training state, manifest.json) and then publishes it: each artifact
+# is hard-linked over models/<artifact> with an atomic rename, then
+# models/CURRENT names the version.
 
 import os
-import joblib
+import sys
+import json
+import time
+import shutil
+import argparse
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier, VotingClassifier
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import ExtraTreesRegressor, VotingRegressor
-from sklearn.preprocessing import OneHotEncoder
-from .ml_feedback_integration import fetch_training_feedback
+from .ml_feedback_integration import iter_training_feedback, feedback_key, FEEDBACK_PAGE_SIZE
+from .compiled_models import COMPILED_MODELS_FILE, export_compiled_models, load_compiled_models, parity_error
+from .lookup_tables import (LOOKUP_TABLES_SUBDIR, LOOKUP_LAYOUTS, SeatPreferenceTables, accuracy_report,
+                            models_stamp, parse_layouts)
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
 
 DISABILITIES = ["None", "Wheelchair", "Visual Impairment", "Hearing Impairment", "Other"]
 MODELS_DIR = os.getenv("MODELS_DIR", "models")
+# Largest allowed |sklearn - compiled| on the training rows (checked on up to TRAIN_PARITY_ROWS)
+COMPILED_PARITY_TOLERANCE = 1e-9
+TRAIN_PARITY_ROWS = int(os.getenv("TRAIN_PARITY_ROWS", "5000"))
+# Rows per model kept for fitting the trees: a uniform sample of the whole
+# history (the linear penalty term uses every row through its sufficient statistics)
+TRAIN_MAX_ROWS = int(os.getenv("TRAIN_MAX_ROWS", "200000"))
+# Incremental runs: trees added per forest, fitted on the new rows only (the
+# oldest trees beyond TRAIN_MAX_TREES are dropped); with fewer than
+# TRAIN_MIN_NEW_ROWS new rows only the linear term and the sample are updated
+TRAIN_WARM_TREES = int(os.getenv("TRAIN_WARM_TREES", "25"))
+TRAIN_MAX_TREES = int(os.getenv("TRAIN_MAX_TREES", "400"))
+TRAIN_MIN_NEW_ROWS = int(os.getenv("TRAIN_MIN_NEW_ROWS", "200"))
+# Published versions kept in models/versions/
+TRAIN_KEEP_VERSIONS = int(os.getenv("TRAIN_KEEP_VERSIONS", "3"))
+# Rows per chunk read from local export files
+TRAIN_FILE_CHUNK = int(os.getenv("TRAIN_FILE_CHUNK", "50000"))
 
-def train_and_save_global_models(since=None):
-    os.makedirs(MODELS_DIR, exist_ok=True)
-
-    # Pull feedback from backend
-    fb = fetch_training_feedback(since)
-    seat_recs = fb.get("seattype", [])
-    pen_recs  = fb.get("penalty",  [])
+SEAT_TYPE_COLUMNS = ["is_priority", "is_female", "is_in_group", "age", "norm_row", "norm_col"]
+PENALTY_COLUMNS = SEAT_TYPE_COLUMNS + ["group_distance"]
+# Files published from a version directory into MODELS_DIR
+ARTIFACTS = ("seat_type_model.pkl", "penalty_model.pkl", "disability_encoder.pkl", COMPILED_MODELS_FILE)
+VERSIONS_DIR = os.path.join(MODELS_DIR, "versions")
 
-    # Encoder (fit on fixed classes so it's stable)
+def build_disability_encoder():
+    from sklearn.preprocessing import OneHotEncoder
+    # Fit on fixed classes so it's stable
     disability_encoder = OneHotEncoder(handle_unknown='ignore')
     disability_encoder.fit([[d] for d in DISABILITIES])
+    return disability_encoder
+
+# -------------------- Feature Matrices --------------------
+
+def feature_matrix(rows, columns, disability_encoder):
+    """
+    (N, len(columns) + disabilities) model inputs for a chunk of feedback rows,
+    given as feature dicts or as a DataFrame; one encoder call per chunk.
+    """
+    width = len(columns) + len(disability_encoder.categories_[0])
+    if len(rows) == 0:
+        return np.zeros((0, width))
+    if hasattr(rows, "columns"):
+        numeric = rows[columns].to_numpy(dtype=float)
+        disabilities = rows["disability"].fillna("None").to_numpy(dtype=object)  # "None" may load as NaN
+    else:
+        numeric = np.array([[feat[c] for c in columns] for feat in rows], dtype=float)
+        disabilities = np.array([feat["disability"] for feat in rows], dtype=object)
+    onehot = disability_encoder.transform(disabilities.reshape(-1, 1)).toarray()
+    return np.hstack([numeric, onehot])
+
+def seat_type_matrix(seat_recs, disability_encoder):
+    """
+    seat_recs: [(features, seat_type_str), ...] as served by GET /feedback.
+    """
+    X = feature_matrix([feat for feat, _ in seat_recs], SEAT_TYPE_COLUMNS, disability_encoder)
+    return X, np.array([str(seat_type) for _, seat_type in seat_recs])
+
+def penalty_matrix(pen_recs, disability_encoder):
+    """
+    pen_recs: [(features incl. group_distance, feedback_score), ...].
+    """
+    X = feature_matrix([feat for feat, _ in pen_recs], PENALTY_COLUMNS, disability_encoder)
+    return X, np.array([score for _, score in pen_recs], dtype=float)
+
+# -------------------- Models --------------------
+
+def new_seat_type_model():
+    from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier, VotingClassifier
+    clf1 = RandomForestClassifier(n_estimators=150, random_state=42)
+    clf2 = ExtraTreesClassifier(n_estimators=200, random_state=42)
+    return VotingClassifier([("rf", clf1), ("et", clf2)], voting="soft")
+
+def new_penalty_model():
+    from sklearn.linear_model import LinearRegression
+    from sklearn.ensemble import ExtraTreesRegressor, VotingRegressor
+    reg1 = LinearRegression()
+    reg2 = ExtraTreesRegressor(n_estimators=200, random_state=42)
+    return VotingRegressor([("lr", reg1), ("et", reg2)])
+
+def fit_seat_type_model(seat_recs, disability_encoder):
+    return new_seat_type_model().fit(*seat_type_matrix(seat_recs, disability_encoder))
+
+def fit_penalty_model(pen_recs, disability_encoder):
+    return new_penalty_model().fit(*penalty_matrix(pen_recs, disability_encoder))
+
+def add_trees(ensemble, X, y, trees=TRAIN_WARM_TREES, max_trees=TRAIN_MAX_TREES):
+    """
+    Warm-start every forest of a fitted voting ensemble with `trees` more trees
+    fitted on (X, y), keeping the newest max_trees per forest. Raises
+    ValueError if y does not cover the classifier's classes.
+    """
+    if hasattr(ensemble, "le_"):
+        if set(np.unique(y)) != set(ensemble.classes_):
+            raise ValueError("new rows do not cover every seat type")
+        y = ensemble.le_.transform(y)
+    for member in ensemble.estimators_:
+        if not hasattr(member, "estimators_"):
+            continue
+        member.set_params(warm_start=True, n_estimators=len(member.estimators_) + trees)
+        member.fit(X, y)
+        member.estimators_ = member.estimators_[-max_trees:]
+        member.set_params(warm_start=False, n_estimators=len(member.estimators_))
+    return ensemble
+
+# -------------------- Training State --------------------
+
+class RowSample:
+    """
+    Uniform sample of at most `size` rows of a stream (reservoir sampling,
+    vectorized per chunk), plus how many rows were seen.
+    """
+    def __init__(self, size, X=None, y=None, seen=0, seed=0):
+        self.size = size
+        self.X, self.y, self.seen = X, y, seen
+        self.rng = np.random.default_rng(seed + seen)
+
+    def __len__(self):
+        return 0 if self.X is None else len(self.X)
+
+    def add(self, X, y):
+        if len(X) == 0:
+            return
+        if self.X is None:
+            self.X, self.y = X[:0].copy(), y[:0].copy()
+        free = max(0, self.size - len(self.X))
+        self.X = np.concatenate([self.X, X[:free]])
+        self.y = np.concatenate([self.y, y[:free]])
+        if len(X) > free:
+            # row number i (0-based in the stream) replaces a random slot with probability size / (i + 1)
+            numbers = self.seen + free + np.arange(len(X) - free)
+            slots = (self.rng.random(len(numbers)) * (numbers + 1)).astype(np.int64)
+            keep = slots < self.size
+            slots, rows = slots[keep], np.nonzero(keep)[0] + free
+            # for slots hit twice in a chunk the later row wins, as in the sequential algorithm
+            last = len(slots) - 1 - np.unique(slots[::-1], return_index=True)[1]
+            if self.y.dtype.kind == "U" and y.dtype.itemsize > self.y.dtype.itemsize:
+                self.y = self.y.astype(y.dtype)
+            self.X[slots[last]] = X[rows[last]]
+            self.y[slots[last]] = y[rows[last]]
+        self.seen += len(X)
+
+class LinearStats:
+    """
+    Sufficient statistics [X 1]'[X 1] and [X 1]'y of a least-squares fit over
+    every row seen, so the linear term is exact without keeping the rows.
+    """
+    def __init__(self, xtx=None, xty=None):
+        self.xtx, self.xty = xtx, xty
+
+    def add(self, X, y):
+        A = np.hstack([X, np.ones((len(X), 1))])
+        if self.xtx is None:
+            self.xtx, self.xty = np.zeros((A.shape[1], A.shape[1])), np.zeros(A.shape[1])
+        self.xtx += A.T @ A
+        self.xty += A.T @ y
+
+    def apply(self, regressor):
+        solution = np.linalg.lstsq(self.xtx, self.xty, rcond=None)[0]
+        regressor.coef_, regressor.intercept_ = solution[:-1], float(solution[-1])
+
+def save_training_state(path, seat_sample, pen_sample, pen_stats):
+    arrays = {}
+    for name, sample in (("seat", seat_sample), ("pen", pen_sample)):
+        if len(sample):
+            arrays.update({f"{name}_X": sample.X, f"{name}_y": sample.y})
+        arrays[f"{name}_seen"] = np.array(sample.seen)
+    if pen_stats.xtx is not None:
+        arrays.update({"pen_xtx": pen_stats.xtx, "pen_xty": pen_stats.xty})
+    np.savez(path, **arrays)
+
+def load_training_state(path):
+    """
+    (seat RowSample, penalty RowSample, penalty LinearStats) saved by a run.
+    """
+    with np.load(path) as f:
+        samples = [RowSample(TRAIN_MAX_ROWS, f[f"{name}_X"] if f"{name}_X" in f.files else None,
+                             f[f"{name}_y"] if f"{name}_y" in f.files else None, int(f[f"{name}_seen"]))
+                   for name in ("seat", "pen")]
+        stats = LinearStats(f["pen_xtx"], f["pen_xty"]) if "pen_xtx" in f.files else LinearStats()
+    return samples[0], samples[1], stats
+
+def current_version(models_dir=MODELS_DIR):
+    """
+    (version, its directory, manifest) of the published models, or (None, None, None).
+    """
+    try:
+        with open(os.path.join(models_dir, "CURRENT")) as f:
+            version = f.read().strip()
+        directory = os.path.join(models_dir, "versions", version)
+        with open(os.path.join(directory, "manifest.json")) as f:
+            return version, directory, json.load(f)
+    except (OSError, ValueError):
+        return None, None, None
+
+# -------------------- Feedback Sources --------------------
+
+def iter_feedback_file(path, chunk_rows=TRAIN_FILE_CHUNK):
+    """
+    DataFrame chunks of a local feedback export: .csv, .parquet (needs pyarrow)
+    or .ndjson/.jsonl, with the feature columns plus seat_type (seat type rows)
+    or feedback_score (penalty rows).
+    """
+    import pandas as pd
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("reading .parquet exports needs pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif path.endswith((".ndjson", ".jsonl")):
+        yield from pd.read_json(path, lines=True, chunksize=chunk_rows)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows, float_precision="round_trip")
+
+def unseen_records(records, boundary):
+    """
+    records minus those an earlier run trained on: timestamped before
+    boundary["timestamp"], or at it and without an id or with one in
+    boundary["ids"]. Rows without a timestamp are kept.
+    """
+    if not boundary:
+        return records
+    latest, ids = boundary["timestamp"], set(boundary["ids"])
+    kept = []
+    for rec in records:
+        ts, rid = feedback_key(rec[0])
+        if ts is None or ts > latest or (ts == latest and rid is not None and rid not in ids):
+            kept.append(rec)
+    return kept
+
+def advance_boundary(boundary, records):
+    """
+    The newest feedback timestamp over boundary and records, with the ids of
+    the rows at it (the rows a since=<day> request serves again next run).
+    """
+    latest, ids = (boundary["timestamp"], set(boundary["ids"])) if boundary else (None, set())
+    for features, _ in records:
+        ts, rid = feedback_key(features)
+        if ts is None:
+            continue
+        if latest is None or ts > latest:
+            latest, ids = ts, set()
+        if ts == latest and rid is not None:
+            ids.add(rid)
+    return {"timestamp": latest, "ids": sorted(ids)} if latest is not None else None
+
+def iter_feedback_chunks(since, disability_encoder, seattype_file=None, penalty_file=None,
+                         page_size=FEEDBACK_PAGE_SIZE, watermark=None):
+    """
+    Encoded ("seattype" | "penalty", X, y) chunks from the export files when
+    given, else from paginated GET /feedback. watermark (a dict) carries the
+    previous run's "boundary" (see advance_boundary) and receives, before the
+    first chunk, "incremental": whether the backend honours since (its
+    response has a watermark or nextCursor; otherwise it served the whole
+    history and nothing is deduplicated), then its "since" for the next run
+    and the new "boundary". Rows at or before the old boundary are skipped.
+    """
+    if seattype_file or penalty_file:
+        for kind, path, columns, label in (("seattype", seattype_file, SEAT_TYPE_COLUMNS, "seat_type"),
+                                           ("penalty", penalty_file, PENALTY_COLUMNS, "feedback_score")):
+            for frame in (iter_feedback_file(path) if path else ()):
+                y = frame[label].to_numpy(dtype=str if kind == "seattype" else float)
+                yield kind, feature_matrix(frame, columns, disability_encoder), y
+        return
+    watermark = {} if watermark is None else watermark
+    previous = None
+    for page in iter_training_feedback(since, page_size=page_size):
+        if "incremental" not in watermark:
+            watermark["incremental"] = bool(page["watermark"] or page["nextCursor"])
+            previous = watermark.get("boundary") if watermark["incremental"] else None
+            watermark["boundary"] = previous
+        if page["watermark"]:
+            watermark["since"] = page["watermark"]
+        seat_recs, pen_recs = unseen_records(page["seattype"], previous), unseen_records(page["penalty"], previous)
+        watermark["boundary"] = advance_boundary(watermark["boundary"], seat_recs + pen_recs)
+        if seat_recs:
+            yield ("seattype", *seat_type_matrix(seat_recs, disability_encoder))
+        if pen_recs:
+            yield ("penalty", *penalty_matrix(pen_recs, disability_encoder))
+
+# -------------------- Artifacts --------------------
+
+def save_compiled_models(seat_type_model, penalty_model, seat_X, pen_X, directory=MODELS_DIR):
+    """
+    Export the models as <directory>/global_models.npz and check the compiled
+    predictions against sklearn on (up to TRAIN_PARITY_ROWS) training rows; a
+    mismatching artifact is removed so serving falls back to the .pkl files.
+    """
+    path = os.path.join(directory, COMPILED_MODELS_FILE)
+    export_compiled_models(path, seat_type_model, penalty_model)
+    compiled = load_compiled_models(path)
+    checks = [(seat_type_model, "seat_type_model", seat_X), (penalty_model, "penalty_model", pen_X)]
+    for model, name, X in checks:
+        if model is None or X is None or not len(X):
+            continue
+        error = parity_error(model, compiled[name], X[:TRAIN_PARITY_ROWS])
+        if error > COMPILED_PARITY_TOLERANCE:
+            print(f"[WARN] Compiled {name} differs from sklearn by {error:.3g}; not saving {path}")
+            os.remove(path)
+            return None
+    print(f"✅ Saved {path}")
+    return path
+
+def save_lookup_tables(seat_type_model, penalty_model, disability_encoder, directory=MODELS_DIR):
+    """
+    Tabulate the models for the LOOKUP_LAYOUTS shapes into <directory>/lookup_tables/
+    and write the lookup-vs-model accuracy of each to report.json there.
+    """
+    tables_dir = os.path.join(directory, LOOKUP_TABLES_SUBDIR)
+    lookup = SeatPreferenceTables(seat_type_model, penalty_model, disability_encoder, directory=tables_dir,
+                                  stamp=models_stamp(directory))
+    reports = []
+    for rows, cols in parse_layouts(LOOKUP_LAYOUTS):
+        try:
+            path = lookup.prepare(rows, cols)
+        except Exception as e:
+            # workers tabulate the shape on first use instead
+            print(f"[WARN] Could not tabulate {rows}x{cols}: {e}")
+            continue
+        report = accuracy_report(lookup, rows, cols)
+        reports.append(report)
+        print(f"✅ Saved {path} (seat type agreement {report.get('seat_type_agreement', '-')}, "
+              f"penalty MAE {report.get('penalty_mae', '-')})")
+    os.makedirs(tables_dir, exist_ok=True)
+    with open(os.path.join(tables_dir, "report.json"), "w") as f:
+        json.dump(reports, f, indent=2)
+    return reports
+
+def _replace_with_link(src, dst):
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:  # e.g. a filesystem without hard links
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+def new_version_dir(versions_dir=VERSIONS_DIR):
+    """
+    (version, directory) for a new version: its UTC time to the microsecond,
+    created exclusively so two runs never write into the same directory.
+    """
+    os.makedirs(versions_dir, exist_ok=True)
+    while True:
+        now = time.time()
+        version = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"{int(now % 1 * 1e6):06d}Z"
+        directory = os.path.join(versions_dir, version)
+        try:
+            os.mkdir(directory)
+            return version, directory
+        except FileExistsError:
+            continue
+
+def publish_version(version, models_dir=MODELS_DIR):
+    """
+    Make a version directory the served models: every artifact (and lookup
+    table) is swapped in with an atomic rename, artifacts the version lacks
+    are removed, then CURRENT is updated and old versions are pruned.
+    """
+    directory = os.path.join(models_dir, "versions", version)
+    for name in ARTIFACTS:
+        src, dst = os.path.join(directory, name), os.path.join(models_dir, name)
+        if os.path.exists(src):
+            _replace_with_link(src, dst)
+        elif os.path.exists(dst):
+            os.remove(dst)
+    tables_src = os.path.join(directory, LOOKUP_TABLES_SUBDIR)
+    if os.path.isdir(tables_src):
+        tables_dst = os.path.join(models_dir, LOOKUP_TABLES_SUBDIR)
+        os.makedirs(tables_dst, exist_ok=True)
+        for name in os.listdir(tables_src):
+            _replace_with_link(os.path.join(tables_src, name), os.path.join(tables_dst, name))
+    tmp = os.path.join(models_dir, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(models_dir, "CURRENT"))
+
+    versions_dir = os.path.join(models_dir, "versions")
+    published = sorted(os.listdir(versions_dir))
+    for old in published[:-TRAIN_KEEP_VERSIONS] if TRAIN_KEEP_VERSIONS > 0 else []:
+        if old != version:
+            shutil.rmtree(os.path.join(versions_dir, old), ignore_errors=True)
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0, 1)
+
+# -------------------- Training --------------------
+
+def train_and_save_global_models(since=None, full=False, seattype_file=None, penalty_file=None,
+                                 page_size=FEEDBACK_PAGE_SIZE):
+    """
+    Stream feedback (rows since `since`, default the published version's
+    watermark; local export files when given), update or retrain the models
+    and publish them as a new version. Incremental runs add trees fitted on
+    the new rows to the published forests and update the linear term exactly;
+    full=True (or no published version) fits from scratch on the row sample.
+    Returns (seat_type_model, penalty_model, disability_encoder).
+    """
+    import joblib
+    os.makedirs(VERSIONS_DIR, exist_ok=True)
+    started = time.perf_counter()
+    disability_encoder = build_disability_encoder()
+
+    # ----- Published version to start from -----
+    base_version, base_dir, manifest = (None, None, None) if full else current_version()
+    seat_type_model = penalty_model = None
+    seat_sample, pen_sample, pen_stats = RowSample(TRAIN_MAX_ROWS), RowSample(TRAIN_MAX_ROWS), LinearStats()
+    if base_version is not None:
+        try:
+            seat_sample, pen_sample, pen_stats = load_training_state(os.path.join(base_dir, "training_state.npz"))
+            for name in ("seat_type_model", "penalty_model"):
+                path = os.path.join(base_dir, f"{name}.pkl")
+                if os.path.exists(path):
+                    if name == "seat_type_model":
+                        seat_type_model = joblib.load(path)
+                    else:
+                        penalty_model = joblib.load(path)
+        except Exception as e:
+            print(f"[WARN] Could not load version {base_version} ({e}); retraining from scratch")
+            base_version, manifest = None, None
+            seat_type_model = penalty_model = None
+            seat_sample, pen_sample, pen_stats = RowSample(TRAIN_MAX_ROWS), RowSample(TRAIN_MAX_ROWS), LinearStats()
+    from_files = bool(seattype_file or penalty_file)
+    if since is None and manifest is not None and not from_files:
+        since = manifest.get("since")
+
+    # ----- Stream feedback -----
+    # the backend filters by day: without a watermark in its response, the next
+    # run starts at today's date (rows served again are dropped by the boundary)
+    watermark = {"since": time.strftime("%Y-%m-%d", time.gmtime()),
+                 "boundary": manifest.get("boundary") if manifest is not None else None}
+    new = {"seattype": RowSample(TRAIN_MAX_ROWS, seed=1), "penalty": RowSample(TRAIN_MAX_ROWS, seed=1)}
+    try:
+        for kind, X, y in iter_feedback_chunks(since, disability_encoder, seattype_file, penalty_file,
+                                               page_size, watermark):
+            if base_version is not None and not from_files and not watermark["incremental"]:
+                print("[INFO] GET /feedback has no watermark or nextCursor (since is ignored, so it served "
+                      "the whole history); retraining from scratch")
+                base_version, manifest = None, None
+                seat_type_model = penalty_model = None
+                seat_sample, pen_sample, pen_stats = RowSample(TRAIN_MAX_ROWS), RowSample(TRAIN_MAX_ROWS), LinearStats()
+            new[kind].add(X, y)
+            (seat_sample if kind == "seattype" else pen_sample).add(X, y)
+            if kind == "penalty":
+                pen_stats.add(X, y)
+    except Exception as e:
+        print(f"[WARN] Could not read training feedback: {e}; keeping the published models")
+        return seat_type_model, penalty_model, disability_encoder
+    streamed = new["seattype"].seen + new["penalty"].seen
+    read_seconds = time.perf_counter() - started
+    if base_version is not None and streamed == 0:
+        print(f"[INFO] No new feedback since {since}; version {base_version} stays published")
+        return seat_type_model, penalty_model, disability_encoder
 
     # ----- Seat Type Model -----
-    seat_type_model = None
-    if seat_recs:
-        X_seat, y_seat = [], []
-        for feat, seat_type in seat_recs:
-            onehot = disability_encoder.transform([[feat["disability"]]]).toarray()[0]
-            vec = [
-                feat["is_priority"],
-                feat["is_female"],
-                feat["is_in_group"],
-                feat["age"],
-                feat["norm_row"],
-                feat["norm_col"]
-            ] + list(onehot)
-            X_seat.append(vec)
-            y_seat.append(seat_type)
-
-        clf1 = RandomForestClassifier(n_estimators=150, random_state=42)
-        clf2 = ExtraTreesClassifier(n_estimators=200, random_state=42)
-        seat_type_model = VotingClassifier([("rf", clf1), ("et", clf2)], voting="soft")
-        seat_type_model.fit(np.array(X_seat), np.array(y_seat))
-        joblib.dump(seat_type_model, os.path.join(MODELS_DIR, "seat_type_model.pkl"))
-        print("✅ Saved models/seat_type_model.pkl")
+    if len(seat_sample):
+        if seat_type_model is None:
+            seat_type_model = new_seat_type_model().fit(seat_sample.X, seat_sample.y)
+        elif new["seattype"].seen >= TRAIN_MIN_NEW_ROWS:
+            try:
+                add_trees(seat_type_model, new["seattype"].X, new["seattype"].y)
+            except ValueError as e:
+                print(f"[WARN] Refitting the seat type model on the row sample: {e}")
+                seat_type_model = new_seat_type_model().fit(seat_sample.X, seat_sample.y)
 
     # ----- Penalty Model -----
-    penalty_model = None
-    if pen_recs:
-        X_pen, y_pen = [], []
-        for feat, score in pen_recs:
-            onehot = disability_encoder.transform([[feat["disability"]]]).toarray()[0]
-            vec = [
-                feat["is_priority"],
-                feat["is_female"],
-                feat["is_in_group"],
-                feat["age"],
-                feat["norm_row"],
-                feat["norm_col"],
-                feat["group_distance"]
-            ] + list(onehot)
-            X_pen.append(vec)
-            y_pen.append(score)
-
-        reg1 = LinearRegression()
-        reg2 = ExtraTreesRegressor(n_estimators=200, random_state=42)
-        penalty_model = VotingRegressor([("lr", reg1), ("et", reg2)])
-        penalty_model.fit(np.array(X_pen), np.array(y_pen))
-        joblib.dump(penalty_model, os.path.join(MODELS_DIR, "penalty_model.pkl"))
-        print("✅ Saved models/penalty_model.pkl")
-
-    # Save encoder
-    joblib.dump(disability_encoder, os.path.join(MODELS_DIR, "disability_encoder.pkl"))
-    print("✅ Saved models/disability_encoder.pkl")
+    if len(pen_sample):
+        if penalty_model is None:
+            penalty_model = new_penalty_model().fit(pen_sample.X, pen_sample.y)
+        elif new["penalty"].seen >= TRAIN_MIN_NEW_ROWS:
+            add_trees(penalty_model, new["penalty"].X, new["penalty"].y)
+        pen_stats.apply(penalty_model.named_estimators_["lr"])
 
+    # ----- Write the version (not served until publish_version names it in CURRENT) -----
+    version, directory = new_version_dir()
+    for name, model in (("seat_type_model", seat_type_model), ("penalty_model", penalty_model),
+                        ("disability_encoder", disability_encoder)):
+        if model is not None:
+            joblib.dump(model, os.path.join(directory, f"{name}.pkl"))
+            print(f"✅ Saved {os.path.join(directory, name)}.pkl")
+    if seat_type_model is not None or penalty_model is not None:
+        save_compiled_models(seat_type_model, penalty_model, seat_sample.X, pen_sample.X, directory)
+        save_lookup_tables(seat_type_model, penalty_model, disability_encoder, directory)
+    save_training_state(os.path.join(directory, "training_state.npz"), seat_sample, pen_sample, pen_stats)
+    seconds = time.perf_counter() - started
+    report = {
+        "version": version,
+        "parent": base_version,
+        "mode": "incremental" if base_version is not None else "full",
+        "since": watermark["since"] if not from_files else (manifest or {}).get("since"),
+        "boundary": watermark["boundary"] if not from_files else (manifest or {}).get("boundary"),
+        "rows": {"seattype": new["seattype"].seen, "penalty": new["penalty"].seen},
+        "rows_total": {"seattype": seat_sample.seen, "penalty": pen_sample.seen},
+        "trees": {name: [len(m.estimators_) for m in model.estimators_ if hasattr(m, "estimators_")]
+                  for name, model in (("seat_type_model", seat_type_model), ("penalty_model", penalty_model))
+                  if model is not None},
+        "read_seconds": round(read_seconds, 2),
+        "seconds": round(seconds, 2),
+        "rows_per_second": round(streamed / read_seconds, 1) if read_seconds > 0 else None,
+        "peak_rss_mb": _max_rss_mb(),
+    }
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    publish_version(version)
+    print(f"[INFO] {report['mode']} training: {streamed} rows read in {report['read_seconds']} s "
+          f"({report['rows_per_second']} rows/s), {report['seconds']} s total, "
+          f"peak RSS {report['peak_rss_mb']} MB -> version {version}")
     return seat_type_model, penalty_model, disability_encoder
 
-if __name__ == "__main__":
-    # Optional env var to do incremental training
-    SINCE = os.getenv("TRAIN_SINCE")
-    train_and_save_global_models(SINCE)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or update the global seat models.")
+    parser.add_argument("--since", default=os.getenv("TRAIN_SINCE"),
+                        help="feedback since YYYY-MM-DD (default: the published version's watermark)")
+    parser.add_argument("--full", action="store_true", help="retrain from scratch instead of updating")
+    parser.add_argument("--seattype-file", help="seat type rows from a local .csv/.parquet/.ndjson export")
+    parser.add_argument("--penalty-file", help="penalty rows from a local .csv/.parquet/.ndjson export")
+    parser.add_argument("--page-size", type=int, default=FEEDBACK_PAGE_SIZE, help="rows per GET /feedback page")
+    args = parser.parse_args(argv)
+    train_and_save_global_models(args.since, full=args.full, seattype_file=args.seattype_file,
+                                 penalty_file=args.penalty_file, page_size=args.page_size)
+    return 0
 
+if __name__ == "__main__":
+    sys.exit(main())
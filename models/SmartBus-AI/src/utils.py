@@ -3,6 +3,13 @@
 # PURPOSE: Centralized utility functions
 # ==============================================================================
 
+import collections
+import threading
+import time
+
+SEAT_TYPES = ("front", "window", "aisle")
+SEAT_ZONES = ("disability", "female_only", "general")
+
 def get_seat_type(seat, bus_layout):
     """
     Classify seat type (front, window, aisle) based on seat position & layout.
@@ -13,3 +20,67 @@ def get_seat_type(seat, bus_layout):
         return 'window'
     return 'aisle'
 
+
+def seat_allowed(passenger, seat):
+    """
+    Hard zone rules: no men in female-only rows, only priority passengers
+    (disabled or 60+) in accessible rows, wheelchair users only there.
+    """
+    if str(passenger.gender).lower() == "male" and seat.zone == "female_only":
+        return False
+    if not (passenger.is_disabled or passenger.age >= 60) and seat.zone == "disability":
+        return False
+    if passenger.requires_disability_zone and seat.zone != "disability":
+        return False
+    return True
+
+def group_passengers(passengers):
+    """
+    { group_id: [members in input order] } for passengers travelling in a group.
+    """
+    groups = collections.defaultdict(list)
+    for p in passengers:
+        if p.group_id:
+            groups[p.group_id].append(p)
+    return groups
+
+class TTLCache:
+    """
+    Bounded, thread-safe key -> value cache with per-entry expiry (LRU eviction).
+    """
+    def __init__(self, maxsize=10000, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,67 @@
+# ==============================================================================
+# FILE: warmup.py
+# PURPOSE: Startup warm-up (model load, solver imports, worker spawn) run in
+#          the background or before serving, and the readiness state it sets
+# ==============================================================================
+#
+# Importing the API only defines it; everything slow happens in the warm-up
+# steps. Until they finish, requests still work (each loads what it needs on
+# first use), but /ready answers 503 so a load balancer keeps traffic away.
+
+import os
+import time
+import threading
+
+# background = warm up on a thread after startup (default), eager = finish the
+# warm-up before serving, lazy = no warm-up (first requests load what they need)
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")
+STARTUP_MODES = ("background", "eager", "lazy")
+
+class Warmup:
+    """
+    Runs steps [(name, fn)] once, in order. ready turns True when all of
+    them succeeded; a failing step is reported and the rest still run.
+    """
+    def __init__(self, steps, mode=STARTUP_MODE):
+        if mode not in STARTUP_MODES:
+            raise ValueError(f"Unknown STARTUP_MODE: {mode}")
+        self.steps = steps
+        self.mode = mode
+        self.ready = False
+        self.seconds = {}
+        self.errors = {}
+        self._started = None
+        self._finished = None
+        self._thread = None
+
+    def run(self):
+        self._started = time.time()
+        for name, fn in self.steps:
+            step_started = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"[WARN] Warm-up step {name} failed: {e}")
+            self.seconds[name] = round(time.perf_counter() - step_started, 3)
+        self._finished = time.time()
+        self.ready = not self.errors
+        if self.ready:
+            print(f"[INFO] Warm-up done in {self._finished - self._started:.2f}s {self.seconds}")
+
+    def start(self):
+        """
+        Called on app startup: per mode, warm up now, on a thread, or not at
+        all (then ready right away).
+        """
+        if self.mode == "eager":
+            self.run()
+        elif self.mode == "lazy":
+            self.ready = True
+        elif self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        return {"ready": self.ready, "mode": self.mode, "steps": self.seconds, "errors": self.errors,
+                "seconds": round(self._finished - self._started, 3) if self._finished else None}
@@ -0,0 +1,62 @@
+# ==============================================================================
+# FILE: helpers.py
+# PURPOSE: Shared checks for the test suite
+# ==============================================================================
+
+import random
+
+from src.utils import seat_allowed
+from src.integrated_seat_ml_model import Passenger, get_bus_layout, onboard_cliques, rides_overlap
+
+def assert_valid_seating(passengers, bus, chosen):
+    """
+    Everyone seated, zone rules respected, no seat shared by overlapping rides.
+    """
+    assert set(chosen) == {p.id for p in passengers}
+    for p in passengers:
+        assert seat_allowed(p, bus.seat_map[chosen[p.id]]), (p.id, chosen[p.id])
+    for i, p in enumerate(passengers):
+        for q in passengers[i + 1:]:
+            assert not (chosen[p.id] == chosen[q.id] and rides_overlap(p, q)), (p.id, q.id, chosen[p.id])
+
+def best_seating_value(passengers, bus, objective):
+    """
+    Exhaustive maximum of objective.total over every valid seating (tiny
+    instances only): the reference the MILP formulations must reach.
+    """
+    allowed = [[s.id for s in bus.seats if seat_allowed(p, s)] for p in passengers]
+    best, chosen = [float("-inf")], {}
+
+    def place(k):
+        if k == len(passengers):
+            best[0] = max(best[0], objective.total(passengers, chosen))
+            return
+        p = passengers[k]
+        for seat_id in allowed[k]:
+            if any(chosen[q.id] == seat_id and rides_overlap(p, q) for q in passengers[:k]):
+                continue
+            chosen[p.id] = seat_id
+            place(k + 1)
+        chosen.pop(p.id, None)
+
+    place(0)
+    return best[0]
+
+def tiny_trip(seed, passengers=7, stops=6):
+    """
+    3x2 bus (front row accessible) and a multi-stop load of up to four riders
+    at a time, with a pair and (odd seeds) a trio: small enough for
+    best_seating_value, more riders than seats overall.
+    """
+    rng = random.Random(seed)
+    bus = get_bus_layout(3, 2, accessibility_rows=1, aisle_after=2, gender_zones={"female": []})
+    riders = []
+    while len(riders) < passengers:
+        source = rng.randint(0, stops - 2)
+        k = len(riders)
+        group = "pair" if k < 2 else "trio" if k < 5 and seed % 2 else None
+        p = Passenger(f"p{k}", age=rng.choice([30, 30, 45, 70]), group_id=group, source_stop=source,
+                      dest_stop=rng.randint(source + 1, stops - 1))
+        if max((len(c) for c in onboard_cliques(riders + [p])), default=1) <= 4:
+            riders.append(p)
+    return riders, bus
@@ -0,0 +1,59 @@
+import requests
+
+from src.allocation_outbox import AllocationOutbox
+
+
+class Backend:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.received = []
+
+    def __call__(self, payload):
+        if payload["version"] in self.failing:
+            self.failing.discard(payload["version"])
+            raise requests.ConnectionError("backend down")
+        self.received.append((payload["tripId"], payload["version"]))
+
+
+def outbox(tmp_path, sender):
+    return AllocationOutbox(path=str(tmp_path / "outbox.sqlite"), sender=sender)
+
+
+def test_only_the_latest_snapshot_of_a_trip_is_sent(tmp_path):
+    backend = Backend()
+    box = outbox(tmp_path, backend)
+    for version in (1, 2, 3):
+        box.enqueue("trip-1", {}, [], version=version)
+    box.enqueue("trip-2", {}, [], version=1)
+    assert box.drain_once() == 2
+    assert backend.received == [("trip-1", 3), ("trip-2", 1)]
+    assert box.stats()["coalesced"] == 2
+    box.close()
+
+
+def test_failed_snapshot_is_not_retried_over_a_newer_one(tmp_path):
+    backend = Backend(failing={1})
+    box = outbox(tmp_path, backend)
+    box.enqueue("trip-1", {}, [], version=1)
+    assert box.drain_once() == 0
+    box.enqueue("trip-1", {}, [], version=2)
+    box._conn.execute("UPDATE allocation_outbox SET next_attempt_at = 0")
+    assert box.drain_once() == 1
+    assert backend.received == [("trip-1", 2)]
+    assert box.stats()["depth"] == 0
+    box.close()
+
+
+def test_queues_from_before_coalescing_are_collapsed_on_open(tmp_path):
+    backend = Backend()
+    box = outbox(tmp_path, backend)
+    for version in (1, 2):
+        box._conn.execute(
+            "INSERT INTO allocation_outbox (trip_id, payload, enqueued_at, next_attempt_at) VALUES (?, ?, 0, 0)",
+            ("trip-1", '{"tripId": "trip-1", "version": %d}' % version))
+    box._conn.commit()
+    box.close()
+    box = outbox(tmp_path, backend)
+    assert box.drain_once() == 1
+    assert backend.received == [("trip-1", 2)]
+    box.close()
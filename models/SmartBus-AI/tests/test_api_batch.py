@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from src import api
+from src.solver_pool import PoolSaturated, SolverPool
+
+
+class FakeStore:
+    def sync(self, histories):
+        return {}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = SolverPool(workers=3, max_pending=0)
+
+    async def score(job, fn=None):
+        return [None] * len(job["problems"])
+
+    monkeypatch.setattr(pool, "solve", score)
+    monkeypatch.setattr(api, "solver_pool", pool)
+    monkeypatch.setattr(api, "fetch_passenger_histories", lambda ids: {})
+    monkeypatch.setattr(api, "get_personalization_store", FakeStore)
+    return pool
+
+
+def trips(n):
+    passenger = {"age": 30, "gender": "male", "disability": "None", "pickupStopId": 0, "dropStopId": 1}
+    return [api.SeatRequest(vehicle={"rows": 4, "columns": 4}, passengers=[{"id": f"t{k}", **passenger}])
+            for k in range(n)]
+
+
+def test_batch_trips_in_flight_hold_admission_slots(pool, monkeypatch):
+    seen = []
+
+    async def solve_trip(req, trip_id, *args, **kwargs):
+        seen.append(pool.in_flight)
+        await asyncio.sleep(0.01)
+        return {"assignments": [], "tripId": trip_id}
+
+    monkeypatch.setattr(api, "_solve_trip", solve_trip)
+
+    async def run():
+        pool.acquire()  # the batch's own slot (allocate_batch)
+        pool.acquire()  # a single /allocate: room for one more batch trip only
+        results = [r async for r in api.allocate_many(trips(6))]
+        return results
+
+    results = asyncio.run(run())
+    assert sorted(r["index"] for r in results) == list(range(6))
+    assert all(r["status"] == 200 for r in results)
+    assert max(seen) == pool.capacity
+    assert pool.in_flight == 2
+
+
+def test_stream_releases_the_slot_when_the_client_is_gone(pool):
+    pool.acquire()
+
+    async def lines():
+        yield b"{}\n"
+
+    async def send(message):
+        raise OSError("client disconnected")
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    response = api._AdmittedStream(lines(), media_type="application/x-ndjson")
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(Exception):
+        asyncio.run(response(scope, receive, send))
+    assert pool.in_flight == 0
+    with pytest.raises(PoolSaturated):
+        for _ in range(pool.capacity + 1):
+            pool.acquire()
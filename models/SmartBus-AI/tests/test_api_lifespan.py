@@ -0,0 +1,38 @@
+import warnings
+
+from fastapi.testclient import TestClient
+
+from src import api
+from src.model_registry import ModelRegistry
+from src.solver_pool import SolverPool
+from src.warmup import Warmup
+
+
+class RecordingOutbox:
+    def __init__(self, events):
+        self.events = events
+
+    def start(self):
+        self.events.append("outbox started")
+
+    def stop(self):
+        self.events.append("outbox stopped")
+
+
+def test_lifespan_starts_and_stops_background_work(tmp_path, monkeypatch):
+    events = []
+    outbox = RecordingOutbox(events)
+    pool = SolverPool(workers=0, max_pending=0, models_dir=str(tmp_path))
+    shutdown = pool.shutdown
+    monkeypatch.setattr(pool, "shutdown", lambda: (events.append("pool shut down"), shutdown()))
+    monkeypatch.setattr(api, "solver_pool", pool)
+    monkeypatch.setattr(api, "model_registry", ModelRegistry(str(tmp_path), interval=0))
+    monkeypatch.setattr(api, "warmup", Warmup([("probe", lambda: events.append("warmed up"))], mode="eager"))
+    monkeypatch.setattr(api, "get_allocation_outbox", lambda: outbox)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        with TestClient(api.app) as client:
+            assert events == ["outbox started", "warmed up"]
+            assert client.get("/ready").json()["status"] == "ready"
+    assert events[2:] == ["pool shut down", "outbox stopped"]
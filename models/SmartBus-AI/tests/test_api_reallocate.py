@@ -0,0 +1,84 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from src import api
+from src.allocation_store import AllocationStore
+from src.model_registry import ModelRegistry
+from src.personalization_store import PersonalizationStore
+from src.result_cache import ResultCache
+from src.solver_pool import SolverPool
+
+
+class NullOutbox:
+    def enqueue(self, **kwargs):
+        pass
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    store = AllocationStore(str(tmp_path / "allocations.sqlite"))
+    personalization = PersonalizationStore(str(tmp_path / "personal.sqlite"))
+    pool = SolverPool(workers=0, max_pending=4, models_dir=str(tmp_path))
+    results = ResultCache(maxsize=0)
+    monkeypatch.setattr(api, "solver_pool", pool)
+    monkeypatch.setattr(api, "model_registry", ModelRegistry(str(tmp_path), interval=0))
+    monkeypatch.setattr(api, "get_allocation_store", lambda: store)
+    monkeypatch.setattr(api, "get_personalization_store", lambda: personalization)
+    monkeypatch.setattr(api, "get_allocation_outbox", NullOutbox)
+    monkeypatch.setattr(api, "get_result_cache", lambda: results)
+    monkeypatch.setattr(api, "fetch_passenger_histories", lambda ids, deadline=None: {})
+    yield TestClient(api.app), store
+    pool.shutdown()
+    personalization.close()
+    store.close()
+
+
+def passenger(pid, **fields):
+    return {"id": pid, "age": 30, "gender": "male", "disability": "None", "pickupStopId": 0, "dropStopId": 3,
+            **fields}
+
+
+def allocate(client):
+    body = {"tripId": "t1", "vehicle": {"rows": 6, "columns": 4}, "mode": "heuristic",
+            "passengers": [passenger(f"p{k}") for k in range(6)]}
+    resp = client.post("/allocate", json=body)
+    assert resp.status_code == 200, resp.text
+    return {a["passengerId"]: a["seatId"] for a in resp.json()["assignments"]}
+
+
+def test_reallocate_keeps_seats_and_bumps_the_version(client):
+    client, store = client
+    before = allocate(client)
+    _, version = store.load("t1")
+    resp = client.post("/reallocate", json={"tripId": "t1", "add": [passenger("late")], "remove": ["p0"]})
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    after = {a["passengerId"]: a["seatId"] for a in body["assignments"]}
+    assert body["moved"] == 0 and body["solver"]["escalation"] is None
+    assert "p0" not in after and "late" in after
+    assert all(after[pid] == seat for pid, seat in before.items() if pid != "p0")
+    assert store.load("t1")[1] == version + 1
+
+
+def test_concurrent_change_is_a_409(client, monkeypatch):
+    client, store = client
+    allocate(client)
+    load = store.load
+
+    def load_then_lose_the_race(trip_id):
+        record, version = load(trip_id)
+        store.save(trip_id, record)  # another re-allocation commits first
+        return record, version
+
+    monkeypatch.setattr(store, "load", load_then_lose_the_race)
+    resp = client.post("/reallocate", json={"tripId": "t1", "add": [passenger("late")]})
+    assert resp.status_code == 409
+    assert "retry" in resp.json()["detail"]
+
+
+def test_unknown_trip_and_passengers(client):
+    client, _ = client
+    assert client.post("/reallocate", json={"tripId": "nope", "add": [passenger("x")]}).status_code == 404
+    allocate(client)
+    assert client.post("/reallocate", json={"tripId": "t1", "remove": ["ghost"]}).status_code == 422
+    assert client.post("/reallocate", json={"tripId": "t1", "add": [passenger("p1")]}).status_code == 422
@@ -0,0 +1,26 @@
+import json
+
+from src.benchmark import compare
+
+
+def row(case, total_s=1.0, objective=10.0, backend="cbc"):
+    return {"case": case, "backend": backend, "total_s": total_s, "objective": objective}
+
+
+def write_baseline(path, rows):
+    path.write_text(json.dumps({"results": rows}))
+    return str(path)
+
+
+def test_compare_matches_on_case_and_backend(tmp_path):
+    legacy = [{k: v for k, v in row("8x4/milp").items() if k != "backend"}]
+    baseline = write_baseline(tmp_path / "bench.json", legacy)
+    regressions, missing = compare([row("8x4/milp", objective=9.0)], baseline)
+    assert [r[0] for r in regressions] == ["8x4/milp"] and missing == []
+    regressions, missing = compare([row("8x4/milp", backend="highs")], baseline)
+    assert regressions == [] and missing == ["8x4/milp"]
+
+
+def test_compare_reports_renamed_cases(tmp_path):
+    baseline = write_baseline(tmp_path / "bench.json", [row("8x4/milp")])
+    assert compare([row("8x4/milp-highs", backend="highs")], baseline) == ([], ["8x4/milp-highs"])
@@ -0,0 +1,58 @@
+import functools
+
+import pytest
+
+from helpers import assert_valid_seating, best_seating_value, tiny_trip
+from src import integrated_seat_ml_model as ism
+from src.heuristic_allocator import SeatingObjective
+from src.integrated_seat_ml_model import Passenger, optimize_seating_with_ml
+from src.scoring import score_problem
+
+interchangeable_units = ism.interchangeable_units
+
+
+def commuters():
+    """
+    Four interchangeable solos (same ride and profile), a wheelchair user
+    and a pair, on the 3x2 bus of tiny_trip.
+    """
+    _, bus = tiny_trip(0)
+    passengers = [Passenger(f"c{k}", source_stop=0, dest_stop=3) for k in range(4)]
+    passengers += [Passenger("w", disability="Wheelchair", source_stop=1, dest_stop=4),
+                   Passenger("a", group_id="pair", source_stop=3, dest_stop=5),
+                   Passenger("b", group_id="pair", source_stop=3, dest_stop=5)]
+    return passengers, bus
+
+
+def solve(passengers, bus, scores, merge, monkeypatch, cohesion="pairwise"):
+    monkeypatch.setattr(ism, "interchangeable_units",
+                        functools.partial(interchangeable_units, merge=merge))
+    info = {}
+    details = optimize_seating_with_ml(passengers, bus, cohesion=cohesion, scores=scores, solve_info=info)
+    assert_valid_seating(passengers, bus, {pid: d["seat_id"] for pid, d in details.items()})
+    return info
+
+
+@pytest.mark.parametrize("merge", [True, False])
+@pytest.mark.parametrize("cohesion", ["pairwise", "compact"])
+@pytest.mark.parametrize("trip", ["commuters", "tiny0", "tiny1"])
+def test_sparse_model_reaches_the_exhaustive_optimum(trip, cohesion, merge, monkeypatch):
+    passengers, bus = commuters() if trip == "commuters" else tiny_trip(int(trip[-1]))
+    scores = score_problem(passengers, bus)
+    info = solve(passengers, bus, scores, merge, monkeypatch, cohesion)
+    reference = best_seating_value(passengers, bus, SeatingObjective(passengers, bus, scores, cohesion))
+    assert info["status"] == "Optimal"
+    assert info["objective"] == pytest.approx(reference, rel=1e-9, abs=1e-6)
+
+
+def test_merging_and_pruning_shrink_the_model(monkeypatch):
+    passengers, bus = commuters()
+    scores = score_problem(passengers, bus)
+    merged = solve(passengers, bus, scores, True, monkeypatch)
+    separate = solve(passengers, bus, scores, False, monkeypatch)
+    assert merged["objective"] == pytest.approx(separate["objective"])
+    assert merged["variables"] < separate["variables"]
+    # the wheelchair user only gets variables in the accessible front row
+    wheelchair = ism.candidate_seats(passengers, bus)[4]
+    assert {bus.seats[j].row for j in wheelchair.nonzero()[0]} == {bus.seats[0].row}
+    assert wheelchair.sum() < len(bus.seats)
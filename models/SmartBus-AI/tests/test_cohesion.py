@@ -0,0 +1,48 @@
+import pytest
+
+from src.heuristic_allocator import SeatingObjective
+from src.integrated_seat_ml_model import Passenger, get_bus_layout, optimize_seating_with_ml
+from src.scoring import score_problem
+
+
+def grouped_trip():
+    """
+    Ten-row bus (seat ids sort "10A" before "9A") with a trio and a pair
+    on one ride, no ML terms: both formulations score adjacency alone.
+    """
+    bus = get_bus_layout(10, 2, accessibility_rows=0, aisle_after=2, gender_zones={"female": []})
+    groups = ["trio"] * 3 + ["pair"] * 2
+    return [Passenger(f"p{k}", group_id=g) for k, g in enumerate(groups)], bus
+
+
+@pytest.mark.parametrize("cohesion", ["pairwise", "compact"])
+def test_adjacency_pays_in_either_seat_order(cohesion):
+    bus = get_bus_layout(12, 2, accessibility_rows=0, aisle_after=2, gender_zones={"female": []})
+    pair = [Passenger("a", group_id="g"), Passenger("b", group_id="g")]
+    objective = SeatingObjective(pair, bus, score_problem(pair, bus), cohesion)
+    assert objective.total(pair, {"a": "9A", "b": "10A"}) == objective.total(pair, {"a": "10A", "b": "9A"}) > 0
+
+
+def test_pairwise_and_compact_reach_the_same_optimum():
+    passengers, bus = grouped_trip()
+    scores = score_problem(passengers, bus)
+    values = {}
+    for cohesion in ("pairwise", "compact"):
+        info = {}
+        optimize_seating_with_ml(passengers, bus, cohesion=cohesion, scores=scores, solve_info=info)
+        assert info["status"] == "Optimal"
+        values[cohesion] = info["objective"]
+    assert values["pairwise"] == pytest.approx(values["compact"])
+
+
+@pytest.mark.parametrize("cohesion", ["pairwise", "compact"])
+def test_milp_pays_adjacency_in_either_seat_order(cohesion):
+    bus = get_bus_layout(11, 1, accessibility_rows=0, aisle_after=2, gender_zones={"female": []})
+    pair = [Passenger("a", group_id="g"), Passenger("b", group_id="g")]
+    scores = score_problem(pair, bus)
+    values = []
+    for seats in ({"a": {"9A"}, "b": {"10A"}}, {"a": {"10A"}, "b": {"9A"}}):
+        info = {}
+        optimize_seating_with_ml(pair, bus, cohesion=cohesion, scores=scores, solve_info=info, allowed_seats=seats)
+        values.append(info["objective"])
+    assert values[0] == pytest.approx(values[1])
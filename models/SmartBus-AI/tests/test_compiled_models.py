@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import ExtraTreesClassifier, VotingClassifier
+
+from src.compiled_models import export_compiled_models, load_compiled_models, parity_error
+from src.train_global_models import (SEAT_TYPE_COLUMNS, build_disability_encoder, feature_matrix, new_penalty_model,
+                                     new_seat_type_model)
+
+SEAT_TYPES = np.array(["front", "middle", "rear", "window"])
+
+
+def feedback(n, seed=0, group_distance=False):
+    rng = np.random.default_rng(seed)
+    rows = [{"is_priority": int(rng.random() < 0.2), "is_female": int(rng.random() < 0.5),
+             "is_in_group": int(rng.random() < 0.3), "age": int(rng.integers(5, 90)),
+             "norm_row": float(rng.integers(0, 12)) / 11.0, "norm_col": float(rng.integers(0, 4)) / 3.0,
+             "group_distance": int(rng.integers(0, 3)),
+             "disability": str(rng.choice(["None", "None", "Wheelchair", "Visual Impairment"]))} for _ in range(n)]
+    columns = SEAT_TYPE_COLUMNS + (["group_distance"] if group_distance else [])
+    return feature_matrix(rows, columns, build_disability_encoder())
+
+
+@pytest.fixture(scope="module")
+def compiled(tmp_path_factory):
+    X_seat, X_pen = feedback(400, seed=1), feedback(400, seed=2, group_distance=True)
+    rng = np.random.default_rng(3)
+    y_seat = np.where(rng.random(len(X_seat)) < 0.3, rng.choice(SEAT_TYPES, len(X_seat)),
+                      SEAT_TYPES[(X_seat[:, 4] * 3.99).astype(int)])
+    y_pen = 5.0 * X_pen[:, 4] - 2.0 * X_pen[:, 6] + rng.normal(0, 0.5, len(X_pen))
+    seat_type_model = new_seat_type_model().fit(X_seat, y_seat)
+    penalty_model = new_penalty_model().fit(X_pen, y_pen)
+    path = export_compiled_models(str(tmp_path_factory.mktemp("compiled") / "global_models.npz"),
+                                  seat_type_model, penalty_model)
+    return seat_type_model, penalty_model, load_compiled_models(path)
+
+
+def test_classifier_probabilities_match_sklearn_exactly(compiled):
+    seat_type_model, _, models = compiled
+    X = feedback(500, seed=4)
+    np.testing.assert_array_equal(models["seat_type_model"].predict_proba(X), seat_type_model.predict_proba(X))
+    np.testing.assert_array_equal(models["seat_type_model"].classes_, seat_type_model.classes_)
+
+
+def test_classifier_argmax_matches_sklearn(compiled):
+    seat_type_model, _, models = compiled
+    X = feedback(500, seed=5)
+    np.testing.assert_array_equal(models["seat_type_model"].predict(X), seat_type_model.predict(X))
+    assert parity_error(seat_type_model, models["seat_type_model"], X) == 0.0
+
+
+def test_regressor_output_matches_sklearn_exactly(compiled):
+    _, penalty_model, models = compiled
+    X = feedback(500, seed=6, group_distance=True)
+    np.testing.assert_array_equal(models["penalty_model"].predict(X), penalty_model.predict(X))
+
+
+def test_tied_soft_vote_picks_the_lowest_class_index(tmp_path):
+    # identical rows with opposite labels: every leaf, and so every vote, is 1/3 : 1/3 : 1/3
+    X = np.zeros((6, 3))
+    y = np.array(["b", "a", "c", "c", "a", "b"])
+    model = VotingClassifier([("a", ExtraTreesClassifier(n_estimators=7, random_state=0)),
+                              ("b", ExtraTreesClassifier(n_estimators=3, random_state=1)),
+                              ("c", ExtraTreesClassifier(n_estimators=5, random_state=2))], voting="soft").fit(X, y)
+    compiled = load_compiled_models(export_compiled_models(str(tmp_path / "m.npz"), model))["seat_type_model"]
+    np.testing.assert_array_equal(compiled.predict_proba(X), model.predict_proba(X))
+    assert list(compiled.predict(X)) == list(model.predict(X)) == ["a"] * len(X)
+
+
+def test_weighted_vote_matches_sklearn(tmp_path):
+    X = feedback(200, seed=7)
+    y = SEAT_TYPES[(X[:, 5] * 3.99).astype(int)]
+    model = VotingClassifier([("a", ExtraTreesClassifier(n_estimators=10, random_state=0)),
+                              ("b", ExtraTreesClassifier(n_estimators=10, max_depth=2, random_state=1))],
+                             voting="soft", weights=[3, 1]).fit(X, y)
+    compiled = load_compiled_models(export_compiled_models(str(tmp_path / "m.npz"), model))["seat_type_model"]
+    X_test = feedback(300, seed=8)
+    np.testing.assert_array_equal(compiled.predict_proba(X_test), model.predict_proba(X_test))
+    np.testing.assert_array_equal(compiled.predict(X_test), model.predict(X_test))
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import pytest
+
+from helpers import assert_valid_seating
+from src.benchmark import LAYOUT_KWARGS, generate_scenario
+from src.decomposition import optimize_seating_decomposed
+from src.scoring import score_problem
+from src.solver_pool import SolverPool
+
+
+def scenario(seed=0):
+    passengers, bus = generate_scenario(10, 4, "families", "accessible", 2, seed=seed)
+    return passengers, bus, score_problem(passengers, bus)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_blocks_combine_into_a_valid_seating_with_a_gap(seed):
+    passengers, bus, scores = scenario(seed)
+    info = {}
+    chosen = optimize_seating_decomposed(passengers, bus, scores, time_limit=5, lp_bound=True, solve_info=info)
+    assert_valid_seating(passengers, bus, chosen)
+    assert info["blocks"] > 1
+    assert info["bound"] is not None and info["gap"] >= 0.0
+
+
+def test_lp_bound_is_off_by_default():
+    passengers, bus, scores = scenario()
+    info = {}
+    chosen = optimize_seating_decomposed(passengers, bus, scores, time_limit=5, solve_info=info)
+    assert_valid_seating(passengers, bus, chosen)
+    assert info["bound"] is None and info["gap"] is None
+    assert info["solve_seconds"] > 0.0
+
+
+def test_blocks_without_time_left_are_seated_by_the_heuristic():
+    passengers, bus, scores = scenario()
+    info = {}
+    started = time.monotonic()
+    chosen = optimize_seating_decomposed(passengers, bus, scores, time_limit=1e-6, solve_info=info)
+    # no per-block floor: the blocks do not each get a second
+    assert time.monotonic() - started < 1.0 * info["blocks"]
+    assert_valid_seating(passengers, bus, chosen)
+    assert info["heuristic_blocks"] == info["blocks"]
+    assert info["variables"] == 0
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_pool_runs_each_block_as_a_job(workers, tmp_path):
+    passengers, bus, _ = scenario(1)
+    pool = SolverPool(workers=workers, max_pending=0, models_dir=str(tmp_path))
+    layout = {"rows": 10, "cols": 4, **LAYOUT_KWARGS}
+    try:
+        details, info = asyncio.run(pool.solve_decomposed({"passengers": passengers, "layout": layout,
+                                                           "mode": "decomposed", "time_limit": 30}))
+    finally:
+        pool.shutdown()
+    assert_valid_seating(passengers, bus, {pid: d["seat_id"] for pid, d in details.items()})
+    assert info["engine"] == "decomposed"
+    assert info["blocks"] > 1 and info["gap"] is None
+    assert info["timings"]["decomposition"] > 0.0
+    # block MILPs are reported like a monolithic solve's
+    assert info["timings"]["cbc_solve"] > 0.0 and info["timings"]["model_build"] > 0.0
@@ -0,0 +1,114 @@
+import itertools
+
+import pytest
+
+from src import api
+from src.benchmark import make_stub_models
+from src.explain_utils import REASON_CODES, explain_assignment, reason_codes, render_explanation
+from src.integrated_seat_ml_model import Passenger, build_assignment_details, get_bus_layout
+from src.lookup_tables import SeatPreferenceTables
+from src.scoring import SEAT_TYPE_BONUS, predicted_seat_types, seat_type_bonus_matrix
+from src.utils import get_seat_type
+
+# 4x3: row 0 accessible, row 3 female-only
+BUS = get_bus_layout(4, 3, accessibility_rows=1, gender_zones={"female": [3]})
+
+
+def legacy_explanation(passenger, seat, bus_layout, predicted_type=None, is_personalized=False):
+    """The explanation as it was written one line at a time before reason codes."""
+    explanation = [f"Passenger {passenger.id} (Age: {passenger.age}) -> Seat {seat.id}"]
+    if is_personalized:
+        explanation.append("• Personalized choice based on past history.")
+    if passenger.group_id:
+        explanation.append("• Group cohesion prioritized.")
+    if predicted_type and predicted_type == get_seat_type(seat, bus_layout):
+        explanation.append(f"• Global model matched seat type: {predicted_type}.")
+    if seat.zone == 'female_only' and str(passenger.gender).lower() == 'female':
+        explanation.append("• Female-only zone respected for safety.")
+    if seat.zone == 'disability':
+        if passenger.disability.lower() == 'wheelchair':
+            explanation.append("• Accessible seat required for Wheelchair (mandatory).")
+        elif passenger.disability.lower() != 'none':
+            explanation.append(f"• Accessible seat for {passenger.disability}.")
+        elif passenger.age >= 60:
+            explanation.append("• Senior priority in accessible zone.")
+    if len(explanation) == 1:
+        explanation.append("• Standard assignment based on availability.")
+    return "\n".join(explanation)
+
+
+def every_case():
+    profiles = itertools.product([30, 70], ["Male", "Female"], ["None", "Wheelchair", "Visual Impairment"],
+                                 [None, "g1"])
+    passengers = [Passenger(f"p{k}", age=age, gender=gender, disability=disability, group_id=group)
+                  for k, (age, gender, disability, group) in enumerate(profiles)]
+    for p, seat, predicted, personalized in itertools.product(passengers, BUS.seats, [None, "window", "aisle"],
+                                                              [False, True]):
+        yield p, seat, predicted, personalized
+
+
+@pytest.mark.parametrize("personalized", [False, True])
+def test_rendered_explanations_match_the_legacy_text(personalized):
+    cases = [case for case in every_case() if case[3] == personalized]
+    passengers = [p for p, *_ in cases]
+    # one batch for the whole grid, as _build_results does for a trip
+    codes = reason_codes(passengers, [seat.id for _, seat, *_ in cases], BUS,
+                         [predicted for _, _, predicted, _ in cases],
+                         personalized={p.id for p in passengers} if personalized else ())
+    for (p, seat, predicted, _), reasons in zip(cases, codes):
+        expected = legacy_explanation(p, seat, BUS, predicted, personalized)
+        assert render_explanation(p, seat.id, reasons, predicted) == expected
+        assert explain_assignment(p, seat, BUS, predicted, personalized) == expected
+
+
+@pytest.mark.parametrize("code, passenger, seat_id, predicted, personalized", [
+    ("personalized", Passenger("a"), "2B", None, True),
+    ("group", Passenger("a", group_id="g"), "2B", None, False),
+    ("model_seat_type", Passenger("a"), "2A", "window", False),
+    ("female_zone", Passenger("a", gender="Female"), "4B", None, False),
+    ("wheelchair", Passenger("a", disability="Wheelchair"), "1A", None, False),
+    ("accessible", Passenger("a", disability="Visual Impairment"), "1B", None, False),
+    ("senior", Passenger("a", age=75), "1C", None, False),
+    ("standard", Passenger("a", age=75), "2B", "window", False),
+])
+def test_each_reason_code(code, passenger, seat_id, predicted, personalized):
+    assert get_seat_type(BUS.seat_map["2A"], BUS) == "window" and get_seat_type(BUS.seat_map["2B"], BUS) != "window"
+    reasons = reason_codes([passenger], [seat_id], BUS, [predicted],
+                           personalized={passenger.id} if personalized else ())[0]
+    assert reasons == (code,)
+    assert code in REASON_CODES
+
+
+@pytest.fixture(scope="module")
+def stub_models():
+    return make_stub_models()
+
+
+def test_predicted_seat_types_are_the_models_choice_in_the_given_seat(stub_models):
+    seat_type_model, _, encoder = stub_models
+    passengers = [Passenger(f"p{k}", age=age, gender=gender, disability=disability)
+                  for k, (age, gender, disability) in enumerate(itertools.product(
+                      [8, 35, 72], ["Male", "Female"], ["None", "Wheelchair", "Hearing Impairment"]))]
+    seat_ids = [BUS.seats[k % len(BUS.seats)].id for k in range(len(passengers))]
+    predicted = predicted_seat_types(passengers, BUS, seat_ids, seat_type_model, encoder)
+
+    bonus = seat_type_bonus_matrix(passengers, BUS, seat_type_model, encoder)
+    for i, (seat_id, seat_type) in enumerate(zip(seat_ids, predicted)):
+        j = BUS.seat_index[seat_id]
+        assert (seat_type == BUS.seat_types[j]) == (bonus[i, j] == SEAT_TYPE_BONUS)
+
+    lookup = SeatPreferenceTables(seat_type_model, None, encoder)
+    lookup.prepare(BUS.rows, BUS.cols)
+    assert predicted_seat_types(passengers, BUS, seat_ids, seat_type_model, encoder, lookup) == predicted
+    assert predicted_seat_types(passengers, BUS, seat_ids) == [None] * len(passengers)
+
+
+def test_model_seat_type_reason_follows_the_prediction_not_the_seat():
+    passengers = [Passenger("a"), Passenger("b"), Passenger("c")]
+    assignments = build_assignment_details(passengers, BUS, {"a": "2A", "b": "2B", "c": "3A"})
+    assignments["a"]["predicted_seat_type"] = "window"   # matches 2A
+    assignments["b"]["predicted_seat_type"] = "window"   # 2B is not a window seat
+    rows, snapshot = api._build_results("trip", passengers, BUS, assignments, {}, explain="codes")
+    reasons = {row["passengerId"]: row["reasons"] for row in rows}
+    assert reasons == {"a": ("model_seat_type",), "b": ("standard",), "c": ("standard",)}
+    assert "Global model matched seat type: window." in snapshot[0]["explanation"]
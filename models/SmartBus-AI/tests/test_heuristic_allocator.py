@@ -0,0 +1,58 @@
+import pytest
+
+from helpers import assert_valid_seating
+from src.utils import seat_allowed
+from src.allocator import allocate_seating
+from src.benchmark import generate_scenario
+from src.scoring import score_problem
+from src.integrated_seat_ml_model import Passenger, get_bus_layout
+from src.heuristic_allocator import SeatingObjective, ZoneLedger, greedy_seating, heuristic_seating, repair_seating
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("mix", ["pairs", "families"])
+def test_greedy_seats_multi_stop_loads(mix, seed):
+    passengers, bus = generate_scenario(10, 4, mix, "standard", 6, seed=seed)
+    scores = score_problem(passengers, bus)
+    objective = SeatingObjective(passengers, bus, scores)
+    allowed = {p.id: [s for s in bus.seats if seat_allowed(p, s)] for p in passengers}
+    chosen = greedy_seating(passengers, bus, objective, allowed)
+    assert chosen is not None
+    assert_valid_seating(passengers, bus, chosen)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_heuristic_mode_does_not_fall_back_on_family_loads(seed):
+    passengers, bus = generate_scenario(10, 4, "families", "accessible", 6, seed=seed)
+    details, info = allocate_seating(passengers, bus, mode="heuristic", time_limit=10)
+    assert info["engine"] == "heuristic"
+    assert info["timings"]["cbc_solve"] == 0.0
+    assert_valid_seating(passengers, bus, {pid: d["seat_id"] for pid, d in details.items()})
+
+def test_heuristic_objective_matches_reported_value():
+    passengers, bus = generate_scenario(8, 4, "families", "standard", 6, seed=1)
+    scores = score_problem(passengers, bus)
+    chosen, value = heuristic_seating(passengers, bus, scores)
+    assert value == pytest.approx(SeatingObjective(passengers, bus, scores).total(passengers, chosen))
+
+def test_ledger_holds_accessible_seats_for_later_wheelchair_users():
+    bus = get_bus_layout(3, 2, accessibility_rows=1, gender_zones={"female": []})
+    senior = Passenger("senior", age=70, source_stop=0, dest_stop=5)
+    wheelchair = [Passenger(f"w{i}", disability="Wheelchair", source_stop=1, dest_stop=5) for i in range(2)]
+    passengers = [senior] + wheelchair
+    allowed = {p.id: [s for s in bus.seats if seat_allowed(p, s)] for p in passengers}
+    ledger = ZoneLedger(passengers, bus, allowed)
+    assert not ledger.fits(senior, "disability")
+    assert ledger.fits(senior, "general")
+
+    chosen = greedy_seating(passengers, bus, SeatingObjective(passengers, bus, score_problem(passengers, bus)), allowed)
+    assert bus.seat_map[chosen["senior"]].zone == "general"
+    assert_valid_seating(passengers, bus, chosen)
+
+def test_repair_pushes_a_blocker_to_a_free_seat():
+    bus = get_bus_layout(1, 2, accessibility_rows=0, gender_zones={"female": []})
+    first, second = bus.seats
+    rider = Passenger("rider", source_stop=0, dest_stop=4)
+    late = Passenger("late", source_stop=2, dest_stop=4)
+    allowed = {"rider": [first, second], "late": [first]}
+    occupants = {first.id: [rider], second.id: []}
+    assert repair_seating(late, allowed, occupants) == [(late, first.id), (rider, second.id)]
+    assert repair_seating(late, allowed, occupants, depth=0) is None
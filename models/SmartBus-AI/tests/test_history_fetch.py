@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from src import ml_feedback_integration as mfi
+
+
+class Backend(ThreadingHTTPServer):
+    """
+    Stand-in backend on localhost: GET /histories?ids= (unless batch=False,
+    then 404) and /histories/{id}, each answer delayed by delays[id] seconds.
+    Records every request as (path, query, client port).
+    """
+    daemon_threads = True
+
+    def __init__(self, histories, batch=True, delays=None):
+        super().__init__(("127.0.0.1", 0), HistoryHandler)
+        self.histories = histories
+        self.batch = batch
+        self.delays = delays or {}
+        self.calls = []
+        self.released = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def paths(self):
+        with self._lock:
+            return sorted(path for path, _, _ in self.calls)
+
+
+class HistoryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as the backend serves it
+
+    def do_GET(self):
+        backend = self.server
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with backend._lock:
+            backend.calls.append((url.path, query, self.client_address[1]))
+        if url.path == "/histories":
+            if not backend.batch:
+                return self.reply(404, {"error": "not found"})
+            return self.reply(200, {pid: backend.histories[pid] for pid in query["ids"].split(",")
+                                    if pid in backend.histories})
+        pid = url.path.rsplit("/", 1)[1]
+        backend.released.wait(backend.delays.get(pid, 0.0))
+        self.reply(200, backend.histories.get(pid, []))
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # the client gave up (timeout)
+
+    def log_message(self, *args):
+        pass
+
+
+def record(score):
+    return {"norm_row": 0.5, "norm_col": 0.5, "feedback_score": score}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    servers = []
+
+    def start(**kwargs):
+        server = Backend({"a": [record(1)], "b": [record(2)], "c": []}, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(mfi, "BACKEND_BASE_URL", server.url)
+        return server
+
+    mfi.history_cache.clear()
+    monkeypatch.setattr(mfi, "_batch_unsupported_until", 0.0)
+    monkeypatch.setattr(mfi, "_session", None)  # a fresh requests.Session per test
+    yield start
+    if mfi._session is not None:
+        mfi._session.close()
+    for server in servers:
+        server.released.set()
+        server.shutdown()
+        server.server_close()
+    mfi.history_cache.clear()
+
+
+def test_batch_endpoint_then_cache(backend):
+    server = backend()
+    histories = mfi.fetch_passenger_histories(["a", "b", "c", "a"])
+    assert histories == {"a": [record(1)], "b": [record(2)], "c": []}
+    assert server.calls[0][:2] == ("/histories", {"ids": "a,b,c"})
+    assert mfi.fetch_passenger_histories(["a", "b"]) == {"a": [record(1)], "b": [record(2)]}
+    assert server.paths() == ["/histories"]
+
+
+def test_missing_batch_endpoint_falls_back_to_per_id_gets(backend):
+    server = backend(batch=False)
+    assert mfi.fetch_passenger_histories(["a", "b"]) == {"a": [record(1)], "b": [record(2)]}
+    assert server.paths() == ["/histories", "/histories/a", "/histories/b"]
+    # remembered: the next miss goes straight to the per-id endpoint
+    server.calls.clear()
+    mfi.fetch_passenger_histories(["c", "d"])
+    assert server.paths() == ["/histories/c", "/histories/d"]
+
+
+def test_slow_histories_are_empty_after_the_deadline(backend, monkeypatch):
+    server = backend(batch=False, delays={"b": 5.0})
+    finished = {}
+    get_history = mfi._get_history
+
+    def timed_get_history(pid, timeout=5):
+        result = get_history(pid, timeout)
+        finished[pid] = (time.monotonic(), result)
+        return result
+
+    monkeypatch.setattr(mfi, "_get_history", timed_get_history)
+    started = time.monotonic()
+    histories = mfi.fetch_passenger_histories(["a", "b"], deadline=0.3)
+    assert time.monotonic() - started < 1.0
+    assert histories == {"a": [record(1)], "b": []}
+    assert server.paths() == ["/histories", "/histories/a", "/histories/b"]
+    # a timed-out history is not cached as empty
+    assert mfi.history_cache.get("b") is None
+    # no request outlives the deadline: the slow GET hit its read timeout
+    time.sleep(0.5)
+    finished_at, result = finished["b"]
+    assert result is None and finished_at - started < 0.6
+
+
+def test_sequential_fetches_reuse_one_connection(backend):
+    server = backend()
+    assert mfi.fetch_passenger_history("a") == [record(1)]
+    assert mfi.fetch_passenger_history("b") == [record(2)]
+    assert mfi.fetch_passenger_history("a") == [record(1)]  # cached
+    assert [path for path, _, _ in server.calls] == ["/histories/a", "/histories/b"]
+    assert len({port for _, _, port in server.calls}) == 1
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from src.integrated_seat_ml_model import BusLayout, _cached_layout, get_bus_layout
+from src.utils import get_seat_type
+
+ARRAYS = ("seat_rows", "seat_cols", "norm_coords", "seat_types", "seat_type_codes", "distances")
+
+
+def assert_same_layout(layout, fresh):
+    assert [(s.id, s.row, s.col, s.zone, s.is_accessible) for s in layout.seats] == \
+        [(s.id, s.row, s.col, s.zone, s.is_accessible) for s in fresh.seats]
+    assert sorted(layout.adjacent_pairs) == sorted(fresh.adjacent_pairs)
+    assert layout.seat_index == fresh.seat_index
+    for name in ARRAYS:
+        assert np.array_equal(getattr(layout, name), getattr(fresh, name)), name
+    assert layout.zone_masks.keys() == fresh.zone_masks.keys()
+    for zone, mask in layout.zone_masks.items():
+        assert np.array_equal(mask, fresh.zone_masks[zone]), zone
+
+
+def test_cached_layouts_are_reused():
+    _cached_layout.cache_clear()
+    bus = get_bus_layout(9, 4, accessibility_rows=1, gender_zones={"female": [3, 4]}, aisle_after=2)
+    assert get_bus_layout(9, 4, accessibility_rows=1, gender_zones={"female": [3, 4]}, aisle_after=2) is bus
+    info = _cached_layout.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+    # the default zones and the same zones spelled out share one entry
+    default = get_bus_layout(9, 4)
+    assert get_bus_layout(9, 4, accessibility_rows=2, gender_zones={"female": [2, 3]}, aisle_after=1) is default
+    assert default is not bus
+    assert _cached_layout.cache_info().currsize == 2
+
+
+def test_cached_layout_matches_a_freshly_built_one():
+    bus = get_bus_layout(7, 5, accessibility_rows=1, gender_zones={"female": [4]}, aisle_after=2)
+    assert_same_layout(bus, BusLayout(7, 5, accessibility_rows=1, gender_zones={"female": [4]}, aisle_after=2))
+
+
+def test_cached_arrays_are_read_only():
+    bus = get_bus_layout(5, 4)
+    for arr in [getattr(bus, name) for name in ARRAYS] + list(bus.zone_masks.values()):
+        with pytest.raises(ValueError):
+            arr[0] = arr[0]
+
+
+@pytest.mark.parametrize("pick", ["all", "front_rows", "window_seats", "shuffled"])
+def test_subset_matches_a_freshly_built_layout(pick):
+    bus = get_bus_layout(8, 4, accessibility_rows=2, gender_zones={"female": [4, 5]}, aisle_after=2)
+    fresh = BusLayout(8, 4, accessibility_rows=2, gender_zones={"female": [4, 5]}, aisle_after=2)
+    seat_ids = [s.id for s in fresh.seats]
+    if pick == "front_rows":
+        seat_ids = [s.id for s in fresh.seats if s.row < 3]
+    elif pick == "window_seats":
+        seat_ids = [s.id for s in fresh.seats if s.col in (0, 3)]
+    elif pick == "shuffled":
+        seat_ids = list(np.random.default_rng(0).permutation(seat_ids)[:13])
+    sub = bus.subset(seat_ids)
+    if pick == "all":
+        assert_same_layout(sub, fresh)
+
+    keep = set(seat_ids)
+    seats = [fresh.seat_map[sid] for sid in seat_ids]
+    assert [s.id for s in sub.seats] == seat_ids
+    assert sub.seat_index == {sid: j for j, sid in enumerate(seat_ids)}
+    assert sorted(sub.adjacent_pairs) == sorted(pair for pair in fresh.adjacent_pairs
+                                                if pair[0] in keep and pair[1] in keep)
+    assert np.array_equal(sub.seat_rows, [s.row for s in seats])
+    assert np.array_equal(sub.seat_cols, [s.col for s in seats])
+    assert np.allclose(sub.norm_coords, [(s.row / 7, s.col / 3) for s in seats])
+    assert list(sub.seat_types) == [get_seat_type(s, fresh) for s in seats]
+    for zone, mask in sub.zone_masks.items():
+        assert list(mask) == [s.zone == zone for s in seats]
+    assert np.array_equal(sub.distances, [[abs(a.row - b.row) + abs(a.col - b.col) for b in seats] for a in seats])
+    # the shared cached layout is left as it was
+    assert_same_layout(bus, fresh)
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from src import lookup_tables
+from src.benchmark import make_stub_models
+from src.lookup_tables import LOOKUP_AGE_BUCKET, SeatPreferenceTables, accuracy_report
+
+
+@pytest.fixture(scope="module")
+def stub_models():
+    return make_stub_models()
+
+
+class FlakyModel:
+    """Raises on the first `failures` predictions, then delegates."""
+    def __init__(self, model, failures=1):
+        self.model, self.failures, self.calls = model, failures, 0
+
+    def predict(self, X):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("model file not readable yet")
+        return self.model.predict(X)
+
+
+def wait_for_tables(lookup, rows, cols, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        arrays = lookup.tables(rows, cols)
+        if arrays is not None:
+            return arrays
+        time.sleep(0.05)
+    return None
+
+
+def test_default_age_buckets_are_exact(stub_models):
+    seat_type_model, penalty_model, encoder = stub_models
+    assert LOOKUP_AGE_BUCKET == 1
+    report = accuracy_report(SeatPreferenceTables(seat_type_model, penalty_model, encoder), 4, 3, passengers=100)
+    assert report["seat_type_agreement"] == 1.0
+    assert report["penalty_max_error"] == 0.0
+
+
+def test_failed_background_build_is_retried(stub_models, monkeypatch, capsys):
+    _, penalty_model, encoder = stub_models
+    flaky = FlakyModel(penalty_model)
+    lookup = SeatPreferenceTables(None, flaky, encoder)
+    monkeypatch.setattr(lookup_tables, "LOOKUP_RETRY_SECONDS", 0.0)
+    assert lookup.tables(3, 3) is None
+    arrays = wait_for_tables(lookup, 3, 3)
+    assert arrays is not None and "penalty" in arrays
+    assert flaky.calls == 2
+    assert "Could not tabulate 3x3 (failure 1)" in capsys.readouterr().out
+
+
+def test_failed_build_waits_for_the_retry_delay(stub_models, monkeypatch):
+    _, penalty_model, encoder = stub_models
+    flaky = FlakyModel(penalty_model)
+    lookup = SeatPreferenceTables(None, flaky, encoder)
+    monkeypatch.setattr(lookup_tables, "LOOKUP_RETRY_SECONDS", 3600.0)
+    lookup.tables(3, 3)
+    assert wait_for_tables(lookup, 3, 3, timeout=1.0) is None
+    assert flaky.calls == 1
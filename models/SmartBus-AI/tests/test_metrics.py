@@ -0,0 +1,155 @@
+import os
+import pstats
+
+import pytest
+
+from src import metrics
+from src.metrics import CallbackMetric, Counter, Histogram, Registry, RequestTimer
+
+from test_api_reallocate import allocate, client  # noqa: F401  (fixture)
+
+
+def render(*collectors):
+    registry = Registry()
+    for collector in collectors:
+        registry.register(collector)
+    return registry.render()
+
+
+def test_counter_renders_one_sample_per_label_set():
+    requests = Counter("app_requests_total", "Requests.", ("endpoint", "code"))
+    requests.inc(endpoint="/allocate", code=200)
+    requests.inc(endpoint="/allocate", code=200)
+    requests.inc(2.5, endpoint="/allocate", code=429)
+    plain = Counter("app_events_total", "Events.")
+    plain.inc()
+    assert render(requests, plain) == (
+        "# HELP app_requests_total Requests.\n"
+        "# TYPE app_requests_total counter\n"
+        'app_requests_total{endpoint="/allocate",code="200"} 2\n'
+        'app_requests_total{endpoint="/allocate",code="429"} 2.5\n'
+        "# HELP app_events_total Events.\n"
+        "# TYPE app_events_total counter\n"
+        "app_events_total 1\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative_with_le_bounds():
+    latency = Histogram("app_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, stage="solve")
+    assert latency.collect() == [
+        "# HELP app_seconds Latency.",
+        "# TYPE app_seconds histogram",
+        'app_seconds_bucket{stage="solve",le="0.1"} 2',  # a value on a bound falls in its bucket
+        'app_seconds_bucket{stage="solve",le="1"} 3',
+        'app_seconds_bucket{stage="solve",le="+Inf"} 4',
+        'app_seconds_sum{stage="solve"} 3.65',
+        'app_seconds_count{stage="solve"} 4',
+    ]
+
+
+def test_callback_metric_reads_its_value_at_scrape_time():
+    depth = [3]
+    gauge = CallbackMetric("app_depth", "Depth.", lambda: depth[0])
+    labelled = CallbackMetric("app_cache_total", "Cache lookups.",
+                              lambda: [({"cache": "layout", "result": "hit"}, 4), ({"cache": "x", "result": "miss"}, None)],
+                              kind="counter")
+    broken = CallbackMetric("app_broken", "Broken.", lambda: 1 / 0)
+    depth[0] = 7
+    text = render(gauge, labelled, broken)
+    assert "app_depth 7\n" in text
+    assert '# TYPE app_cache_total counter\napp_cache_total{cache="layout",result="hit"} 4\n' in text
+    assert 'result="miss"' not in text
+    assert text.endswith("# TYPE app_broken gauge\n")
+
+
+def test_request_timer_sums_stages_and_feeds_the_stage_histogram():
+    timer = RequestTimer()
+    with timer.stage("test_fetch"):
+        pass
+    timer.add("test_solve", 0.25)
+    timer.add("test_solve", 0.5)
+    assert timer.stages["test_solve"] == 0.75
+    assert timer.server_timing().endswith("test_solve;dur=750.0")
+    assert timer.server_timing().startswith("test_fetch;dur=")
+    timer.record()
+    text = "\n".join(metrics.STAGE_SECONDS.collect())
+    assert 'smartbus_stage_seconds_count{stage="test_solve"} 1' in text
+    assert 'smartbus_stage_seconds_sum{stage="test_solve"} 0.75' in text
+
+
+def sample(metric, series):
+    """Value of one rendered series of metric (0 if absent)."""
+    values = [line.rsplit(" ", 1)[1] for line in metric.collect() if line.startswith(series + " ")]
+    return float(values[0]) if values else 0.0
+
+
+def test_record_solve_counts_runs_and_model_sizes():
+    runs = 'smartbus_solver_runs_total{engine="milp",status="Optimal"}'
+    before, variables = sample(metrics.SOLVER_RUNS, runs), sample(metrics.MILP_VARIABLES, "smartbus_milp_variables_sum")
+    metrics.record_solve({"engine": "milp", "status": "Optimal", "variables": 120, "constraints": 40})
+    metrics.record_solve({"engine": None, "status": None, "variables": None})
+    assert sample(metrics.SOLVER_RUNS, runs) == before + 1
+    assert sample(metrics.SOLVER_RUNS, 'smartbus_solver_runs_total{engine="none",status="unknown"}') >= 1
+    assert sample(metrics.MILP_VARIABLES, "smartbus_milp_variables_sum") == variables + 120
+
+
+@pytest.mark.parametrize("rate, draw, expected", [(0.0, 0.0, False), (1.0, 0.99, True), (0.1, 0.05, True),
+                                                  (0.1, 0.5, False)])
+def test_should_profile_samples_at_the_configured_rate(monkeypatch, rate, draw, expected):
+    monkeypatch.setattr(metrics, "PROFILE_SAMPLE_RATE", rate)
+    monkeypatch.setattr(metrics.random, "random", lambda: draw)
+    assert metrics.should_profile() is expected
+
+
+def test_profiled_writes_pstats_only_when_given_a_path(tmp_path):
+    with metrics.profiled(None):
+        pass
+    path = str(tmp_path / "run.prof")
+    with metrics.profiled(path):
+        sum(range(1000))
+    assert pstats.Stats(path).total_calls > 0
+
+
+def test_profiled_request_is_a_no_op_when_disabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path / "profiles"))
+    with metrics.profiled_request("allocate", False):
+        pass
+    monkeypatch.setattr(metrics, "_AsyncProfiler", None)  # pyinstrument not installed
+    with metrics.profiled_request("allocate", True):
+        pass
+    assert not os.path.exists(tmp_path / "profiles")
+
+
+def test_profiled_request_writes_an_html_profile(tmp_path, monkeypatch):
+    pytest.importorskip("pyinstrument")
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+    with metrics.profiled_request("allocate", True):
+        sum(range(1000))
+    names = os.listdir(tmp_path)
+    assert len(names) == 1 and "-allocate-" in names[0] and names[0].endswith(".html")
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_server_timing_header_follows_the_toggle(client, monkeypatch, enabled):  # noqa: F811
+    client, _ = client
+    monkeypatch.setattr(metrics, "METRICS_TIMING_HEADERS", enabled)
+    resp = client.post("/allocate", json={"tripId": "t1", "vehicle": {"rows": 6, "columns": 4}, "mode": "heuristic",
+                                          "passengers": [{"id": "p0", "age": 30, "gender": "male",
+                                                          "disability": "None", "pickupStopId": 0, "dropStopId": 3}]})
+    assert resp.status_code == 200, resp.text
+    assert ("Server-Timing" in resp.headers) is enabled
+    if enabled:
+        assert "solver_call;dur=" in resp.headers["Server-Timing"]
+
+
+def test_sampled_request_profiles_its_solve(client, monkeypatch, tmp_path):  # noqa: F811
+    client, _ = client
+    monkeypatch.setattr(metrics, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path / "profiles"))
+    allocate(client)
+    solve_profiles = [name for name in os.listdir(tmp_path / "profiles") if "-solve-" in name]
+    assert len(solve_profiles) == 1 and solve_profiles[0].endswith(".prof")
+    text = client.get("/metrics").text
+    assert 'smartbus_requests_total{endpoint="/allocate",code="200"}' in text
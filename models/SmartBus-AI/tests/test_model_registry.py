@@ -0,0 +1,132 @@
+import os
+import json
+import asyncio
+import threading
+
+import pytest
+
+from src import model_registry
+from src.model_registry import ModelRegistry
+from src.solver_pool import SolverPool
+
+
+def publish(models_dir, version, corrupt=False):
+    """A version directory named in CURRENT; corrupt writes an unreadable model file."""
+    directory = os.path.join(models_dir, "versions", version)
+    os.makedirs(directory)
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump({"version": version, "mode": "full"}, f)
+    if corrupt:
+        with open(os.path.join(directory, "seat_type_model.pkl"), "wb") as f:
+            f.write(b"not a pickle")
+    with open(os.path.join(models_dir, "CURRENT"), "w") as f:
+        f.write(version)
+    return version, directory
+
+
+def loaded_versions(_):
+    from src import solver_pool
+    return list(solver_pool._model_sets)
+
+
+def test_check_swaps_in_a_new_version(tmp_path):
+    swapped = []
+    registry = ModelRegistry(str(tmp_path), interval=0, on_swap=lambda model_set: swapped.append(model_set.version))
+    publish(str(tmp_path), "v1")
+    assert registry.current().version == "v1"
+    assert not registry.check()
+
+    publish(str(tmp_path), "v2")
+    assert registry.check()
+    assert registry.current().version == "v2"
+    assert swapped == ["v1", "v2"]
+    assert registry.stats()["reloads"] == 1
+
+
+def test_failed_load_keeps_the_active_version(tmp_path):
+    registry = ModelRegistry(str(tmp_path), interval=0)
+    publish(str(tmp_path), "v1")
+    registry.current()
+
+    publish(str(tmp_path), "v2", corrupt=True)
+    assert not registry.check()
+    assert registry.current().version == "v1"
+    stats = registry.stats()
+    assert stats["reloadFailures"] == 1 and stats["lastError"].startswith("v2:")
+    # not retried until another version is published
+    assert not registry.check() and registry.failures == 1
+
+    publish(str(tmp_path), "v3")
+    assert registry.check() and registry.current().version == "v3"
+
+
+def test_previous_version_is_served_while_the_next_loads(tmp_path, monkeypatch):
+    registry = ModelRegistry(str(tmp_path), interval=0)
+    publish(str(tmp_path), "v1")
+    registry.current()
+
+    loading, release = threading.Event(), threading.Event()
+    load = model_registry.load_global_models
+
+    def slow_load(directory):
+        loading.set()
+        release.wait(10)
+        return load(directory)
+
+    monkeypatch.setattr(model_registry, "load_global_models", slow_load)
+    publish(str(tmp_path), "v2")
+    watcher = threading.Thread(target=registry.check)
+    watcher.start()
+    try:
+        assert loading.wait(10)
+        assert registry.current().version == "v1"
+    finally:
+        release.set()
+        watcher.join(10)
+    assert registry.current().version == "v2"
+
+
+def test_manifest_only_registry_swaps_after_preload(tmp_path):
+    preloaded = []
+    registry = ModelRegistry(str(tmp_path), interval=0, load_models=False,
+                             preload=lambda model_set: preloaded.append(model_set.ref))
+    publish(str(tmp_path), "v1")
+    active = registry.current()
+    assert active.models is None and active.manifest["version"] == "v1"
+    assert active.info()["seat_type"] is False
+    assert preloaded == []  # workers load the first version when they start
+
+    ref = publish(str(tmp_path), "v2")
+    assert registry.check()
+    assert preloaded == [ref]
+
+
+def test_failed_preload_keeps_the_active_version(tmp_path):
+    def preload(model_set):
+        raise RuntimeError("worker could not load it")
+
+    registry = ModelRegistry(str(tmp_path), interval=0, load_models=False, preload=preload)
+    publish(str(tmp_path), "v1")
+    registry.current()
+    publish(str(tmp_path), "v2")
+    assert not registry.check()
+    assert registry.current().version == "v1"
+    assert "worker could not load it" in registry.last_error
+
+
+def test_pool_preloads_a_version_in_its_workers(tmp_path):
+    models_dir = str(tmp_path)
+    publish(models_dir, "v1")
+    pool = SolverPool(workers=1, max_pending=0, models_dir=models_dir)
+    try:
+        pool.warm_up()
+        ref = publish(models_dir, "v2")
+        pool.preload(ref)
+        assert asyncio.run(pool.solve(None, fn=loaded_versions)) == ["v1", "v2"]
+
+        with pytest.raises(RuntimeError, match="could not load models v3"):
+            pool.preload(publish(models_dir, "v3", corrupt=True))
+        # the worker still serves the versions it holds
+        assert asyncio.run(pool.solve(None, fn=loaded_versions)) == ["v1", "v2"]
+    finally:
+        pool.shutdown()
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from src.personalization_store import PersonalizationStore
+
+
+def records(n, start=0, keyed=True, seed=0):
+    rng = np.random.default_rng(seed + start)
+    out = []
+    for i in range(start, start + n):
+        rec = {"norm_row": float(rng.random()), "norm_col": float(rng.random()), "feedback_score": float(rng.normal())}
+        if keyed:
+            rec.update({"id": f"h{i:03d}", "createdAt": f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}Z"})
+        out.append(rec)
+    return out
+
+
+def assert_fits(model, history):
+    X = np.array([[r["norm_row"], r["norm_col"]] for r in history])
+    y = np.array([r["feedback_score"] for r in history])
+    reference = LinearRegression().fit(X, y)
+    np.testing.assert_allclose(model.coef_, reference.coef_, atol=1e-9)
+    assert model.intercept_ == pytest.approx(reference.intercept_, abs=1e-9)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PersonalizationStore(str(tmp_path / "personal.sqlite"))
+    yield store
+    store.close()
+
+
+def test_sliding_window_folds_only_unseen_records(store):
+    history = records(12)
+    store.sync({"p": history[:8]})
+    # the backend now serves the latest 8 records: same length, four of them new
+    model = store.sync({"p": history[4:]})["p"]
+    assert_fits(model, history)
+    # the same window again changes nothing
+    assert_fits(store.sync({"p": history[4:]})["p"], history)
+
+
+def test_records_without_keys_are_taken_as_append_only(store):
+    history = records(10, keyed=False)
+    store.sync({"p": history[:5]})
+    assert_fits(store.sync({"p": history})["p"], history)
+    assert_fits(store.sync({"p": history[:4]})["p"], history[:4])  # shrank: rebuilt
+
+
+def test_models_survive_reopening(tmp_path):
+    path = str(tmp_path / "personal.sqlite")
+    history = records(6)
+    first = PersonalizationStore(path)
+    first.sync({"p": history})
+    first.close()
+    second = PersonalizationStore(path)
+    try:
+        assert_fits(second.models(["p"])["p"], history)
+        assert_fits(second.sync({"p": history + records(3, start=6)})["p"], history + records(3, start=6))
+    finally:
+        second.close()
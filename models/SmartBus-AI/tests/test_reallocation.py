@@ -0,0 +1,89 @@
+import pytest
+
+from helpers import assert_valid_seating
+from src.allocator import allocate_seating
+from src.benchmark import generate_scenario, make_stub_models
+from src.integrated_seat_ml_model import Passenger, get_bus_layout
+from src.reallocation import reallocate_seating
+
+
+@pytest.fixture(scope="module")
+def full_coach():
+    passengers, bus = generate_scenario(15, 4, "pairs", "standard", 1, load=1.0, seed=0)
+    details, _ = allocate_seating(passengers, bus, mode="heuristic", time_limit=5)
+    assert len(details) == len(passengers) == len(bus.seats)
+    return passengers, bus, {pid: d["seat_id"] for pid, d in details.items()}
+
+
+def swap_one_solo(passengers):
+    gone = next(p for p in passengers if not p.group_id)
+    late = Passenger("late", age=gone.age, gender=gone.gender, disability=gone.disability,
+                     source_stop=gone.source_stop, dest_stop=gone.dest_stop)
+    return [p for p in passengers if p.id != gone.id] + [late], gone
+
+
+def seats(details):
+    return {pid: d["seat_id"] for pid, d in details.items()}
+
+
+def test_fixed_add_and_remove_on_a_full_coach_moves_nobody(full_coach):
+    passengers, bus, previous = full_coach
+    after, gone = swap_one_solo(passengers)
+    details, info = reallocate_seating(after, bus, previous)
+    chosen = seats(details)
+    assert_valid_seating(after, bus, chosen)
+    assert info["moved"] == [] and info["escalation"] is None
+    assert info["engine"] == "insertion" and info["reoptimized"] == 1
+    assert chosen["late"] == previous[gone.id]
+    assert all(chosen[p.id] == previous[p.id] for p in after if p.id != "late")
+
+
+def test_single_passenger_change_takes_milliseconds(full_coach):
+    passengers, bus, previous = full_coach
+    seat_type_model, penalty_model, encoder = make_stub_models()
+    after, _ = swap_one_solo(passengers)
+    timings = []
+    for _ in range(3):
+        _, info = reallocate_seating(after, bus, previous, seat_type_model, penalty_model,
+                                     disability_encoder=encoder)
+        timings.append(info["wall_time_ms"])
+    # "tens of milliseconds" on a full 60-seat coach, with slack for slow runners
+    assert min(timings) < 100.0
+
+
+def small_bus():
+    # row 1 accessible (1A, 1B), row 2 general, row 3 female-only
+    return get_bus_layout(3, 2, accessibility_rows=1, aisle_after=2, gender_zones={"female": [2]})
+
+
+def test_blocking_neighbour_moves_for_a_wheelchair_user():
+    bus = small_bus()
+    passengers = [Passenger("s1", age=70), Passenger("s2", age=70), Passenger("m1")]
+    previous = {"s1": "1A", "s2": "1B", "m1": "2A"}
+    wheelchair = Passenger("w", disability="Wheelchair")
+    details, info = reallocate_seating(passengers + [wheelchair], bus, previous)
+    chosen = seats(details)
+    assert_valid_seating(passengers + [wheelchair], bus, chosen)
+    assert info["escalation"] == "neighbours"
+    assert len(info["moved"]) == 1 and chosen[info["moved"][0]] == "2B"
+
+
+def test_escalates_to_the_preferred_policy_when_no_neighbour_can_move():
+    bus = small_bus()
+    # the only free seat is female-only 3B: a (male) senior can only leave the
+    # accessible row if f1 moves from 2A to 3B first, a chain no neighbour move finds
+    passengers = [Passenger("s1", age=70), Passenger("s2", age=70), Passenger("m1"),
+                  Passenger("f1", gender="Female"), Passenger("f2", gender="Female")]
+    previous = {"s1": "1A", "s2": "1B", "f1": "2A", "m1": "2B", "f2": "3A"}
+    wheelchair = Passenger("w", disability="Wheelchair")
+    fixed_details, fixed_info = reallocate_seating(passengers + [wheelchair], bus, previous)
+    preferred_details, preferred_info = reallocate_seating(passengers + [wheelchair], bus, previous, keep="preferred")
+    for details in (fixed_details, preferred_details):
+        assert_valid_seating(passengers + [wheelchair], bus, seats(details))
+    assert fixed_info["escalation"] == "full"
+    assert preferred_info["escalation"] is None
+    for info, details in ((fixed_info, fixed_details), (preferred_info, preferred_details)):
+        # the stay bonus keeps the moves to the chain the wheelchair user needs
+        assert "f1" in info["moved"] and len(info["moved"]) == 2
+        assert seats(details)["f1"] == "3B"
+        assert info["reoptimized"] == len(passengers) + 1
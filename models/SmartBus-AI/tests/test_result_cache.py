@@ -0,0 +1,27 @@
+from src.benchmark import LAYOUT_KWARGS, generate_scenario
+from src.result_cache import ResultCache, problem_fingerprint
+from src.solver_pool import solver_config
+
+LAYOUT = {"rows": 6, "cols": 4, **LAYOUT_KWARGS}
+
+
+def test_fingerprint_ignores_order_but_not_solver_config():
+    passengers, _ = generate_scenario(6, 4, "pairs", "standard", 2, seed=0)
+    config = solver_config()
+    key, layout_key = problem_fingerprint(passengers, LAYOUT, config=config)
+    assert problem_fingerprint(passengers[::-1], LAYOUT, config=config) == (key, layout_key)
+    for setting, value in [("backend", "highs"), ("symmetry", not config["symmetry"]), ("ageBucket", 5),
+                           ("compiledModels", not config["compiledModels"]),
+                           ("lookupTables", not config["lookupTables"])]:
+        assert problem_fingerprint(passengers, LAYOUT, config={**config, setting: value})[0] != key, setting
+
+
+def test_near_matches_across_modes():
+    passengers, _ = generate_scenario(6, 4, "pairs", "standard", 2, seed=0)
+    cache = ResultCache(maxsize=4, path="")
+    key, layout_key = problem_fingerprint(passengers, LAYOUT, mode="heuristic")
+    seats = {p.id: f"s{i}" for i, p in enumerate(passengers)}
+    cache.put(key, layout_key, seats, {"engine": "heuristic"})
+    exact_key, _ = problem_fingerprint(passengers, LAYOUT, mode="exact")
+    assert cache.peek(exact_key) is None
+    assert cache.near(layout_key, [p.id for p in passengers]) == seats
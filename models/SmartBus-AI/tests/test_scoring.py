@@ -0,0 +1,103 @@
+import copy
+
+import numpy as np
+import pytest
+
+from src.benchmark import make_stub_models
+from src.integrated_seat_ml_model import Passenger, get_bus_layout
+from src.personalization_store import PersonalModel
+from src.scoring import SEAT_TYPE_BONUS, score_problem, score_problems
+from src.utils import get_seat_type, group_passengers
+
+
+@pytest.fixture(scope="module")
+def stub_models():
+    return make_stub_models()
+
+
+def mixed_trip():
+    """A trio, a pair with a wheelchair user, solo riders with other disabilities, on a 4x2 bus."""
+    bus = get_bus_layout(4, 2, accessibility_rows=1, gender_zones={"female": [3]})
+    passengers = [
+        Passenger("a1", age=40, group_id="family", gender="Female"),
+        Passenger("a2", age=9, group_id="family"),
+        Passenger("a3", age=70, group_id="family", disability="Hearing Impairment"),
+        Passenger("b1", age=33, group_id="pair", disability="Wheelchair", source_stop=2),
+        Passenger("b2", age=61, group_id="pair", gender="Female", source_stop=2),
+        Passenger("c1", age=25, gender="Female", disability="Visual Impairment", dest_stop=4),
+        Passenger("c2", age=52, disability="Other", source_stop=4),
+    ]
+    return passengers, bus
+
+
+def onehot(p, encoder):
+    return list(encoder.transform([[p.disability]]).toarray()[0])
+
+
+def norm(seat, bus):
+    return (seat.row / (bus.rows - 1) if bus.rows > 1 else 0.0,
+            seat.col / (bus.cols - 1) if bus.cols > 1 else 0.0)
+
+
+def per_pair_scores(passengers, bus, seat_type_model, penalty_model, personal_models, encoder):
+    """The objective terms one model call at a time, as the optimizer used to build them."""
+    seat_bonus = np.zeros((len(passengers), len(bus.seats)))
+    for i, p in enumerate(passengers):
+        for j, s in enumerate(bus.seats):
+            nr, nc = norm(s, bus)
+            vec = [int(p.is_disabled or p.age >= 60), int(str(p.gender).lower() == "female"),
+                   int(p.group_id is not None), p.age, nr, nc] + onehot(p, encoder)
+            probs = seat_type_model.predict_proba([vec])[0]
+            if seat_type_model.classes_[int(np.argmax(probs))] == get_seat_type(s, bus):
+                seat_bonus[i, j] += 50.0
+            personal_model = personal_models.get(p.id)
+            if personal_model:
+                seat_bonus[i, j] += max(0.0, float(personal_model.predict([[nr, nc]])[0]) - 3.0) * 100.0
+
+    max_dist = (bus.rows - 1) + (bus.cols - 1)
+    tables = {}
+    for group in group_passengers(passengers).values():
+        for p in group[:-1]:
+            table = np.zeros((len(bus.seats), max_dist + 1))
+            for j, s in enumerate(bus.seats):
+                nr, nc = norm(s, bus)
+                for dist in range(2, max_dist + 1):
+                    features = [int(p.is_disabled or p.age >= 60), int(str(p.gender).lower() == "female"), 1,
+                                p.age, nr, nc, dist] + onehot(p, encoder)
+                    table[j, dist] = max(0.0, 5.0 - float(penalty_model.predict([features])[0]))
+            tables[p.id] = table
+    return seat_bonus, tables
+
+
+def test_batched_scores_match_per_pair_reference(stub_models):
+    seat_type_model, penalty_model, encoder = stub_models
+    passengers, bus = mixed_trip()
+    personal_models = {"a1": PersonalModel([2.0, -1.0], 3.5), "b2": PersonalModel([-1.5, 2.0], 2.0),
+                       "c1": PersonalModel([0.5, 0.5], 1.0)}
+
+    scores = score_problem(passengers, bus, seat_type_model, penalty_model, personal_models, encoder)
+    seat_bonus, tables = per_pair_scores(passengers, bus, seat_type_model, penalty_model, personal_models, encoder)
+
+    assert (seat_bonus > SEAT_TYPE_BONUS).any() and (seat_bonus == SEAT_TYPE_BONUS).any()
+    assert np.allclose(scores.seat_bonus, seat_bonus)
+    assert set(scores.penalty_tables) == set(tables)
+    for pid, table in tables.items():
+        assert np.allclose(scores.penalty_tables[pid], table)
+
+
+def test_pooled_trips_keep_per_trip_penalty_tables(stub_models):
+    seat_type_model, penalty_model, encoder = stub_models
+    passengers, bus = mixed_trip()
+    # the same passenger ids on a second trip, with different profiles
+    other = copy.deepcopy(passengers)
+    for p in other:
+        p.age = 90 - p.age
+
+    pooled = score_problems([(passengers, bus), (other, bus)], seat_type_model, penalty_model, None, encoder)
+    for trip, scores in zip((passengers, other), pooled):
+        alone = score_problem(trip, bus, seat_type_model, penalty_model, None, encoder)
+        assert set(scores.penalty_tables) == set(alone.penalty_tables)
+        for pid, table in alone.penalty_tables.items():
+            assert np.allclose(scores.penalty_tables[pid], table)
+    assert any(not np.allclose(pooled[0].penalty_tables[pid], pooled[1].penalty_tables[pid])
+               for pid in pooled[0].penalty_tables)
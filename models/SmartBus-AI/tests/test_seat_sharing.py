@@ -0,0 +1,29 @@
+import pytest
+
+from helpers import assert_valid_seating, best_seating_value, tiny_trip
+from src.benchmark import make_stub_models
+from src.heuristic_allocator import SeatingObjective
+from src.integrated_seat_ml_model import optimize_seating_with_ml
+from src.scoring import score_problem
+
+
+@pytest.fixture(scope="module")
+def models():
+    return make_stub_models()
+
+
+@pytest.mark.parametrize("cohesion", ["pairwise", "compact"])
+@pytest.mark.parametrize("ml", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_clique_constraints_reach_the_exhaustive_optimum(seed, ml, cohesion, models):
+    passengers, bus = tiny_trip(seed)
+    seat_type_model, penalty_model, encoder = models if ml else (None, None, None)
+    scores = score_problem(passengers, bus, seat_type_model, penalty_model, None, encoder)
+    info = {}
+    details = optimize_seating_with_ml(passengers, bus, cohesion=cohesion, scores=scores, solve_info=info)
+    assert info["status"] == "Optimal"
+    assert_valid_seating(passengers, bus, {pid: d["seat_id"] for pid, d in details.items()})
+    reference = best_seating_value(passengers, bus, SeatingObjective(passengers, bus, scores, cohesion))
+    assert info["objective"] == pytest.approx(reference, rel=1e-9, abs=1e-6)
+    # seats are reused along the route
+    assert len(passengers) > len(bus.seats)
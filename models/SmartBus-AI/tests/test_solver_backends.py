@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pytest
+
+from src import solver_backends
+from src.solver_backends import (MILPBuilder, MILPResult, solve_milp, start_is_feasible, _solve_cbc, _solve_cpsat,
+                                 _solve_highspy, _solve_scipy_highs, _solver_stdout_to_stderr)
+from src.benchmark import generate_scenario
+from src.scoring import ProblemScores
+from src.integrated_seat_ml_model import optimize_seating_with_ml
+
+# (name, solve function, library it needs)
+SOLVERS = [
+    ("cbc", _solve_cbc, "pulp"),
+    ("highspy", _solve_highspy, "highspy"),
+    ("scipy", _solve_scipy_highs, "scipy.optimize"),
+    ("cpsat", _solve_cpsat, "ortools.sat.python.cp_model"),
+]
+
+def assignment_problem(n=6, m=8, seed=0):
+    """
+    n items into m slots with integer values, at most one item per slot,
+    plus a side row limiting items in the first half of the slots.
+    """
+    rng = np.random.default_rng(seed)
+    builder = MILPBuilder()
+    x = builder.add_vars(n * m, cost=rng.integers(0, 20, n * m)).reshape(n, m)
+    builder.add_rows(x, 1, lower=1, upper=1)
+    builder.add_rows(x.T, 1, upper=1)
+    builder.add_rows(x[:, : m // 2].reshape(1, -1), 1, upper=2)
+    return builder.build()
+
+@pytest.fixture(params=SOLVERS, ids=[name for name, _, _ in SOLVERS])
+def solver(request):
+    name, solve, module = request.param
+    pytest.importorskip(module)
+    return solve
+
+@pytest.mark.parametrize("seed", range(3))
+def test_backend_matches_cbc_objective(solver, seed):
+    problem = assignment_problem(seed=seed)
+    reference = _solve_cbc(problem, None, 1, None, None, False)
+    result = solver(problem, None, 1, None, None, False)
+    assert result.status == "Optimal" and result.optimal
+    assert start_is_feasible(problem, result.x)
+    assert problem.c @ result.x == pytest.approx(problem.c @ reference.x)
+
+def test_backend_lp_relaxation_matches_cbc(solver):
+    if solver is _solve_cpsat:
+        pytest.skip("cpsat hands LP relaxations to highs/cbc")
+    problem = assignment_problem(seed=1)
+    reference = _solve_cbc(problem, None, 1, None, None, True)
+    result = solver(problem, None, 1, None, None, True)
+    assert problem.c @ result.x == pytest.approx(problem.c @ reference.x)
+
+def test_backend_reports_infeasible(solver):
+    builder = MILPBuilder()
+    x = builder.add_vars(2)
+    builder.add_rows([x], 1, lower=3)
+    result = solver(builder.build(), None, 1, None, None, False)
+    assert result.status == "Infeasible" and not result.feasible
+
+@pytest.mark.parametrize("backend", solver_backends.MILP_BACKENDS)
+@pytest.mark.parametrize("cohesion", ["pairwise", "compact"])
+def test_seat_model_parity_per_backend(backend, cohesion):
+    if backend not in solver_backends.available_backends():
+        pytest.skip(f"{backend} not installed")
+    passengers, bus = generate_scenario(6, 4, "pairs", "standard", 3, seed=2)
+    rng = np.random.default_rng(0)
+    scores = ProblemScores(rng.integers(0, 50, (len(passengers), len(bus.seats))).astype(float))
+    objectives = {}
+    for name in ("cbc", backend):
+        info = {}
+        optimize_seating_with_ml(passengers, bus, cohesion=cohesion, scores=scores, solve_info=info, backend=name)
+        assert info["status"] == "Optimal"
+        objectives[name] = info["objective"]
+    assert objectives[backend] == pytest.approx(objectives["cbc"])
+
+def test_default_backend_is_cbc():
+    assert solver_backends.MILP_BACKEND == os.getenv("MILP_BACKEND", "cbc")
+
+def test_feasible_warm_start_is_the_incumbent_when_solver_stops(monkeypatch):
+    problem = assignment_problem(seed=0)
+    start = _solve_cbc(problem, None, 1, None, None, False).x
+    monkeypatch.setattr(solver_backends, "resolve_backend",
+                        lambda backend, relax: (backend, lambda *args: MILPResult("TimeLimit")))
+    result = solve_milp(problem, backend="highs", time_limit=1, warm_start=start)
+    assert result.status == "Feasible" and not result.optimal
+    assert np.array_equal(result.x, start)
+
+    infeasible_start = np.zeros(problem.num_vars)
+    assert not start_is_feasible(problem, infeasible_start)
+    assert solve_milp(problem, backend="highs", time_limit=1, warm_start=infeasible_start).status == "TimeLimit"
+
+def test_solver_output_goes_to_stderr(capfd):
+    with _solver_stdout_to_stderr():
+        os.write(1, b"solver noise\n")
+    print("after", flush=True)
+    captured = capfd.readouterr()
+    assert "solver noise" in captured.err
+    assert captured.out == "after\n"
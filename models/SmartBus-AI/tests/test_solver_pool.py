@@ -0,0 +1,57 @@
+import os
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from src.solver_pool import SolverPool
+
+
+def crash_once(marker):
+    """Kills its worker the first time it runs for marker, then returns its pid."""
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return os.getpid()
+
+
+def always_crash(_):
+    os._exit(1)
+
+
+def pid(_):
+    return os.getpid()
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SolverPool(workers=1, max_pending=0, models_dir=str(tmp_path))
+    yield pool
+    pool.shutdown()
+
+
+def test_job_is_retried_on_a_new_pool_after_its_worker_died(pool, tmp_path):
+    async def scenario():
+        return await pool.solve(str(tmp_path / "crashed"), fn=crash_once)
+
+    assert asyncio.run(scenario()) != os.getpid()
+    assert pool.stats()["restarts"] == 1
+
+
+def test_job_that_always_kills_its_worker_fails_alone(pool):
+    async def scenario():
+        with pytest.raises(BrokenProcessPool):
+            await pool.solve(None, fn=always_crash)
+        return await pool.solve(None, fn=pid)
+
+    assert asyncio.run(scenario()) != os.getpid()
+    assert pool.stats()["restarts"] == 2
+
+
+def test_jobs_failing_together_replace_the_pool_once(pool, tmp_path):
+    async def scenario():
+        return await asyncio.gather(pool.solve(str(tmp_path / "crashed"), fn=crash_once),
+                                    pool.solve(None, fn=pid))
+
+    assert len(set(asyncio.run(scenario()))) == 1
+    assert pool.stats()["restarts"] == 1
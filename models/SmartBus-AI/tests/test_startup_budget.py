@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from src.startup_budget import DEFAULT_BUDGETS, DEFERRED, measure_import
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", sorted(DEFAULT_BUDGETS))
+def test_import_defers_heavy_libraries(module):
+    _, packages = measure_import(module, cwd=ROOT)
+    assert not set(packages) & set(DEFERRED)
+
+
+@pytest.mark.parametrize("module", sorted(DEFAULT_BUDGETS))
+def test_import_fits_its_budget(module):
+    # best of three fresh interpreters, like python -m src.startup_budget
+    seconds = min(measure_import(module, cwd=ROOT)[0] for _ in range(3))
+    assert seconds <= DEFAULT_BUDGETS[module]
@@ -0,0 +1,62 @@
+
+from src import train_global_models as tgm
+from src.train_global_models import (advance_boundary, build_disability_encoder, iter_feedback_chunks, new_version_dir,
+                                     unseen_records)
+
+
+def row(rid=None, ts=None, score=3.0):
+    features = {"is_priority": 0, "is_female": 0, "is_in_group": 0, "age": 30, "norm_row": 0.5, "norm_col": 0.5,
+                "group_distance": 0, "disability": "None"}
+    if rid is not None:
+        features["id"] = rid
+    if ts is not None:
+        features["timestamp"] = ts
+    return [features, score]
+
+
+def serve(monkeypatch, pages):
+    def fake(since=None, page_size=None):
+        for page in pages:
+            yield {"seattype": [], "penalty": [], "watermark": None, "nextCursor": None, **page}
+    monkeypatch.setattr(tgm, "iter_training_feedback", fake)
+
+
+def test_boundary_keeps_newest_timestamp_and_its_ids():
+    records = [row("a", "2026-10-01T10:00:00Z"), row("b", "2026-10-02T08:00:00Z"), row("c", "2026-10-02T08:00:00Z")]
+    assert advance_boundary(None, records) == {"timestamp": "2026-10-02T08:00:00Z", "ids": ["b", "c"]}
+    assert advance_boundary({"timestamp": "2026-10-03T00:00:00Z", "ids": ["z"]}, records)["ids"] == ["z"]
+
+
+def test_rows_already_trained_on_are_dropped():
+    boundary = {"timestamp": "2026-10-02T08:00:00Z", "ids": ["b"]}
+    records = [row("a", "2026-10-01T10:00:00Z"), row("b", "2026-10-02T08:00:00Z"), row("c", "2026-10-02T08:00:00Z"),
+               row("d", "2026-10-02T09:00:00Z"), row("e")]
+    assert [r[0]["id"] for r in unseen_records(records, boundary)] == ["c", "d", "e"]
+
+
+def test_backend_without_watermark_or_cursor_is_not_incremental(monkeypatch):
+    boundary = {"timestamp": "2026-10-02T08:00:00Z", "ids": ["a"]}
+    serve(monkeypatch, [{"penalty": [row("a", "2026-10-02T08:00:00Z"), row("b", "2026-10-01T00:00:00Z")]}])
+    watermark = {"since": "2026-10-17", "boundary": boundary}
+    chunks = list(iter_feedback_chunks("2026-10-02", build_disability_encoder(), watermark=watermark))
+    assert watermark["incremental"] is False
+    assert [len(X) for _, X, _ in chunks] == [2]  # the whole history, nothing deduplicated
+    assert watermark["boundary"] == boundary
+
+
+def test_incremental_backend_skips_rows_at_the_old_boundary(monkeypatch):
+    serve(monkeypatch, [{"penalty": [row("a", "2026-10-02T08:00:00Z"), row("b", "2026-10-02T09:00:00Z")],
+                         "watermark": "2026-10-02", "nextCursor": "p2"},
+                        {"penalty": [row("c", "2026-10-03T07:00:00Z")]}])
+    watermark = {"since": "2026-10-17", "boundary": {"timestamp": "2026-10-02T08:00:00Z", "ids": ["a"]}}
+    chunks = list(iter_feedback_chunks("2026-10-02", build_disability_encoder(), watermark=watermark))
+    assert watermark["incremental"] is True
+    assert [len(X) for _, X, _ in chunks] == [1, 1]
+    assert watermark["since"] == "2026-10-02"
+    assert watermark["boundary"] == {"timestamp": "2026-10-03T07:00:00Z", "ids": ["c"]}
+
+
+def test_version_dirs_are_unique(tmp_path):
+    versions = [new_version_dir(str(tmp_path))[0] for _ in range(50)]
+    assert len(set(versions)) == 50
+    assert sorted(versions) == versions